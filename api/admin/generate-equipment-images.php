@@ -15,6 +15,7 @@ header('Content-Type: application/json');
 
 require_once __DIR__ . '/../../app/core/database.php';
 require_once __DIR__ . '/../../app/core/security.php';
+require_once __DIR__ . '/../../app/core/equipment-images.php';
 
 // Initialize security
 Security::init();
@@ -272,8 +273,7 @@ try {
         };
         
         // Create safe filename
-        $safeFilename = preg_replace('/[^a-zA-Z0-9_-]/', '_', strtolower($item['name']));
-        $filename = "equipment_{$item['item_id']}_{$safeFilename}.png";
+        $filename = equipmentImageFilename($item['item_id'], $item['name']);
         $uploadDir = __DIR__ . "/../../public/images/equipment/{$subdir}/";
         $fullPath = $uploadDir . $filename;
         $dbPath = "images/equipment/{$subdir}/{$filename}";
@@ -301,7 +301,7 @@ try {
                 chmod($fullPath, 0644);
                 
                 // Update database
-                $updateQuery = "UPDATE items SET image_url = :image_url WHERE item_id = :item_id";
+                $updateQuery = "UPDATE items SET image_url = :image_url, image_variants = NULL WHERE item_id = :item_id";
                 $updateStmt = $db->prepare($updateQuery);
                 $updateStmt->bindParam(':image_url', $dbPath);
                 $updateStmt->bindParam(':item_id', $item['item_id'], PDO::PARAM_INT);
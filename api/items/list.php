@@ -57,6 +57,7 @@ try {
             item_id,
             name,
             image_url,
+            image_variants,
             description,
             weight_cn,
             cost_gp,
@@ -152,6 +153,7 @@ try {
             'item_id' => (int)$item['item_id'],
             'name' => $item['name'],
             'image_url' => $item['image_url'],
+            'image_variants' => $item['image_variants'] ? json_decode($item['image_variants'], true) : null,
             'description' => $item['description'],
             'weight_cn' => (int)$item['weight_cn'],
             'cost_gp' => (float)$item['cost_gp'],
@@ -43,7 +43,7 @@ try {
     $imageUrl = trim($input['image_url']);
     
     // Update item image
-    $query = "UPDATE items SET image_url = :image_url WHERE item_id = :item_id";
+    $query = "UPDATE items SET image_url = :image_url, image_variants = NULL WHERE item_id = :item_id";
     $stmt = $db->prepare($query);
     $stmt->bindParam(':image_url', $imageUrl);
     $stmt->bindParam(':item_id', $itemId, PDO::PARAM_INT);
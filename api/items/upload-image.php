@@ -78,7 +78,7 @@ try {
             $database = Database::getInstance();
             $db = $database->getConnection();
             
-            $query = "UPDATE items SET image_url = :image_url WHERE item_id = :item_id";
+            $query = "UPDATE items SET image_url = :image_url, image_variants = NULL WHERE item_id = :item_id";
             $stmt = $db->prepare($query);
             $stmt->bindParam(':image_url', $dbPath);
             $stmt->bindParam(':item_id', $itemId, PDO::PARAM_INT);
@@ -173,7 +173,7 @@ try {
             $database = Database::getInstance();
             $db = $database->getConnection();
             
-            $query = "UPDATE items SET image_url = :image_url WHERE item_id = :item_id";
+            $query = "UPDATE items SET image_url = :image_url, image_variants = NULL WHERE item_id = :item_id";
             $stmt = $db->prepare($query);
             $stmt->bindParam(':image_url', $dbPath);
             $stmt->bindParam(':item_id', $itemId, PDO::PARAM_INT);
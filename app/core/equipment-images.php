@@ -0,0 +1,24 @@
+<?php
+/**
+ * BECMI D&D Character Manager - Equipment Image Naming
+ * 
+ * Canonical filename scheme for generated equipment images. Must stay in
+ * sync with sanitize_filename() in equipment_images/files.py.
+ */
+
+/**
+ * Lowercase a name and collapse every run of other characters to one underscore
+ * e.g. "Rock, Thrown" -> "rock_thrown", "Rations (1 week)" -> "rations_1_week"
+ */
+function sanitizeImageName($name) {
+    return trim(preg_replace('/[^a-z0-9]+/', '_', strtolower($name)), '_');
+}
+
+/**
+ * Filename of an item's generated image
+ */
+function equipmentImageFilename($itemId, $name) {
+    return "equipment_{$itemId}_" . sanitizeImageName($name) . ".png";
+}
+
+?>
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+BECMI VTT Equipment Image Generator - Offline Benchmark
+Runs the real generation pipeline against a local mock of the Together AI
+images endpoint and a throwaway SQLite catalog, so throughput, peak memory
+and tail latency can be compared between changes without network or MySQL.
+
+Usage:
+    python benchmark_equipment_images.py                          # default matrix
+    python benchmark_equipment_images.py --sizes 100,500 --workers 1,8,32
+    python benchmark_equipment_images.py --latency 2 --error-rate 0.05 --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import sqlite3
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Defaults for the benchmark matrix and the mock API
+DEFAULT_SIZES = (50, 200)
+DEFAULT_WORKER_COUNTS = (1, 4, 16)
+DEFAULT_LATENCY = 0.5  # seconds per mock generation
+DEFAULT_JITTER = 0.5  # latency varies by up to this fraction either way
+DEFAULT_PAYLOAD_KB = 1024  # decoded image size returned by the mock
+DEFAULT_ERROR_RATE = 0.0  # fraction of requests answered with 429
+DEFAULT_RETRY_AFTER = 1  # seconds, sent with each mock 429
+DEFAULT_RATE = 50  # requests per second the pipeline may start from
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+ITEMS_SCHEMA = """
+    CREATE TABLE items (
+        item_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        item_type TEXT,
+        item_category TEXT,
+        weapon_type TEXT,
+        armor_type TEXT,
+        size_category TEXT,
+        base_item_id INTEGER,
+        is_magical INTEGER DEFAULT 0,
+        magical_bonus INTEGER DEFAULT 0,
+        magical_properties TEXT,
+        image_url TEXT,
+        image_variants TEXT,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class MockImageAPI:
+    """
+    Local stand-in for /v1/images/generations.
+    Each request sleeps for the configured latency, then either answers 429
+    with Retry-After or returns n base64 images of the configured size.
+    """
+
+    def __init__(self, latency: float = DEFAULT_LATENCY, jitter: float = DEFAULT_JITTER,
+                 payload_kb: int = DEFAULT_PAYLOAD_KB, error_rate: float = DEFAULT_ERROR_RATE,
+                 retry_after: int = DEFAULT_RETRY_AFTER, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+        # Encode the image once; every response reuses it
+        image = PNG_SIGNATURE + self.rng.randbytes(max(0, payload_kb * 1024 - len(PNG_SIGNATURE)))
+        self.b64_image = base64.b64encode(image).decode('ascii')
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def do_POST(self):
+                api.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/images/generations"
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        """Answer one generation request."""
+        length = int(request.headers.get('Content-Length', 0))
+        payload = json.loads(request.rfile.read(length) or b'{}')
+
+        with self.lock:
+            self.requests += 1
+            delay = self.latency * (1 + self.rng.uniform(-self.jitter, self.jitter))
+            throttle = self.rng.random() < self.error_rate
+            if throttle:
+                self.throttled += 1
+
+        time.sleep(max(0.0, delay))
+
+        if throttle:
+            body = json.dumps({'error': {'message': 'Rate limit exceeded (mock)'}}).encode('utf-8')
+            request.send_response(429)
+            request.send_header('Retry-After', str(self.retry_after))
+        else:
+            images = ",".join(f'{{"b64_json": "{self.b64_image}"}}' for _ in range(max(1, payload.get('n', 1))))
+            body = f'{{"id": "mock", "model": "{payload.get("model", "")}", "data": [{images}]}}'.encode('ascii')
+            request.send_response(200)
+
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SQLiteConnection:
+    """
+    Minimal mysql.connector-style wrapper around a throwaway SQLite catalog.
+    Installed as the generator's shared connection, it answers the item
+    queries and batched image_url updates the pipeline issues.
+    """
+
+    def __init__(self, path: Path, error_class):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.error_class = error_class
+        self.open = True
+
+    def cursor(self, dictionary: bool = False):
+        return SQLiteCursor(self, dictionary)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def is_connected(self) -> bool:
+        return self.open
+
+    def reconnect(self, attempts: int = 1, delay: int = 0):
+        pass
+
+    def close(self):
+        self.conn.close()
+        self.open = False
+
+
+class SQLiteCursor:
+    """Cursor translating %s placeholders and returning dict rows on request."""
+
+    def __init__(self, connection: SQLiteConnection, dictionary: bool):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.cursor = connection.conn.cursor()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    def execute(self, query: str, params=()):
+        try:
+            self.cursor.execute(query.replace('%s', '?'), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise self.connection.error_class(str(e))
+
+    def _row(self, row):
+        return dict(row) if self.dictionary else tuple(row)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        return None if row is None else self._row(row)
+
+    def fetchall(self) -> List:
+        return [self._row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        return (self._row(row) for row in self.cursor)
+
+    def close(self):
+        self.cursor.close()
+
+
+def create_catalog(path: Path, size: int, seed: int = 0):
+    """Create a throwaway catalog of size synthetic items, none with images."""
+    sys.path.insert(0, str(Path(__file__).parent))
+    from equipment_images.prompts import synthetic_catalog
+
+    conn = sqlite3.connect(str(path))
+    conn.execute(ITEMS_SCHEMA)
+    conn.executemany(
+        "INSERT INTO items (item_id, name, description, item_type, weapon_type, armor_type) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            # item_id is appended so every item gets its own image file
+            (item['item_id'] + 1, f"{item['name']} {item['item_id'] + 1}", item['description'],
+             item['item_type'], item['weapon_type'], item['armor_type'])
+            for item in synthetic_catalog(size, seed)
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(case: Dict):
+    """
+    Run one benchmark case in this (child) process and write its results.
+    The environment already points the generator at the mock API and at a
+    scratch image and cache directory, so it is only imported here.
+    """
+    from equipment_images import api as image_api, db, metrics, pipeline
+
+    db._db_connection = SQLiteConnection(Path(case['db']), db.mysql.connector.Error)
+    image_api.MAX_RATE = max(image_api.MAX_RATE, case['rate'])
+
+    items = db.get_items_without_images()
+
+    start = time.perf_counter()
+    options = pipeline.RunOptions(workers=case['workers'], rate=case['rate'])
+    success, errors = pipeline.run_generation(items, 'offline-benchmark', options)
+    elapsed = time.perf_counter() - start
+
+    cursor = db.get_db_connection().cursor()
+    cursor.execute("SELECT COUNT(*) FROM items WHERE image_url IS NOT NULL AND image_url != ''")
+    updated = cursor.fetchone()[0]
+    cursor.close()
+
+    summary = metrics.get_run_metrics().summary()
+    item_stage = summary['stages'].get('item', {})
+    http_stage = summary['stages'].get('http', {})
+
+    results = {
+        'size': case['size'],
+        'workers': case['workers'],
+        'succeeded': success,
+        'failed': errors,
+        'rows_updated': updated,
+        'elapsed_seconds': round(elapsed, 3),
+        'items_per_second': round(len(items) / elapsed, 3) if elapsed > 0 else 0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'item_p50': item_stage.get('p50'),
+        'item_p95': item_stage.get('p95'),
+        'item_p99': item_stage.get('p99'),
+        'item_max': item_stage.get('max'),
+        'http_p99': http_stage.get('p99'),
+        'retries': summary['counters'].get('retries', 0),
+        'stages': summary['stages']
+    }
+
+    with open(case['results'], 'w') as f:
+        json.dump(results, f)
+
+
+def benchmark(sizes: List[int], worker_counts: List[int], api: MockImageAPI, rate: float,
+              seed: int = 0, verbose: bool = False) -> List[Dict]:
+    """
+    Run every (catalog size, worker count) case in a fresh child process.
+    Each case gets its own catalog, image directory and cache, so runs never
+    share cache hits or learned throttle state, and peak RSS is per case.
+    """
+    results = []
+
+    for size in sizes:
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory(prefix='becmi-bench-') as scratch:
+                scratch = Path(scratch)
+                create_catalog(scratch / "catalog.db", size, seed)
+
+                case = {
+                    'size': size,
+                    'workers': workers,
+                    'rate': rate,
+                    'db': str(scratch / "catalog.db"),
+                    'results': str(scratch / "results.json")
+                }
+                env = dict(os.environ,
+                           TOGETHER_API_URL=api.url,
+                           PUBLIC_DIR=str(scratch / "public"),
+                           IMAGE_CACHE_DIR=str(scratch / "cache"))
+
+                print(f"  Running {size} items with {workers} workers...", flush=True)
+                completed = subprocess.run(
+                    [sys.executable, __file__, '--run-case', json.dumps(case)],
+                    env=env,
+                    cwd=str(Path(__file__).parent),
+                    stdout=None if verbose else subprocess.DEVNULL
+                )
+
+                if completed.returncode != 0:
+                    print(f"  ✗ Case failed with exit code {completed.returncode}")
+                    continue
+
+                with open(case['results']) as f:
+                    results.append(json.load(f))
+
+    return results
+
+
+def print_results(results: List[Dict]):
+    """Print the benchmark matrix as a table."""
+    print("\n" + "="*80)
+    print("BENCHMARK RESULTS")
+    print("="*80)
+    print(f"{'items':>7}{'workers':>9}{'ok':>7}{'items/s':>10}{'rss MB':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}{'retries':>9}")
+
+    for r in results:
+        print(f"{r['size']:>7}{r['workers']:>9}{r['succeeded']:>7}{r['items_per_second']:>10.2f}"
+              f"{r['peak_rss_mb']:>9.1f}{r['item_p50'] or 0:>9.3f}{r['item_p95'] or 0:>9.3f}"
+              f"{r['item_p99'] or 0:>9.3f}{r['retries']:>9}")
+        if r['rows_updated'] != r['succeeded']:
+            print(f"  ⚠️  {r['rows_updated']} rows updated for {r['succeeded']} successful items")
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the equipment image generator")
+    parser.add_argument('--sizes', type=parse_int_list, default=list(DEFAULT_SIZES),
+                        help="Comma-separated catalog sizes")
+    parser.add_argument('--workers', type=parse_int_list, default=list(DEFAULT_WORKER_COUNTS),
+                        help="Comma-separated worker counts")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY,
+                        help="Mock API latency in seconds")
+    parser.add_argument('--jitter', type=float, default=DEFAULT_JITTER,
+                        help="Latency jitter as a fraction of --latency")
+    parser.add_argument('--payload-kb', type=int, default=DEFAULT_PAYLOAD_KB,
+                        help="Decoded image size returned by the mock API")
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_ERROR_RATE,
+                        help="Fraction of mock requests answered with 429")
+    parser.add_argument('--retry-after', type=int, default=DEFAULT_RETRY_AFTER,
+                        help="Retry-After seconds sent with mock 429s")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help="Starting request rate for the pipeline")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the catalog and the mock API")
+    parser.add_argument('--json', type=Path, help="Also write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the generator's own output")
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.run_case:
+        run_case(json.loads(args.run_case))
+        sys.exit(0)
+
+    print("="*80)
+    print("BECMI VTT Equipment Image Generator - Offline Benchmark")
+    print("="*80)
+
+    api = MockImageAPI(latency=args.latency, jitter=args.jitter, payload_kb=args.payload_kb,
+                       error_rate=args.error_rate, retry_after=args.retry_after, seed=args.seed)
+    api.start()
+    print(f"✓ Mock API listening on {api.url}")
+    print(f"  Latency {args.latency}s ±{args.jitter:.0%}, payload {args.payload_kb} KB, "
+          f"429 rate {args.error_rate:.0%}\n")
+
+    try:
+        results = benchmark(args.sizes, args.workers, api, rate=args.rate, seed=args.seed,
+                            verbose=args.verbose)
+    finally:
+        api.stop()
+
+    print_results(results)
+    print(f"\nMock API served {api.requests} requests ({api.throttled} throttled)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': {k: str(v) for k, v in vars(args).items() if k != 'run_case'},
+                       'results': results}, f, indent=2)
+        print(f"✓ Results written to {args.json}")
@@ -0,0 +1,11 @@
+-- =====================================================
+-- Migration: Add image_variants to Items Table
+-- Date: 2026-10-18
+-- Description: Store responsive image variants (thumbnails/WebP) per item.
+--              JSON object keyed by size then format, e.g.
+--              {"64": {"webp": "/images/equipment/weapons/64/equipment_1_sword.webp", "png": "..."}}
+--              Written by generate_equipment_images.py (variants command / --variants).
+-- =====================================================
+
+ALTER TABLE items 
+ADD COLUMN image_variants TEXT NULL AFTER image_url;
@@ -0,0 +1,9 @@
+-- =====================================================
+-- Migration: Add (updated_at, item_id) Index to Items Table
+-- Date: 2026-10-18
+-- Description: Lets generate_equipment_images.py sync page through items
+--              changed since its last run by keyset (updated_at, item_id)
+--              instead of scanning the whole table.
+-- =====================================================
+
+CREATE INDEX idx_items_updated_at ON items(updated_at, item_id);
@@ -0,0 +1,24 @@
+-- =====================================================
+-- Migration: Create Item Image Jobs Table
+-- Date: 2026-10-18
+-- Description: Work queue for generate_equipment_images.py worker mode.
+--              Workers on any host claim pending (or expired) rows with
+--              SELECT ... FOR UPDATE SKIP LOCKED, hold them under a lease
+--              renewed by heartbeats, and mark them done or failed. A
+--              crashed worker's leases expire and are taken over.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS item_image_jobs (
+    item_id INT PRIMARY KEY,
+    status ENUM('pending', 'leased', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    priority DOUBLE NOT NULL DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    leased_by VARCHAR(255) NULL,
+    lease_expires_at DATETIME NULL,
+    last_error TEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE,
+    INDEX idx_item_image_jobs_claim (status, priority, item_id),
+    INDEX idx_item_image_jobs_lease (status, lease_expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
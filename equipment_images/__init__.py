@@ -0,0 +1,4 @@
+"""
+Engine of the equipment image generator, split by concern.
+generate_equipment_images.py is its command line.
+"""
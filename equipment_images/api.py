@@ -0,0 +1,472 @@
+"""Together AI requests: streaming, retries, adaptive throttling and run budgets."""
+
+import time
+import json
+import base64
+import random
+import email.utils
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from pathlib import Path
+from contextlib import ExitStack
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional
+
+from .config import (TOGETHER_API_URL, DEFAULT_RATE, RATE_LIMIT_BURST, MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX,
+                     MIN_RATE, MAX_RATE, RATE_INCREASE, RATE_DECREASE, THROTTLE_STATUSES, LATENCY_TARGET,
+                     THROTTLE_STATE_FILE, HTTP_POOL_SIZE, HTTP_TIMEOUT, STREAM_CHUNK_SIZE)
+from .files import AtomicFile
+from .metrics import RunMetrics, get_run_metrics
+
+# Shared keep-alive HTTP session, opened lazily by get_http_session()
+_http_session = None
+_http_session_pool = 0
+_http_session_lock = threading.Lock()
+
+
+
+def get_http_session(connections: int = HTTP_POOL_SIZE) -> requests.Session:
+    """
+    Return the run's shared HTTP session.
+    Connections to the API are pooled and kept alive, so workers do not
+    repeat the TCP and TLS handshake for every request. The pool keeps at
+    least connections open, so every worker thread can hold one.
+    """
+    global _http_session, _http_session_pool
+    
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+        if connections > _http_session_pool:
+            _http_session_pool = max(HTTP_POOL_SIZE, connections)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_http_session_pool)
+            _http_session.mount('https://', adapter)
+            _http_session.mount('http://', adapter)
+        return _http_session
+
+
+
+def stream_b64_fields(chunks: Iterable[bytes], outs: List[BinaryIO], field: bytes = b'"b64_json"',
+                      metrics: Optional[RunMetrics] = None) -> List[int]:
+    """
+    Decode successive base64 JSON string fields from a streamed response,
+    the first into outs[0], the next into outs[1] and so on (one per image
+    of an n > 1 request). Only the current chunk and a few carried-over
+    characters are held in memory, instead of the full body, parsed dict,
+    base64 strings and decoded bytes at once. Returns the number of bytes
+    written to each output, 0 for fields the response did not contain.
+    With metrics, time spent waiting on the network, decoding and writing
+    is recorded separately, along with bytes received and written.
+    Raises ValueError if no field is found or one is malformed or cut off.
+    """
+    state = 'search'
+    buffer = b''
+    pending = b''  # base64 characters not yet forming a full 4-character group
+    written = [0] * len(outs)
+    index = 0  # output the current field is decoded into
+    received = 0
+    wait_time = decode_time = write_time = 0.0
+    
+    clock = time.perf_counter
+    iterator = iter(chunks)
+    
+    while True:
+        started = clock()
+        chunk = next(iterator, None)
+        wait_time += clock() - started
+        
+        if chunk is None:
+            break
+        received += len(chunk)
+        
+        if state == 'done':
+            # Keep reading so the connection can go back to the pool
+            continue
+        
+        buffer += chunk
+        
+        # Advance through as many states as the buffered data allows
+        while True:
+            if state == 'search':
+                found = buffer.find(field)
+                if found < 0:
+                    buffer = buffer[-(len(field) - 1):]
+                    break
+                buffer = buffer[found + len(field):]
+                state = 'colon'
+            
+            elif state == 'colon':
+                # A match not followed by a colon was a string value, not the key
+                buffer = buffer.lstrip(b' \t\r\n')
+                if not buffer:
+                    break
+                if buffer[:1] != b':':
+                    state = 'search'
+                    continue
+                buffer = buffer[1:]
+                state = 'open'
+            
+            elif state == 'open':
+                buffer = buffer.lstrip(b' \t\r\n')
+                if not buffer:
+                    break
+                if buffer[:1] != b'"':
+                    raise ValueError(f"{field.decode()} is not a string")
+                buffer = buffer[1:]
+                state = 'value'
+            
+            elif state == 'value':
+                end = buffer.find(b'"')
+                value = buffer if end < 0 else buffer[:end]
+                
+                # A JSON escape split across chunks is completed by the next chunk
+                if end < 0 and value.endswith(b'\\'):
+                    value, buffer = value[:-1], b'\\'
+                else:
+                    buffer = b'' if end < 0 else buffer[end + 1:]
+                
+                pending += value.replace(b'\\/', b'/')
+                usable = len(pending) - len(pending) % 4
+                if usable:
+                    started = clock()
+                    decoded = base64.b64decode(pending[:usable])
+                    decoded_at = clock()
+                    outs[index].write(decoded)
+                    decode_time += decoded_at - started
+                    write_time += clock() - decoded_at
+                    written[index] += len(decoded)
+                    pending = pending[usable:]
+                
+                if end < 0:
+                    break
+                if pending:
+                    raise ValueError(f"{field.decode()} has truncated base64 data")
+                index += 1
+                state = 'done' if index == len(outs) else 'search'
+            
+            else:
+                break
+    
+    if metrics:
+        metrics.observe('download', wait_time)
+        metrics.observe('decode', decode_time)
+        metrics.observe('write', write_time)
+        metrics.count('bytes_received', received)
+        metrics.count('bytes_written', sum(written))
+    
+    if state not in ('search', 'done'):
+        raise ValueError(f"Response ended inside {field.decode()} data")
+    if index == 0:
+        raise ValueError(f"No {field.decode()} data in response")
+    
+    return written
+
+
+
+class BudgetExhausted(Exception):
+    """The run's request or time budget ran out; remaining items were deferred."""
+    
+    def __init__(self, message: str = "Run budget exhausted", success: int = 0, errors: int = 0,
+                 deferred: int = 0):
+        super().__init__(message)
+        self.success = success
+        self.errors = errors
+        self.deferred = deferred
+
+
+class RunBudget:
+    """
+    Hard limits for one run: API requests sent (retries included) and
+    wall-clock time. Checked before every request, so the run stops cleanly
+    once either is spent; requests already in flight still complete.
+    """
+    
+    def __init__(self, max_requests: Optional[int] = None, time_budget: Optional[float] = None):
+        self.max_requests = max_requests
+        self.deadline = time.monotonic() + time_budget if time_budget else None
+        self.requests = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def exhausted(self) -> bool:
+        return ((self.max_requests is not None and self.requests >= self.max_requests)
+                or (self.deadline is not None and time.monotonic() >= self.deadline))
+    
+    def take(self) -> bool:
+        """Claim one request, or return False if the budget is spent."""
+        with self.lock:
+            if self.exhausted:
+                return False
+            self.requests += 1
+            return True
+
+
+
+class RetryableError(Exception):
+    """A transient API failure (429, 5xx, connection problem) worth retrying."""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None, status: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def post_image_request(payload: Dict, api_key: str, filepaths: List[Path]):
+    """
+    Make one API request and stream its images into filepaths, one per
+    image requested (payload's n). A file gets no data if the response
+    held fewer images.
+    Raises RetryableError for throttling, server errors and connection
+    problems, and requests exceptions for anything else.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    metrics = get_run_metrics()
+    
+    try:
+        # Make API request, streaming the body instead of buffering it
+        started = time.perf_counter()
+        with get_http_session().post(TOGETHER_API_URL, headers=headers, json=payload,
+                                     timeout=HTTP_TIMEOUT, stream=True) as response:
+            metrics.observe('http', time.perf_counter() - started)
+            status = response.status_code
+            metrics.count(f"http_{status}_responses")
+            
+            if status == 429 or status >= 500:
+                raise RetryableError(f"HTTP {status}", parse_retry_after(response.headers.get('Retry-After')),
+                                     status)
+            if status >= 400:
+                # Read the error body while the connection is still open
+                raise requests.exceptions.HTTPError(f"HTTP {status}: {response.text[:500]}", response=response)
+            
+            # Decode the base64 images straight into temp files, then rename into place
+            with ExitStack() as stack:
+                files = [stack.enter_context(AtomicFile(filepath)) for filepath in filepaths]
+                stream_b64_fields(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), files, metrics=metrics)
+    
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError) as e:
+        raise RetryableError(str(e))
+
+
+def request_with_retry(payload: Dict, api_key: str, filepaths: List[Path],
+                       limiter: Optional['AdaptiveThrottle'] = None, budget: Optional[RunBudget] = None):
+    """
+    Request images, retrying transient failures up to MAX_RETRIES times.
+    Waits for Retry-After when the provider sends it, otherwise for a
+    jittered exponential backoff. Successes and throttle responses (429,
+    503 or Retry-After) are reported to the limiter so it can adapt the
+    request rate; other failures only free its slot. Each attempt is
+    charged to the budget; BudgetExhausted is raised instead of sending
+    once it is spent.
+    """
+    metrics = get_run_metrics()
+    
+    for attempt in range(MAX_RETRIES + 1):
+        if budget and budget.exhausted:
+            raise BudgetExhausted()  # without waiting for a rate token first
+        if limiter:
+            with metrics.time('rate_wait'):
+                limiter.acquire()
+        
+        if budget and not budget.take():
+            if limiter:
+                limiter.release()
+            raise BudgetExhausted()
+        
+        started = time.monotonic()
+        try:
+            post_image_request(payload, api_key, filepaths)
+        except RetryableError as e:
+            if limiter:
+                # Only the provider's throttle signals slow everyone down, not network blips
+                if e.status in THROTTLE_STATUSES or e.retry_after is not None:
+                    limiter.record_throttled(e.retry_after)
+                else:
+                    limiter.release()
+            if attempt == MAX_RETRIES:
+                raise
+            
+            delay = e.retry_after
+            if delay is None:
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            print(f"⚠️  {e}, retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})")
+            metrics.count('retries')
+            with metrics.time('backoff'):
+                time.sleep(delay)
+        except Exception:
+            if limiter:
+                limiter.release()
+            raise
+        else:
+            if limiter:
+                limiter.record_success(time.monotonic() - started)
+            return
+
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all workers.
+    Paces API requests to the provider's allowed rate instead of sleeping
+    a fixed delay after every item, so time spent waiting on a response
+    counts towards the interval. clock and sleep are injectable for tests.
+    """
+    
+    def __init__(self, rate: float, capacity: float = RATE_LIMIT_BURST,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            self.sleep(wait)
+
+
+def load_throttle_state() -> Dict:
+    """Load the rate and concurrency learned by previous runs."""
+    try:
+        with open(THROTTLE_STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def initial_rate(rate: Optional[float]) -> float:
+    """Use an explicit rate, else the learned one, else DEFAULT_RATE."""
+    if rate:
+        return rate
+    return load_throttle_state().get('rate', DEFAULT_RATE)
+
+
+class AdaptiveThrottle:
+    """
+    AIMD controller for request rate and concurrency.
+    Each fast success adds RATE_INCREASE to the token bucket rate and, once
+    per round of `concurrency` successes, allows one more request in flight.
+    A 429 or 503 multiplies both by RATE_DECREASE and, with Retry-After,
+    pauses every worker until the provider is ready; other failures are
+    retried without touching either. Responses slower than LATENCY_TARGET
+    hold the rate steady. The learned values are saved for the next run if
+    any request was sent; a concurrency held at this run's worker count says
+    nothing about the provider, so the previous value is kept then.
+    """
+    
+    def __init__(self, rate: float, max_concurrency: int):
+        self.bucket = TokenBucket(min(MAX_RATE, max(MIN_RATE, rate)))
+        self.max_concurrency = max(1, max_concurrency)
+        self.learned_concurrency = load_throttle_state().get('concurrency')
+        self.concurrency = min(self.max_concurrency, self.learned_concurrency or self.max_concurrency)
+        self.requests = 0
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+    
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+    
+    def acquire(self):
+        """Wait for a concurrency slot, any Retry-After pause, and a rate token."""
+        with self.condition:
+            while self.in_flight >= self.concurrency:
+                self.condition.wait()
+            self.in_flight += 1
+            self.requests += 1
+        
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        self.bucket.acquire()
+    
+    def release(self):
+        """Free a slot without adjusting the rate (failures other than throttling)."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+    
+    def record_success(self, latency: float):
+        """Additive increase after a request completed in time."""
+        with self.condition:
+            self.in_flight -= 1
+            self.successes += 1
+            
+            if latency < LATENCY_TARGET:
+                with self.bucket.lock:
+                    self.bucket.rate = min(MAX_RATE, self.bucket.rate + RATE_INCREASE)
+                if self.successes % self.concurrency == 0:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            
+            self.condition.notify_all()
+    
+    def record_throttled(self, retry_after: Optional[float] = None):
+        """Multiplicative decrease after a throttle response (429, 503, Retry-After)."""
+        with self.condition:
+            self.in_flight -= 1
+            self.throttled += 1
+            
+            with self.bucket.lock:
+                self.bucket.rate = max(MIN_RATE, self.bucket.rate * RATE_DECREASE)
+            self.concurrency = max(1, int(self.concurrency * RATE_DECREASE))
+            
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            
+            self.condition.notify_all()
+    
+    def save(self):
+        """Persist the learned rate and concurrency for the next run."""
+        if not self.requests:
+            return
+        
+        concurrency = self.concurrency
+        if concurrency >= self.max_concurrency and self.learned_concurrency:
+            concurrency = max(concurrency, self.learned_concurrency)
+        
+        THROTTLE_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with AtomicFile(THROTTLE_STATE_FILE) as f:
+            f.write(json.dumps({
+                'rate': round(self.rate, 4),
+                'concurrency': concurrency,
+                'updated': time.time()
+            }).encode('utf-8'))
+        print(f"✓ Learned rate: {self.rate:.2f} requests/second, concurrency: {concurrency} "
+              f"({self.throttled} throttled responses)")
@@ -0,0 +1,142 @@
+"""Per-category sprite atlases of equipment icons."""
+
+import json
+from typing import Dict, List, Tuple
+
+from .config import ATLAS_DIR, ATLAS_ICON_SIZE, ATLAS_COLUMNS, ATLAS_ROWS
+from .util import require_pillow
+from .files import get_image_subdirectory, AtomicFile, url_to_path, hash_file
+from .db import get_all_items
+from .variants import get_variant_urls
+
+
+def load_icon(image_url: str, size: int):
+    """Load an image downscaled to an icon, preferring an existing variant."""
+    from PIL import Image
+    
+    variant_path = url_to_path(get_variant_urls(image_url).get(str(size), {}).get('png', ''))
+    source = variant_path if variant_path.is_file() else url_to_path(image_url)
+    
+    with Image.open(source) as image:
+        icon = image.convert('RGBA')
+    if icon.size != (size, size):
+        icon.thumbnail((size, size), Image.LANCZOS)
+    return icon
+
+
+def build_atlas(subdir: str, items: List[Dict], icon_size: int = ATLAS_ICON_SIZE,
+                columns: int = ATLAS_COLUMNS, rows: int = ATLAS_ROWS) -> Tuple[int, int]:
+    """
+    Build or update the sprite atlas sheets for one category.
+    Each item keeps a fixed slot between runs, so only sheets containing
+    new, changed or removed items are re-rendered, and only those slots are
+    repainted. Returns (icons updated, sheets written).
+    """
+    from PIL import Image
+    
+    map_path = ATLAS_DIR / f"{subdir}.json"
+    try:
+        with open(map_path, 'r') as f:
+            atlas = json.load(f)
+    except (OSError, ValueError):
+        atlas = {}
+    
+    # A layout change invalidates every slot
+    if atlas.get('icon_size') != icon_size or atlas.get('columns') != columns or atlas.get('rows') != rows:
+        atlas = {}
+    
+    entries = atlas.get('items', {})
+    sheets = atlas.get('sheets', [])
+    per_sheet = columns * rows
+    
+    current = {str(item['item_id']): item['image_url'] for item in items}
+    hashes = {item_id: hash_file(url_to_path(url)) for item_id, url in current.items()}
+    
+    removed = {item_id: entries.pop(item_id) for item_id in list(entries) if item_id not in current}
+    changed = [item_id for item_id in current
+               if item_id not in entries or entries[item_id]['hash'] != hashes[item_id]]
+    
+    # New items take the lowest free slots
+    used = {entry['slot'] for entry in entries.values()}
+    free = (slot for slot in range(max(used, default=-1) + len(changed) + 2) if slot not in used)
+    for item_id in changed:
+        if item_id not in entries:
+            slot = next(free)
+            entries[item_id] = {
+                'slot': slot,
+                'sheet': slot // per_sheet,
+                'x': (slot % per_sheet) % columns * icon_size,
+                'y': (slot % per_sheet) // columns * icon_size,
+                'w': icon_size,
+                'h': icon_size
+            }
+        entries[item_id]['hash'] = hashes[item_id]
+    
+    dirty_sheets = {entries[item_id]['sheet'] for item_id in changed} | {entry['sheet'] for entry in removed.values()}
+    sheet_count = max((entry['sheet'] for entry in entries.values()), default=-1) + 1
+    sheets = (sheets + [None] * sheet_count)[:sheet_count]
+    
+    for sheet in sorted(dirty_sheets):
+        if sheet >= sheet_count:
+            continue
+        
+        url = f"/images/equipment/atlas/{subdir}_{sheet}.png"
+        path = url_to_path(url)
+        
+        if path.exists():
+            with Image.open(path) as existing:
+                canvas = existing.convert('RGBA')
+        else:
+            canvas = Image.new('RGBA', (columns * icon_size, rows * icon_size), (0, 0, 0, 0))
+        
+        blank = Image.new('RGBA', (icon_size, icon_size), (0, 0, 0, 0))
+        for entry in removed.values():
+            if entry['sheet'] == sheet:
+                canvas.paste(blank, (entry['x'], entry['y']))
+        
+        for item_id in changed:
+            entry = entries[item_id]
+            if entry['sheet'] != sheet:
+                continue
+            icon = load_icon(current[item_id], icon_size)
+            canvas.paste(blank, (entry['x'], entry['y']))
+            canvas.paste(icon, (entry['x'] + (icon_size - icon.width) // 2,
+                                entry['y'] + (icon_size - icon.height) // 2))
+        
+        with AtomicFile(path) as f:
+            canvas.save(f, 'PNG', optimize=True)
+        
+        # Version lets the browser cache the sheet until it actually changes
+        sheets[sheet] = {'url': url, 'version': hash_file(path)[:12]}
+    
+    atlas = {
+        'icon_size': icon_size,
+        'columns': columns,
+        'rows': rows,
+        'sheets': sheets,
+        'items': entries
+    }
+    
+    map_path.parent.mkdir(parents=True, exist_ok=True)
+    with AtomicFile(map_path) as f:
+        f.write(json.dumps(atlas, indent=1, sort_keys=True).encode('utf-8'))
+    
+    return len(changed), len(dirty_sheets)
+
+
+def build_atlases():
+    """Pack icons for all items with images into per-category sprite atlases."""
+    print("="*80)
+    print("BUILD EQUIPMENT SPRITE ATLASES")
+    print("="*80)
+    
+    require_pillow("for sprite atlases")
+    
+    by_subdir: Dict[str, List[Dict]] = {}
+    for item in get_all_items():
+        if item.get('image_url') and url_to_path(item['image_url']).is_file():
+            by_subdir.setdefault(get_image_subdirectory(item['item_type']), []).append(item)
+    
+    for subdir, items in sorted(by_subdir.items()):
+        updated, written = build_atlas(subdir, items)
+        print(f"✓ {subdir}: {len(items)} icons, {updated} updated, {written} sheets written")
@@ -0,0 +1,196 @@
+"""Image backends: the Together AI API and local placeholder art."""
+
+import sys
+import abc
+import io
+import hashlib
+import colorsys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import CONFIG_FILE, DEFAULT_BACKEND
+from .util import require_pillow
+from .files import AtomicFile
+from .metrics import get_run_metrics
+from .api import RunBudget, request_with_retry, AdaptiveThrottle
+from .sources import record_source
+
+# Placeholder art for the local backend: silhouettes in unit coordinates, as
+# ('polygon', x, y, ...), ('ellipse', x0, y0, x1, y1) or ('arc', x0, y0, x1, y1, start, end)
+PLACEHOLDER_SIZE = 256
+PLACEHOLDER_SHAPES = {
+    'sword': [('polygon', .5, .06, .54, .14, .54, .58, .46, .58, .46, .14),
+              ('polygon', .32, .58, .68, .58, .68, .63, .32, .63),
+              ('polygon', .48, .63, .52, .63, .52, .78, .48, .78), ('ellipse', .46, .77, .54, .83)],
+    'dagger': [('polygon', .5, .2, .54, .27, .54, .56, .46, .56, .46, .27),
+               ('polygon', .38, .56, .62, .56, .62, .6, .38, .6),
+               ('polygon', .48, .6, .52, .6, .52, .74, .48, .74), ('ellipse', .46, .73, .54, .79)],
+    'axe': [('polygon', .48, .1, .52, .1, .52, .84, .48, .84),
+            ('polygon', .52, .14, .74, .08, .78, .24, .74, .4, .52, .32)],
+    'mace': [('polygon', .48, .3, .52, .3, .52, .84, .48, .84), ('ellipse', .38, .1, .62, .34)],
+    'polearm': [('polygon', .485, .18, .515, .18, .515, .84, .485, .84), ('polygon', .5, .06, .55, .2, .45, .2)],
+    'bow': [('arc', .25, .08, .75, .84, -90, 90), ('polygon', .495, .08, .505, .08, .505, .84, .495, .84)],
+    'armor': [('polygon', .3, .14, .42, .1, .5, .16, .58, .1, .7, .14, .74, .34, .66, .4, .66, .78,
+               .34, .78, .34, .4, .26, .34)],
+    'shield': [('polygon', .26, .1, .74, .1, .74, .42, .5, .84, .26, .42)],
+    'potion': [('polygon', .45, .12, .55, .12, .55, .3, .45, .3), ('ellipse', .3, .28, .7, .82)],
+    'treasure': [('polygon', .3, .3, .4, .16, .6, .16, .7, .3, .5, .8)],
+    'gear': [('ellipse', .26, .3, .74, .84), ('polygon', .4, .18, .6, .18, .56, .34, .44, .34)],
+    'monsters': [('ellipse', .2, .36, .72, .7), ('ellipse', .62, .2, .84, .42),
+                 ('polygon', .28, .6, .34, .6, .34, .84, .28, .84), ('polygon', .56, .6, .62, .6, .62, .84, .56, .84)],
+    'portraits': [('ellipse', .36, .12, .64, .46), ('polygon', .2, .86, .28, .56, .5, .5, .72, .56, .8, .86)],
+    'terrain': [('polygon', .5, .08, .84, .27, .84, .67, .5, .86, .16, .67, .16, .27)],
+}
+PLACEHOLDER_KEYWORDS = [  # (shape, keywords in an item's category or name), first match wins
+    ('bow', ('bow',)),
+    ('dagger', ('dagger', 'knife')),
+    ('sword', ('sword', 'blade', 'scimitar')),
+    ('axe', ('axe',)),
+    ('mace', ('mace', 'hammer', 'club', 'flail', 'morning star', 'bludgeon')),
+    ('polearm', ('spear', 'lance', 'pole', 'halberd', 'pike', 'javelin', 'trident', 'staff')),
+    ('shield', ('shield',)),
+    ('potion', ('potion', 'oil', 'water', 'wine')),
+]
+PLACEHOLDER_TYPE_SHAPES = {'weapon': 'sword', 'armor': 'armor', 'shield': 'shield',
+                           'consumable': 'potion', 'treasure': 'treasure', 'gear': 'gear'}
+
+
+
+def get_api_key(backend: str = DEFAULT_BACKEND) -> str:
+    """Read Together AI API key from config file (not needed by local backends)."""
+    if not get_image_backend(backend).remote:
+        return ''
+    
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            content = f.read()
+            # Extract API key from PHP file
+            for line in content.split('\n'):
+                if 'together_AI_api_key' in line and '=' in line:
+                    key = line.split('=')[1].strip().strip('";\'')
+                    return key
+    except Exception as e:
+        print(f"Error reading API key: {e}")
+        sys.exit(1)
+    
+    print("API key not found in config file")
+    sys.exit(1)
+
+
+
+class ImageBackend(abc.ABC):
+    """
+    Produces the image for one request payload.
+    Remote backends call a paid API: their results go through the
+    generation cache, and each call takes from the limiter and budget.
+    Local backends render on the spot and bypass all three.
+    """
+    
+    name = ''
+    remote = True
+    
+    @abc.abstractmethod
+    def generate(self, payload: Dict, record: Dict, api_key: str, filepaths: List[Path],
+                 limiter: Optional['AdaptiveThrottle'] = None, budget: Optional[RunBudget] = None):
+        """Write the images for payload (n of them) to filepaths, raising on failure."""
+
+
+class TogetherBackend(ImageBackend):
+    """The Together AI images API."""
+    
+    name = 'together'
+    
+    def generate(self, payload: Dict, record: Dict, api_key: str, filepaths: List[Path],
+                 limiter: Optional['AdaptiveThrottle'] = None, budget: Optional[RunBudget] = None):
+        request_with_retry(payload, api_key, filepaths, limiter, budget)
+
+
+def placeholder_shape(record: Dict) -> str:
+    """Pick the placeholder silhouette for a record from its source, type and name."""
+    source = record_source(record).name
+    if source != 'items':
+        return source
+    
+    name = f"{record.get('item_category') or ''} {record['name']}".lower()
+    for shape, keywords in PLACEHOLDER_KEYWORDS:
+        if any(keyword in name for keyword in keywords):
+            return shape
+    return PLACEHOLDER_TYPE_SHAPES.get(record.get('item_type'), 'gear')
+
+
+_placeholder_font = None
+
+
+def render_placeholder(payload: Dict, record: Dict) -> bytes:
+    """
+    Render deterministic placeholder art: the record's silhouette on a
+    background coloured by a hash of its prompt, labelled with its name.
+    Palette PNG at PLACEHOLDER_SIZE with fast compression, labelled in
+    Pillow's bitmap font (FreeType text alone would take longer than the
+    rest of the image).
+    """
+    global _placeholder_font
+    from PIL import Image, ImageDraw, ImageFont
+    
+    if _placeholder_font is None:
+        # Pillow 10.1+ made load_default() a FreeType font; older versions return the bitmap one
+        _placeholder_font = getattr(ImageFont, 'load_default_imagefont', ImageFont.load_default)()
+    
+    digest = hashlib.sha256(payload['prompt'].encode('utf-8')).digest()
+    hue = digest[0] / 255
+    background = tuple(int(c * 255) for c in colorsys.hsv_to_rgb(hue, 0.25, 0.95))
+    foreground = tuple(int(c * 255) for c in colorsys.hsv_to_rgb(hue, 0.6, 0.35))
+    
+    size = PLACEHOLDER_SIZE
+    image = Image.new('P', (size, size))
+    image.putpalette(background + foreground + (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    
+    for kind, *points in PLACEHOLDER_SHAPES[placeholder_shape(record)]:
+        if kind == 'arc':
+            draw.arc([c * size for c in points[:4]], points[4], points[5], fill=1, width=size // 24)
+            continue
+        box = [c * size for c in points]
+        if kind == 'ellipse':
+            draw.ellipse(box, fill=1)
+        else:
+            draw.polygon(list(zip(box[::2], box[1::2])), fill=1)
+    
+    label = record['name'][:40]
+    width = draw.textlength(label, font=_placeholder_font)
+    draw.rectangle((0, size - 20, size, size), fill=1)
+    draw.text(((size - width) / 2, size - 15), label, fill=2, font=_placeholder_font)
+    
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+class PlaceholderBackend(ImageBackend):
+    """Local placeholder art for dev and staging: no network, no API key."""
+    
+    name = 'placeholder'
+    remote = False
+    
+    def __init__(self):
+        require_pillow("for the placeholder backend")
+    
+    def generate(self, payload: Dict, record: Dict, api_key: str, filepaths: List[Path],
+                 limiter: Optional['AdaptiveThrottle'] = None, budget: Optional[RunBudget] = None):
+        # Placeholders are deterministic, so every requested image is the same
+        data = render_placeholder(payload, record)
+        for filepath in filepaths:
+            with AtomicFile(filepath) as f:
+                f.write(data)
+        get_run_metrics().count('bytes_written', len(data) * len(filepaths))
+
+
+IMAGE_BACKENDS = {'together': TogetherBackend, 'placeholder': PlaceholderBackend}
+_image_backends: Dict[str, ImageBackend] = {}
+
+
+def get_image_backend(name: str = DEFAULT_BACKEND) -> ImageBackend:
+    """Return the named backend's shared instance, created on first use."""
+    if name not in _image_backends:
+        _image_backends[name] = IMAGE_BACKENDS[name]()
+    return _image_backends[name]
@@ -0,0 +1,193 @@
+"""Content-addressed cache of generated images."""
+
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import CACHE_DIR, CACHE_MAX_BYTES, CACHE_TOUCH_BATCH, CACHE_DB_TIMEOUT
+from .files import atomic_copy
+
+# Shared cache, opened lazily by get_generation_cache()
+_generation_cache = None
+
+
+
+class GenerationCache:
+    """
+    Content-addressed cache of generated images.
+    Entries are keyed by a hash of the full request payload, so any item whose
+    prompt and model parameters are unchanged reuses the stored image instead
+    of calling the API. An entry may keep runner-up candidates, best first;
+    discarding it promotes the next one. Entries live in a SQLite manifest,
+    so hits cost one indexed lookup and processes on one host can share the
+    cache. Last-use times are written in batches, and the least recently
+    used entries are evicted once CACHE_MAX_BYTES is exceeded.
+    """
+    
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.touched: Dict[str, float] = {}  # last_used times not yet written
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        self.db = sqlite3.connect(str(cache_dir / "manifest.db"), timeout=CACHE_DB_TIMEOUT,
+                                  check_same_thread=False)
+        with self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    file TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    prompt TEXT,
+                    last_used REAL NOT NULL,
+                    alternates TEXT NOT NULL DEFAULT '[]'
+                )
+            """)
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(entries)")]
+            if 'alternates' not in columns:
+                self.db.execute("ALTER TABLE entries ADD COLUMN alternates TEXT NOT NULL DEFAULT '[]'")
+    
+    @staticmethod
+    def key(payload: Dict) -> str:
+        """Hash a request payload into a cache key."""
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Path]:
+        """Return the cached image path for a key, or None."""
+        with self.lock:
+            row = self.db.execute("SELECT file FROM entries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            
+            path = self.cache_dir / row[0]
+            if not path.exists():
+                with self.db:
+                    self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            
+            self.touched[key] = time.time()
+            if len(self.touched) >= CACHE_TOUCH_BATCH:
+                self._write_touched()
+            return path
+    
+    def put(self, key: str, source: Path, prompt: str, alternates: List[Path] = ()):
+        """Store a copy of a generated image under a key, with any runner-up candidates."""
+        with self.lock:
+            row = self.db.execute("SELECT alternates FROM entries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._unlink(json.loads(row[0]))
+            
+            filename = f"{key}.png"
+            atomic_copy(source, self.cache_dir / filename)
+            
+            alternate_files = []
+            for i, path in enumerate(alternates, 1):
+                alternate_files.append(f"{key}.{i}.png")
+                atomic_copy(path, self.cache_dir / alternate_files[-1])
+            
+            size = source.stat().st_size + sum(path.stat().st_size for path in alternates)
+            self.touched.pop(key, None)
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries (key, file, size, prompt, last_used, alternates) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, filename, size, prompt, time.time(), json.dumps(alternate_files)))
+            self._write_touched()
+            self._evict()
+    
+    def discard(self, key: str):
+        """
+        Reject an entry's image. The best runner-up takes its place if there
+        is one; otherwise the entry is dropped, so the next request for it
+        calls the API.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT file, size, alternates FROM entries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return
+            
+            filename, size, alternates = row[0], row[1], json.loads(row[2])
+            path = self.cache_dir / filename
+            while alternates:
+                alternate = self.cache_dir / alternates.pop(0)
+                try:
+                    replaced = path.stat().st_size if path.exists() else 0
+                    os.replace(alternate, path)
+                except OSError:
+                    continue
+                with self.db:
+                    self.db.execute("UPDATE entries SET size = ?, alternates = ? WHERE key = ?",
+                                    (size - replaced, json.dumps(alternates), key))
+                return
+            
+            with self.db:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._unlink([filename])
+    
+    def flush(self):
+        """Write pending last-use times (at the end of a run)."""
+        with self.lock:
+            self._write_touched()
+    
+    def close(self):
+        self.flush()
+        self.db.close()
+    
+    def _write_touched(self):
+        if not self.touched:
+            return
+        with self.db:
+            self.db.executemany("UPDATE entries SET last_used = MAX(last_used, ?) WHERE key = ?",
+                                [(used, key) for key, used in self.touched.items()])
+        self.touched = {}
+    
+    def _unlink(self, filenames: List[str]):
+        for filename in filenames:
+            try:
+                (self.cache_dir / filename).unlink()
+            except OSError:
+                pass
+    
+    def _evict(self):
+        """Drop least recently used entries until under the size cap."""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        evicted = []
+        for key, filename, size, alternates in self.db.execute(
+                "SELECT key, file, size, alternates FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._unlink([filename] + json.loads(alternates))
+            evicted.append((key,))
+            total -= size
+        
+        with self.db:
+            self.db.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+
+def get_generation_cache() -> GenerationCache:
+    """Return the run's shared generation cache."""
+    global _generation_cache
+    
+    if _generation_cache is None:
+        _generation_cache = GenerationCache()
+    return _generation_cache
+
+
+def close_generation_cache():
+    """Write pending cache state and close the manifest at the end of a run."""
+    global _generation_cache
+    
+    if _generation_cache is not None:
+        _generation_cache.close()
+        _generation_cache = None
@@ -0,0 +1,289 @@
+"""The generate, regenerate, assets, derive, resume and test commands."""
+
+from typing import List, Optional, Tuple
+
+from .config import DEFAULT_BACKEND
+from .util import confirm
+from .files import url_to_path
+from .db import (get_db_connection, get_items_without_images, get_all_items, update_item_image_url,
+                 ImageUrlWriter, get_items_by_ids)
+from .prompts import prompt_hash
+from .api import initial_rate
+from .sources import ASSET_SOURCES
+from .backends import get_api_key
+from .derive import is_derivable, get_base_image_urls
+from .journal import ProgressJournal
+from .pipeline import RunOptions, generate_image, run_generation, print_summary
+from .sync import record_sync_prompts
+
+
+def derive_magical_variants(options: RunOptions):
+    """
+    Derive images for magical variants whose base item has an image.
+    Only variants without an image are derived unless options.force is set.
+    """
+    print("="*80)
+    print("DERIVE MAGICAL VARIANT IMAGES")
+    print("="*80)
+    
+    if not options.derive:
+        print("Derivation is disabled (--no-derive).")
+        return
+    
+    items = [item for item in get_all_items()
+             if is_derivable(item) and (options.force or not item.get('image_url'))]
+    base_urls = get_base_image_urls(item['base_item_id'] for item in items)
+    items = [item for item in items if item['base_item_id'] in base_urls]
+    
+    print(f"\n✓ Found {len(items)} magical variants with a base image to derive from\n")
+    if not items:
+        return
+    
+    # Every item has a base image, so none of them reaches the API
+    success_count, error_count = run_generation(items, '', options)
+    print_summary(len(items), success_count, error_count)
+
+
+
+def main(options: RunOptions):
+    """Main execution function."""
+    print("="*80)
+    print("BECMI VTT Equipment Image Generator")
+    print("="*80)
+    
+    # Get API key
+    api_key = get_api_key(options.backend)
+    print(f"✓ API key loaded")
+    
+    # Get items without images
+    items = get_items_without_images()
+    total_items = len(items)
+    
+    print(f"\n✓ Found {total_items} items without images\n")
+    
+    if total_items == 0:
+        print("No items need images. All done!")
+        return
+    
+    # Ask for confirmation
+    print("Items to generate:")
+    for i, item in enumerate(items[:10], 1):
+        print(f"  {i}. {item['name']} (ID: {item['item_id']}, Type: {item['item_type']})")
+    
+    if total_items > 10:
+        print(f"  ... and {total_items - 10} more")
+    
+    print(f"\nThis will generate {total_items} images.")
+    print(f"Workers: {options.workers}, starting rate: {initial_rate(options.rate):.2f} requests/second")
+    print(f"Estimated time: {total_items / initial_rate(options.rate) / 60:.1f} minutes")
+    
+    if not confirm("\nProceed? (y/n): ", options.assume_yes):
+        print("Cancelled.")
+        return
+    
+    # Process items concurrently, paced by the shared rate limiter
+    journal = ProgressJournal()
+    journal.start('generate', items, force=options.force)
+    try:
+        success_count, error_count = run_generation(items, api_key, options, journal=journal)
+        journal.finish()
+    finally:
+        journal.close()
+    
+    print_summary(total_items, success_count, error_count)
+
+
+def regenerate_all(options: RunOptions):
+    """Regenerate images for ALL items (even those with existing images)."""
+    print("="*80)
+    print("REGENERATE ALL EQUIPMENT IMAGES")
+    print("="*80)
+    print("\n⚠️  WARNING: This will regenerate ALL equipment images!")
+    print("This will overwrite existing images.")
+    print("Items whose prompt is unchanged reuse the cached image (use --force to bypass).\n")
+    
+    if not confirm("Are you sure? (yes/no): ", options.assume_yes, answer='yes'):
+        print("Cancelled.")
+        return
+    
+    # Get API key
+    api_key = get_api_key(options.backend)
+    print(f"✓ API key loaded")
+    
+    # Get ALL items
+    items = get_all_items()
+    total_items = len(items)
+    
+    print(f"\n✓ Found {total_items} total items\n")
+    
+    # Process items concurrently, paced by the shared rate limiter
+    journal = ProgressJournal()
+    journal.start('regenerate', items, force=options.force)
+    try:
+        success_count, error_count = run_generation(items, api_key, options, journal=journal)
+        journal.finish()
+    finally:
+        journal.close()
+    
+    print_summary(total_items, success_count, error_count)
+
+
+def generate_assets(names: Optional[List[str]], options: RunOptions):
+    """
+    Generate missing images for several asset sources in one run.
+    Equipment, monsters, portraits and terrain icons share one rate
+    limiter, request budget, HTTP session and database connection, and
+    their requests are interleaved so each type makes progress at once.
+    """
+    print("="*80)
+    print("GENERATE ASSET IMAGES")
+    print("="*80)
+    
+    names = names or list(ASSET_SOURCES)
+    unknown = [name for name in names if name not in ASSET_SOURCES]
+    if unknown:
+        print(f"✗ Unknown asset source(s): {', '.join(unknown)} (choose from {', '.join(ASSET_SOURCES)})")
+        return
+    
+    api_key = get_api_key(options.backend)
+    print("✓ API key loaded")
+    
+    records = []
+    for name in names:
+        found = ASSET_SOURCES[name].fetch()
+        print(f"✓ {name}: {len(found)} without images")
+        records += found
+    
+    if not records:
+        print("\nNo assets need images. All done!")
+        return
+    
+    print(f"\nThis will generate {len(records)} images.")
+    print(f"Workers: {options.workers}, starting rate: {initial_rate(options.rate):.2f} requests/second")
+    print(f"Estimated time: {len(records) / initial_rate(options.rate) / 60:.1f} minutes")
+    
+    if not confirm("\nProceed? (y/n): ", options.assume_yes):
+        print("Cancelled.")
+        return
+    
+    success_count, error_count = run_generation(records, api_key, options)
+    print_summary(len(records), success_count, error_count)
+
+
+
+def resume_run(options: RunOptions):
+    """
+    Resume an interrupted generate/regenerate/sync run from the progress
+    journal. Committed items are skipped, saved images whose file exists are
+    only written to the database, and everything else is generated again.
+    A resumed sync records the prompt hashes of the items it committed.
+    """
+    print("="*80)
+    print("RESUME INTERRUPTED RUN")
+    print("="*80)
+    
+    journal = ProgressJournal()
+    run = journal.load()
+    
+    if not run:
+        print("No journal found. Nothing to resume.")
+        return
+    if run['done']:
+        print("The last run completed. Nothing to resume.")
+        return
+    
+    states = run['items']
+    saved = {item_id: s['image_url'] for item_id, s in states.items() if s['state'] == 'saved'}
+    redo = [item_id for item_id, s in states.items() if s['state'] in ('queued', 'requested')]
+    committed = {item_id for item_id, s in states.items() if s['state'] == 'committed'}
+    
+    # Reconcile saved images against the filesystem and database
+    db_urls = {item['item_id']: item['image_url'] for item in get_items_by_ids(list(saved))}
+    to_commit = []
+    for item_id, image_url in saved.items():
+        if not url_to_path(image_url).exists():
+            redo.append(item_id)
+        elif db_urls.get(item_id) == image_url:
+            committed.add(item_id)
+        else:
+            to_commit.append((item_id, image_url))
+    
+    print(f"\nRun: {run['command']} ({len(states)} items)")
+    print(f"  Already committed: {len(committed)}")
+    print(f"  Saved, awaiting database update: {len(to_commit)}")
+    print(f"  To generate again: {len(redo)}\n")
+    
+    items = get_items_by_ids(redo)
+    hashes = {item_id: s['prompt_hash'] for item_id, s in states.items() if s.get('prompt_hash')}
+    if run['command'] == 'sync':
+        hashes.update((item['item_id'], prompt_hash(item)) for item in items)
+    journal.start(run['command'], items, force=run['force'], resumed=True, hashes=hashes)
+    
+    def record(batch: List[Tuple[int, str]]):
+        committed.update(item_id for item_id, _ in batch)
+    
+    def record_saved(batch: List[Tuple[int, str]]):
+        journal.record_committed(batch)
+        record(batch)
+    
+    try:
+        with ImageUrlWriter(on_commit=record_saved) as writer:
+            for item_id, image_url in to_commit:
+                writer.add(item_id, image_url)
+        
+        success_count, error_count = writer.written, writer.failed
+        
+        if items:
+            api_key = get_api_key(options.backend)
+            generated, failed = run_generation(items, api_key, options.replace(force=run['force']),
+                                               journal=journal, on_commit=record)
+            success_count += generated
+            error_count += failed
+        
+        journal.finish()
+    finally:
+        journal.close()
+        if run['command'] == 'sync':
+            record_sync_prompts({item_id: hashes[item_id] for item_id in committed if item_id in hashes})
+    
+    print_summary(len(to_commit) + len(items), success_count, error_count)
+
+
+
+def test_single_item(item_id: int, force: bool = False, backend: str = DEFAULT_BACKEND,
+                     candidates: int = 1):
+    """Test image generation for a single item."""
+    print(f"Testing image generation for item ID: {item_id}")
+    
+    # Get API key
+    api_key = get_api_key(backend)
+    
+    # Get item from database
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    query = """
+        SELECT item_id, name, description, item_type, item_category, 
+               weapon_type, armor_type, size_category
+        FROM items 
+        WHERE item_id = %s
+    """
+    
+    cursor.execute(query, (item_id,))
+    item = cursor.fetchone()
+    
+    cursor.close()
+    
+    if not item:
+        print(f"Item {item_id} not found")
+        return
+    
+    # Generate image
+    image_url = generate_image(item, api_key, force=force, backend=backend, candidates=candidates)
+    
+    if image_url:
+        # Update database
+        update_item_image_url(item['item_id'], image_url)
+        print(f"\n✓ Success! Image URL: {image_url}")
+    else:
+        print(f"\n✗ Failed to generate image")
@@ -0,0 +1,159 @@
+"""Paths, API settings and tuning constants shared by the image generator."""
+
+import os
+import shutil
+import re
+from pathlib import Path
+
+# Configuration
+WORKSPACE_ROOT = Path(__file__).parent.parent
+PUBLIC_DIR = Path(os.getenv('PUBLIC_DIR', WORKSPACE_ROOT / "public"))
+IMAGE_BASE_DIR = PUBLIC_DIR / "images" / "equipment"
+CONFIG_FILE = WORKSPACE_ROOT / "config" / "together-ai.php"
+CACHE_DIR = Path(os.getenv('IMAGE_CACHE_DIR', WORKSPACE_ROOT / ".image-cache"))
+CACHE_MAX_BYTES = 2 * 1024**3  # LRU eviction above this total size
+CACHE_TOUCH_BATCH = 200  # cache hits whose last-use time is written in one transaction
+CACHE_DB_TIMEOUT = 30  # seconds to wait on another process holding the manifest lock
+IMAGE_SUBDIRECTORIES = {
+    'weapon': 'weapons',
+    'armor': 'armor',
+    'shield': 'shields',
+    'gear': 'gear',
+    'consumable': 'consumables'
+}
+# Generated (equipment_<id>_<name>.png) and uploaded (equipment_<id>_<time>.<ext>) images
+EQUIPMENT_IMAGE_PATTERN = re.compile(r'^equipment_(\d+)_.*\.(?:png|jpe?g|gif|webp)$')
+
+# Other asset types generated by the same engine (see ASSET_SOURCES)
+MONSTER_IMAGE_DIR = PUBLIC_DIR / "images" / "monsters"
+PORTRAIT_DIR = PUBLIC_DIR / "images" / "portraits"
+PORTRAIT_SIZE = 512  # as generated by api/character/generate-portrait.php
+TERRAIN_ICON_DIR = PUBLIC_DIR / "images" / "terrain-icons"
+TERRAIN_TYPES = (  # the icons loaded by public/js/modules/hex-map-editor.js
+    'jungle-rainforest', 'jungle-hills', 'jungle-mountains', 'grasslands-plains', 'farmland',
+    'grassy-hills', 'hills', 'mountains', 'mountain-peak', 'high-mountains', 'high-mountain-peak',
+    'water', 'lake', 'ocean', 'swamp', 'marsh', 'beach-dunes', 'desert', 'rocky-desert',
+    'desert-hills', 'desert-mountains', 'light-forest-deciduous', 'heavy-forest-deciduous',
+    'forested-hills-deciduous', 'forested-mountains-deciduous', 'light-forest-coniferous',
+    'heavy-forest-coniferous', 'forested-hills-coniferous', 'forested-mountains-coniferous',
+)
+
+# Database configuration - Load from environment variables
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'user': os.getenv('DB_USER', ''),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': os.getenv('DB_NAME', 'becmi_vtt')
+}
+
+# Together AI API
+TOGETHER_API_URL = os.getenv('TOGETHER_API_URL', "https://api.together.xyz/v1/images/generations")
+MODEL = "black-forest-labs/FLUX.1-schnell-Free"
+DEFAULT_BACKEND = 'together'  # or 'placeholder' for local art in dev/staging (--backend)
+DEFAULT_WIDTH = 1024
+DEFAULT_HEIGHT = 1024  # Square format better for items
+DEFAULT_STEPS = 8  # Increased for better quality
+RATE_LIMIT_DELAY = 3  # seconds between requests
+DEFAULT_RATE = 1 / RATE_LIMIT_DELAY  # requests per second allowed by the provider
+RATE_LIMIT_BURST = 1  # requests that may be sent back-to-back after an idle period
+DEFAULT_WORKERS = 1
+QUEUE_PER_WORKER = 2  # items submitted ahead of each worker thread
+
+# Retries and adaptive (AIMD) throttling
+MAX_RETRIES = 5
+BACKOFF_BASE = 2  # seconds, doubled per attempt with full jitter
+BACKOFF_MAX = 120  # seconds
+MIN_RATE = 0.05  # requests per second
+MAX_RATE = 10
+RATE_INCREASE = 0.02  # requests/second added after each fast success
+RATE_DECREASE = 0.5  # rate and concurrency multiplier after a throttle response
+THROTTLE_STATUSES = (429, 503)  # responses that mean the provider wants fewer requests
+LATENCY_TARGET = 30  # seconds; slower responses stop the rate from growing
+
+# Scheduling: items are generated in order of demand (characters carrying
+# the item, plus one) times their category weight, highest first
+CATEGORY_WEIGHTS = {
+    'weapon': 3.0,
+    'armor': 3.0,
+    'shield': 2.0,
+    'consumable': 1.5,
+    'gear': 1.0,
+    'treasure': 0.5
+}
+THROTTLE_STATE_FILE = CACHE_DIR / "throttle.json"  # learned rate, kept between runs
+
+# Run metrics: JSON summary and Prometheus textfile written at the end of each run
+METRICS_DIR = CACHE_DIR / "metrics"
+METRICS_PREFIX = "becmi_equipment_images"
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+HTTP_POOL_SIZE = 16  # keep-alive connections kept open to the API (at least one per worker)
+HTTP_TIMEOUT = 60  # seconds
+STREAM_CHUNK_SIZE = 64 * 1024  # bytes read from the response at a time
+IMAGE_FILE_MODE = 0o644
+DB_BATCH_SIZE = 25  # image_url updates committed per batch
+DB_FLUSH_INTERVAL = 10  # seconds before a partial batch is committed anyway
+
+# Responsive variants written next to each image as <subdir>/<size>/<name>.<format>
+VARIANT_SIZES = (64, 128, 256)
+VARIANT_FORMATS = ('webp', 'png')
+VARIANT_MANIFEST = CACHE_DIR / "variants.json"  # source hash per image
+
+# Lossless PNG recompression of saved images
+OPTIMIZE_MANIFEST = CACHE_DIR / "optimized.json"  # hash of each optimized image and of its original
+OPTIMIZE_COLORS = 256
+OPTIMIZE_MIN_PSNR = 40.0  # dB; palette versions below this are rejected
+JPEGTRAN = shutil.which('jpegtran')  # optional, for lossless progressive JPEG re-encoding
+EXIF_ORIENTATION = 0x0112
+
+# Magical variants (items with a base_item_id) are derived locally from their base item's image
+DERIVE_MASK_SIZE = 256  # pixels per side the subject mask and glow are computed at
+DERIVE_MASK_THRESHOLD = 40  # difference from the background colour that counts as the item
+DERIVE_GLOW_RADIUS = 0.025  # glow blur radius per bonus level, as a fraction of the image size
+DERIVE_GLOW = 0.12  # glow opacity per bonus level
+DERIVE_TINT = 0.08  # opacity of the element colour over the item per bonus level
+DERIVE_RUNE_BONUS = 3  # bonus from which runes are drawn around the item
+DERIVE_MAX_BONUS = 5
+MAGIC_ELEMENTS = [  # (element, colour, keywords found in the name, description or properties)
+    ('cursed', (140, 40, 170), ('cursed', 'curse')),
+    ('fire', (255, 120, 30), ('fire', 'flame', 'burning')),
+    ('cold', (130, 210, 255), ('cold', 'frost', 'ice')),
+    ('lightning', (210, 200, 255), ('lightning', 'thunder', 'shock')),
+    ('holy', (255, 225, 130), ('holy', 'radiant', 'evil', 'undead')),
+    ('arcane', (90, 150, 255), ()),
+]
+
+# Image QA: every image is scored at once as one downscaled NumPy batch
+QA_SIZE = 64  # pixels per side of the downscaled copy
+QA_BORDER = 6  # pixels of the downscaled copy treated as background
+QA_WHITE_LEVEL = 0.92  # a pixel is white when every channel is above this
+QA_MAX_WHITE = 0.95  # images whiter than this fraction are blank frames
+QA_MIN_STD = 0.03  # grey level spread below which an image is blank
+QA_CLUTTER_Z = 6.0  # border detail this many MADs above the set median is clutter
+QA_DUPLICATE_DISTANCE = 6  # perceptual hash bits (of 63) within which images are near-duplicates
+QA_REPORT = CACHE_DIR / "qa.json"
+
+# Best-of-N: candidates requested in one call, scored locally with the QA metrics
+MAX_CANDIDATES = 4  # most images --candidates may ask for in one request
+CANDIDATE_SIZE = 256  # pixels per side candidates are decoded at for scoring
+CANDIDATE_WEIGHTS = {'background': 1.0, 'centred': 1.0, 'sharpness': 0.5}
+
+# Incremental sync: items changed since the stored updated_at watermark
+SYNC_STATE_FILE = CACHE_DIR / "sync.json"  # watermark and prompt hash per item
+SYNC_PAGE_SIZE = 500  # rows per keyset page
+SYNC_OVERLAP = 120  # seconds re-read before the watermark, for rows committed late
+
+# Worker mode: items are claimed from the item_image_jobs table under a lease
+JOB_LEASE_SECONDS = 300  # a claimed job is taken over if not renewed within this
+JOB_HEARTBEAT_INTERVAL = 60  # seconds between lease renewals
+JOB_POLL_INTERVAL = 10  # seconds to wait when every open job is leased by others
+JOB_BATCH_PER_WORKER = 4  # jobs claimed per worker thread at a time
+JOB_MAX_ATTEMPTS = 3  # failed attempts before a job is marked failed
+
+# Append-only per-item progress of the current run, used by the resume command
+JOURNAL_FILE = CACHE_DIR / "journal.jsonl"
+
+# Sprite atlases: one grid of icons per category, with a JSON map keyed by item_id
+ATLAS_DIR = IMAGE_BASE_DIR / "atlas"
+ATLAS_ICON_SIZE = 64
+ATLAS_COLUMNS = 16
+ATLAS_ROWS = 16  # 256 icons per sheet
@@ -0,0 +1,252 @@
+"""The shared database connection, item queries and batched URL writes."""
+
+import sys
+import time
+import mysql.connector
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import DB_CONFIG, DB_BATCH_SIZE, DB_FLUSH_INTERVAL
+from .metrics import get_run_metrics
+
+# Shared connection, opened lazily by get_db_connection()
+_db_connection = None
+
+
+
+def open_db_connection():
+    """Open a new database connection from DB_CONFIG."""
+    # Credentials are checked here, not at import, so the module can be
+    # imported (and benchmarked offline) without a database
+    if not DB_CONFIG['user'] or not DB_CONFIG['password']:
+        raise ValueError("DB_USER and DB_PASSWORD environment variables must be set")
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+def get_db_connection():
+    """
+    Return the run's shared database connection.
+    One connection is opened per run and reused by every query and update,
+    reconnecting only if the server dropped it.
+    """
+    global _db_connection
+    
+    try:
+        if _db_connection is None:
+            _db_connection = open_db_connection()
+        elif not _db_connection.is_connected():
+            _db_connection.reconnect(attempts=3, delay=1)
+        return _db_connection
+    except mysql.connector.Error as e:
+        print(f"Database connection error: {e}")
+        sys.exit(1)
+
+
+def close_db_connection():
+    """Close the shared database connection at the end of a run."""
+    global _db_connection
+    
+    if _db_connection is not None:
+        try:
+            _db_connection.close()
+        except mysql.connector.Error:
+            pass
+        _db_connection = None
+
+
+def get_items_without_images() -> List[Dict]:
+    """Fetch all items without images from database."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    query = """
+        SELECT item_id, name, description, item_type, item_category, 
+               weapon_type, armor_type, size_category, base_item_id,
+               is_magical, magical_bonus, magical_properties
+        FROM items 
+        WHERE image_url IS NULL OR image_url = ''
+        ORDER BY item_id
+    """
+    
+    cursor.execute(query)
+    items = cursor.fetchall()
+    
+    cursor.close()
+    
+    return items
+
+
+def get_all_items() -> List[Dict]:
+    """Fetch ALL items from database (for regeneration)."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    query = """
+        SELECT item_id, name, description, item_type, item_category, 
+               weapon_type, armor_type, size_category, base_item_id,
+               is_magical, magical_bonus, magical_properties, image_url
+        FROM items 
+        ORDER BY item_id
+    """
+    
+    cursor.execute(query)
+    items = cursor.fetchall()
+    
+    cursor.close()
+    
+    return items
+
+
+
+def fetch_table(query: str) -> List[Dict]:
+    """Run a SELECT on the shared connection and return its rows as dicts."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(query)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+
+def update_item_image_url(item_id: int, image_url: str) -> bool:
+    """Update item's image_url in database."""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        query = "UPDATE items SET image_url = %s, image_variants = NULL WHERE item_id = %s"
+        cursor.execute(query, (image_url, item_id))
+        conn.commit()
+        
+        cursor.close()
+        
+        print(f"✓ Database updated for item {item_id}")
+        return True
+        
+    except mysql.connector.Error as e:
+        print(f"✗ Database error: {e}")
+        return False
+
+
+class ImageUrlWriter:
+    """
+    Write-behind buffer for image_url (or image_variants) updates.
+    Completed values are collected and committed in batches of DB_BATCH_SIZE
+    (or after DB_FLUSH_INTERVAL seconds) as a single CASE UPDATE, so each
+    batch is one round trip and one transaction. A killed run loses at most
+    the uncommitted batch. Staleness is checked on add and by callers that
+    wait between adds (flush_if_stale), so slow requests do not hold back a
+    partial batch. Writes to items by default; with table None (file-only
+    asset sources) values are only counted. Writing an item's image_url
+    clears its image_variants, which belong to the old image.
+    """
+    
+    def __init__(self, column: str = 'image_url', batch_size: int = DB_BATCH_SIZE,
+                 flush_interval: float = DB_FLUSH_INTERVAL,
+                 on_commit: Optional[Callable[[List[Tuple[int, str]]], None]] = None,
+                 table: Optional[str] = 'items', key: str = 'item_id'):
+        self.column = column
+        self.table = table
+        self.key = key
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: List[Tuple[int, str]] = []
+        self.last_flush = time.monotonic()
+        self.written = 0
+        self.failed = 0
+    
+    def add(self, item_id: int, value: str):
+        """Queue an update, flushing if the batch is full or stale."""
+        self.pending.append((item_id, value))
+        
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_stale()
+    
+    def seconds_until_stale(self) -> Optional[float]:
+        """Time left before the pending batch is due, or None if nothing is pending."""
+        if not self.pending:
+            return None
+        return max(0.0, self.last_flush + self.flush_interval - time.monotonic())
+    
+    def flush_if_stale(self):
+        """Commit a partial batch that has waited flush_interval seconds."""
+        if self.seconds_until_stale() == 0:
+            self.flush()
+    
+    def flush(self) -> bool:
+        """Commit all pending updates in one statement."""
+        self.last_flush = time.monotonic()
+        
+        if not self.pending:
+            return True
+        
+        batch = self.pending
+        self.pending = []
+        
+        if self.table is None:
+            self.written += len(batch)
+            return True
+        
+        cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+        placeholders = ", ".join(["%s"] * len(batch))
+        clear = ", image_variants = NULL" if self.table == 'items' and self.column == 'image_url' else ""
+        query = (f"UPDATE {self.table} SET {self.column} = CASE {self.key} {cases} END{clear} "
+                 f"WHERE {self.key} IN ({placeholders})")
+        params = [value for pair in batch for value in pair] + [item_id for item_id, _ in batch]
+        
+        try:
+            with get_run_metrics().time('db_update'):
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                conn.commit()
+                cursor.close()
+        except mysql.connector.Error as e:
+            print(f"✗ Database error while flushing {len(batch)} updates: {e}")
+            self.failed += len(batch)
+            return False
+        
+        self.written += len(batch)
+        print(f"✓ Database updated for {len(batch)} {self.table}")
+        
+        if self.on_commit:
+            self.on_commit(batch)
+        return True
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        # Commit what we have even when the run is interrupted
+        self.flush()
+        return False
+
+
+
+def get_items_by_ids(item_ids: List[int]) -> List[Dict]:
+    """Fetch specific items from database in one query."""
+    if not item_ids:
+        return []
+    
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    placeholders = ", ".join(["%s"] * len(item_ids))
+    query = f"""
+        SELECT item_id, name, description, item_type, item_category, 
+               weapon_type, armor_type, size_category, base_item_id,
+               is_magical, magical_bonus, magical_properties, image_url
+        FROM items 
+        WHERE item_id IN ({placeholders})
+        ORDER BY item_id
+    """
+    
+    cursor.execute(query, list(item_ids))
+    items = cursor.fetchall()
+    
+    cursor.close()
+    
+    return items
@@ -0,0 +1,149 @@
+"""Magical variant images derived locally from their base item's image."""
+
+import os
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Optional, Tuple
+
+from .config import (DERIVE_MASK_SIZE, DERIVE_MASK_THRESHOLD, DERIVE_GLOW_RADIUS, DERIVE_GLOW, DERIVE_TINT,
+                     DERIVE_RUNE_BONUS, DERIVE_MAX_BONUS, MAGIC_ELEMENTS, QA_BORDER)
+from .util import require_pillow
+from .files import AtomicFile, get_image_path, url_to_path
+from .db import get_items_by_ids
+
+
+def magical_element(item: Dict) -> Tuple[str, Tuple[int, int, int]]:
+    """Pick a magical variant's element and colour from its bonus, name, description and properties."""
+    if (item.get('magical_bonus') or 0) < 0:
+        return MAGIC_ELEMENTS[0][:2]
+    
+    text = " ".join(str(item.get(field) or '') for field in ('name', 'description', 'magical_properties')).lower()
+    for element, colour, keywords in MAGIC_ELEMENTS:
+        if any(keyword in text for keyword in keywords):
+            return element, colour
+    return MAGIC_ELEMENTS[-1][:2]
+
+
+def is_derivable(item: Dict) -> bool:
+    """Whether an item is a magical variant whose image can be derived from its base item."""
+    return bool(item.get('base_item_id')) and bool(item.get('is_magical'))
+
+
+def draw_runes(draw, bbox: Tuple[int, int, int, int], count: int, seed: int):
+    """Draw count angular rune glyphs evenly around an ellipse enclosing bbox."""
+    rng = random.Random(seed)
+    left, top, right, bottom = bbox
+    cx, cy = (left + right) / 2, (top + bottom) / 2
+    rx, ry = (right - left) / 2 * 1.15, (bottom - top) / 2 * 1.15
+    glyph = max(4, min(right - left, bottom - top) // 10)
+    
+    for k in range(count):
+        angle = 2 * math.pi * (k + 0.5) / count
+        x, y = cx + rx * math.cos(angle), cy + ry * math.sin(angle)
+        points = [(x + rng.uniform(-glyph, glyph), y + rng.uniform(-glyph, glyph)) for _ in range(4)]
+        draw.line(points, fill=255, width=max(1, glyph // 4))
+
+
+def derive_magical_image(item: Dict, base_image_url: str) -> str:
+    """
+    Render a magical variant's image from its base item's image.
+    Runs in a worker process. The item is separated from the background by
+    its difference from the border colour; it then gets a coloured glow
+    (radius by bonus), a tint in its element's colour and, from
+    DERIVE_RUNE_BONUS, runes around it. The mask and glow are computed at
+    DERIVE_MASK_SIZE and scaled up, so a 1024px image takes milliseconds.
+    The result is saved in the base image's format under the variant's own
+    filename. Returns the image URL.
+    """
+    from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+    
+    filepath, image_url = get_image_path(item)
+    with Image.open(url_to_path(base_image_url)) as base:
+        image_format = base.format or 'PNG'
+        image = base.convert('RGB')
+    
+    _, colour = magical_element(item)
+    level = min(abs(item.get('magical_bonus') or 0), DERIVE_MAX_BONUS) or 1
+    
+    small = image.resize((DERIVE_MASK_SIZE, DERIVE_MASK_SIZE), Image.BILINEAR)
+    border = Image.new('L', small.size, 255)
+    border.paste(0, (QA_BORDER, QA_BORDER, DERIVE_MASK_SIZE - QA_BORDER, DERIVE_MASK_SIZE - QA_BORDER))
+    background = tuple(int(v) for v in ImageStat.Stat(small, border).median)
+    
+    # Threshold, close the holes left by parts matching the background, then
+    # fade towards the edges where tables and shelves sit in catalog shots
+    difference = ImageChops.difference(small, Image.new('RGB', small.size, background)).convert('L')
+    mask = difference.point(lambda v: 255 if v > DERIVE_MASK_THRESHOLD else 0)
+    mask = mask.filter(ImageFilter.MaxFilter(7)).filter(ImageFilter.MinFilter(7)).filter(ImageFilter.MedianFilter(5))
+    centre = ImageChops.invert(Image.radial_gradient('L').resize(small.size)).point(lambda v: min(255, v * 2))
+    mask = ImageChops.multiply(mask, centre)
+    
+    glow = min(1.0, DERIVE_GLOW * (level + 1))
+    halo = mask.filter(ImageFilter.GaussianBlur(DERIVE_MASK_SIZE * DERIVE_GLOW_RADIUS * level))
+    halo = ImageChops.subtract(halo, mask.filter(ImageFilter.MaxFilter(9))).point(lambda v: min(255, int(v * 2 * glow)))
+    tint = mask.filter(ImageFilter.GaussianBlur(2)).point(lambda v: int(v * min(1.0, DERIVE_TINT * level)))
+    
+    if level >= DERIVE_RUNE_BONUS and mask.getbbox():
+        runes = Image.new('L', small.size, 0)
+        draw_runes(ImageDraw.Draw(runes), mask.getbbox(), 2 * level, item['item_id'])
+        runes = ImageChops.lighter(runes, runes.filter(ImageFilter.GaussianBlur(2))).point(lambda v: int(v * glow))
+        halo = ImageChops.lighter(halo, runes)
+    
+    colour_layer = Image.new('RGB', image.size, colour)
+    halo = halo.resize(image.size, Image.BILINEAR)
+    tint = tint.resize(image.size, Image.BILINEAR)
+    image = Image.composite(ImageChops.overlay(image, colour_layer), image, tint)
+    image = Image.composite(ImageChops.screen(image, colour_layer), image, halo)
+    
+    with AtomicFile(filepath) as f:
+        if image_format == 'JPEG':
+            image.save(f, 'JPEG', quality=92)
+        else:
+            image.save(f, image_format)
+    return image_url
+
+
+class MagicalVariantDeriver:
+    """
+    Process-pool stage that derives magical variant images from their base
+    item's image, without API calls. Derivations run on all CPU cores.
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        require_pillow("to derive magical variants", alternative=", or use --no-derive")
+        
+        self.executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self.futures = {}
+        self.failed = 0
+    
+    def submit(self, item: Dict, base_image_url: str):
+        """Queue a variant for derivation from its base item's image."""
+        future = self.executor.submit(derive_magical_image, item, base_image_url)
+        self.futures[future] = item
+    
+    def completed(self, wait: bool = False) -> Iterable[Tuple[Dict, Optional[str]]]:
+        """
+        Yield (item, image_url) for finished derivations, image_url None if
+        one failed. Only those already done unless wait is set.
+        """
+        futures = as_completed(list(self.futures)) if wait else [f for f in list(self.futures) if f.done()]
+        for future in futures:
+            item = self.futures.pop(future)
+            
+            try:
+                image_url = future.result()
+            except Exception as e:
+                print(f"✗ Deriving {item['name']} failed: {e}")
+                self.failed += 1
+                image_url = None
+            yield item, image_url
+    
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def get_base_image_urls(base_ids: Iterable[int]) -> Dict[int, str]:
+    """Map base item IDs to their current image URL, for those that have one."""
+    return {item['item_id']: item['image_url'] for item in get_items_by_ids(sorted(set(base_ids)))
+            if item.get('image_url')}
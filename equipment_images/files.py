@@ -0,0 +1,139 @@
+"""Image paths, filenames and atomic file writes."""
+
+import os
+import shutil
+import hashlib
+import re
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from .config import (PUBLIC_DIR, IMAGE_BASE_DIR, IMAGE_SUBDIRECTORIES, EQUIPMENT_IMAGE_PATTERN,
+                     STREAM_CHUNK_SIZE, IMAGE_FILE_MODE)
+
+
+def get_image_subdirectory(item_type: str) -> str:
+    """Get subdirectory for item type."""
+    return IMAGE_SUBDIRECTORIES.get(item_type, 'gear')
+
+
+
+class AtomicFile:
+    """
+    Context manager writing to a temp file in the destination directory.
+    The temp file is renamed over the destination only if the block exits
+    cleanly, so readers never see a half-written image.
+    """
+    
+    def __init__(self, filepath: Path):
+        self.filepath = filepath
+        self.file = None
+    
+    def __enter__(self) -> BinaryIO:
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.filepath.parent,
+                                             prefix=f".{self.filepath.name}.", suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        return self.file
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        
+        if exc_type is None:
+            # mkstemp creates files owner-only; the web server must be able to read them
+            os.chmod(self.tmp_path, IMAGE_FILE_MODE)
+            os.replace(self.tmp_path, self.filepath)
+        else:
+            try:
+                os.unlink(self.tmp_path)
+            except OSError:
+                pass
+        return False
+
+
+def atomic_copy(source: Path, destination: Path):
+    """Copy a file so the destination is replaced atomically."""
+    with open(source, 'rb') as src, AtomicFile(destination) as dst:
+        shutil.copyfileobj(src, dst)
+
+
+
+def sanitize_filename(name: str) -> str:
+    """
+    Canonical filename part for an item name: lowercase, with every run of
+    other characters collapsed to one underscore ("Rock, Thrown" -> "rock_thrown").
+    Must match sanitizeImageName() in app/core/equipment-images.php.
+    """
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def legacy_image_filenames(item: Dict) -> set:
+    """Filenames the generators gave an item's image before sanitize_filename (see reconcile)."""
+    name = item['name']
+    parts = {
+        name.lower().replace(' ', '_').replace('(', '').replace(')', '').replace("'", ''),  # this script
+        re.sub(r'[^a-zA-Z0-9_-]', '_', name.lower()),  # generate_equipment_images.php, admin API
+        re.sub(r'[^a-z0-9_]', '_', name).lower(),  # regenerate_all_images.php
+        re.sub(r'[^a-z0-9]+', '_', name.lower()),  # scripts/generate_all_equipment_images.php
+    }
+    return {f"equipment_{item['item_id']}_{part}.png" for part in parts}
+
+
+def get_image_path(item: Dict) -> Tuple[Path, str]:
+    """Return (file path, relative URL) for an item's image."""
+    subdir = get_image_subdirectory(item['item_type'])
+    filename = f"equipment_{item['item_id']}_{sanitize_filename(item['name'])}.png"
+    
+    return IMAGE_BASE_DIR / subdir / filename, f"/images/equipment/{subdir}/{filename}"
+
+
+
+def files_identical(a: Path, b: Path) -> bool:
+    """Cheap equality check for two files: size first, then content."""
+    try:
+        if a.stat().st_size != b.stat().st_size:
+            return False
+        with open(a, 'rb') as fa, open(b, 'rb') as fb:
+            return fa.read() == fb.read()
+    except OSError:
+        return False
+
+
+
+def url_to_path(image_url: str) -> Path:
+    """Map a public image URL (e.g. /images/equipment/...) to its file path."""
+    return PUBLIC_DIR / image_url.lstrip('/')
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+
+def scan_equipment_images() -> Dict[str, Tuple[Optional[int], float]]:
+    """
+    List every file in the category directories in one pass.
+    Returns {url: (item_id, mtime)}, with item_id None for files that are not
+    item images. Only files directly inside a category directory count, so
+    the size variant directories and atlas/ are skipped.
+    """
+    found = {}
+    
+    for subdir in sorted(set(IMAGE_SUBDIRECTORIES.values())):
+        try:
+            entries = os.scandir(IMAGE_BASE_DIR / subdir)
+        except FileNotFoundError:
+            continue
+        
+        with entries:
+            for entry in entries:
+                if entry.is_file():
+                    match = EQUIPMENT_IMAGE_PATTERN.match(entry.name)
+                    found[f"/images/equipment/{subdir}/{entry.name}"] = (
+                        int(match.group(1)) if match else None, entry.stat().st_mtime)
+    return found
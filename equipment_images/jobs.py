@@ -0,0 +1,265 @@
+"""The item_image_jobs queue and the multi-host worker."""
+
+import os
+import time
+import socket
+import threading
+import mysql.connector
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import (SYNC_PAGE_SIZE, JOB_LEASE_SECONDS, JOB_HEARTBEAT_INTERVAL, JOB_POLL_INTERVAL,
+                     JOB_BATCH_PER_WORKER, JOB_MAX_ATTEMPTS)
+from .db import (open_db_connection, get_db_connection, get_items_without_images, get_all_items,
+                 get_items_by_ids)
+from .api import BudgetExhausted
+from .backends import get_api_key
+from .pipeline import RunOptions, get_item_demand, item_priority, run_generation, print_summary
+
+
+def enqueue_jobs(selection: Optional[List[str]] = None):
+    """
+    Add items to the item_image_jobs queue for worker mode.
+    With no selection, items without images are queued; 'all' queues every
+    item, and item IDs queue just those. Queued items get their scheduling
+    priority; items already queued are reset to pending unless a worker
+    currently holds them.
+    """
+    print("="*80)
+    print("ENQUEUE EQUIPMENT IMAGE JOBS")
+    print("="*80)
+    
+    if not selection:
+        items = get_items_without_images()
+    elif selection == ['all']:
+        items = get_all_items()
+    else:
+        items = get_items_by_ids([int(item_id) for item_id in selection])
+    
+    if not items:
+        print("No items to queue.")
+        return
+    
+    demand = get_item_demand()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # attempts is assigned before status, which MySQL updates left to right
+    for start in range(0, len(items), SYNC_PAGE_SIZE):
+        page = items[start:start + SYNC_PAGE_SIZE]
+        cursor.execute(f"""
+            INSERT INTO item_image_jobs (item_id, priority)
+            VALUES {", ".join(["(%s, %s)"] * len(page))}
+            ON DUPLICATE KEY UPDATE
+                priority = VALUES(priority),
+                attempts = IF(status = 'leased', attempts, 0),
+                status = IF(status = 'leased', status, 'pending')
+        """, [value for item in page for value in (item['item_id'], item_priority(item, demand))])
+    conn.commit()
+    cursor.close()
+    
+    print(f"✓ Queued {len(items)} items. Start workers with: python generate_equipment_images.py worker")
+
+
+def claim_jobs(worker_id: str, limit: int) -> List[int]:
+    """
+    Lease up to limit jobs, highest priority first, in one transaction.
+    Pending jobs and jobs whose lease expired (a crashed or stalled worker)
+    are eligible; SKIP LOCKED lets concurrent workers claim disjoint rows
+    without waiting on each other.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        conn.commit()  # start from a fresh snapshot
+        cursor.execute("""
+            SELECT item_id FROM item_image_jobs
+            WHERE status = 'pending' OR (status = 'leased' AND lease_expires_at < NOW())
+            ORDER BY priority DESC, item_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        item_ids = [row[0] for row in cursor.fetchall()]
+        
+        if item_ids:
+            cursor.execute(f"""
+                UPDATE item_image_jobs
+                SET status = 'leased', leased_by = %s, attempts = attempts + 1,
+                    lease_expires_at = NOW() + INTERVAL %s SECOND
+                WHERE item_id IN ({", ".join(["%s"] * len(item_ids))})
+            """, [worker_id, JOB_LEASE_SECONDS] + item_ids)
+        conn.commit()
+        return item_ids
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def finish_jobs(worker_id: str, item_ids: List[int], status: str, error: Optional[str] = None):
+    """
+    Mark jobs this worker still holds as done, failed or pending again.
+    A failed job goes back to pending until it has used JOB_MAX_ATTEMPTS;
+    a job handed back as pending does not count the attempt.
+    Jobs taken over by another worker are left alone.
+    """
+    if not item_ids:
+        return
+    
+    attempts_sql = "attempts"
+    if status == 'failed':
+        status_sql, params = "IF(attempts >= %s, 'failed', 'pending')", [JOB_MAX_ATTEMPTS]
+    else:
+        status_sql, params = "%s", [status]
+        if status == 'pending':
+            attempts_sql = "GREATEST(attempts - 1, 0)"  # never started, so not an attempt
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE item_image_jobs
+        SET attempts = {attempts_sql}, status = {status_sql},
+            leased_by = NULL, lease_expires_at = NULL, last_error = %s
+        WHERE leased_by = %s AND item_id IN ({", ".join(["%s"] * len(item_ids))})
+    """, params + [error, worker_id] + list(item_ids))
+    conn.commit()
+    cursor.close()
+
+
+def count_open_jobs(exclude_worker: Optional[str] = None) -> int:
+    """Number of jobs still pending or leased, not counting exclude_worker's leases."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    conn.commit()  # see other workers' commits
+    cursor.execute("""
+        SELECT COUNT(*) FROM item_image_jobs
+        WHERE status = 'pending' OR (status = 'leased' AND COALESCE(leased_by, '') <> %s)
+    """, (exclude_worker or '',))
+    (count,) = cursor.fetchone()
+    cursor.close()
+    return count
+
+
+class LeaseHeartbeat(threading.Thread):
+    """
+    Background thread renewing this worker's leases every
+    JOB_HEARTBEAT_INTERVAL seconds, on its own connection so it never
+    shares a transaction with the pipeline. If the process dies, renewals
+    stop and the leases expire for another worker to take over.
+    """
+    
+    def __init__(self, worker_id: str):
+        super().__init__(name='lease-heartbeat', daemon=True)
+        self.worker_id = worker_id
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+    
+    def hold(self, item_ids: Iterable[int]):
+        with self.lock:
+            self.held.update(item_ids)
+    
+    def drop(self, item_ids: Iterable[int]):
+        with self.lock:
+            self.held.difference_update(item_ids)
+    
+    def run(self):
+        conn = None
+        while not self.stopped.wait(JOB_HEARTBEAT_INTERVAL):
+            with self.lock:
+                item_ids = sorted(self.held)
+            if not item_ids:
+                continue
+            
+            try:
+                if conn is None or not conn.is_connected():
+                    conn = open_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    UPDATE item_image_jobs SET lease_expires_at = NOW() + INTERVAL %s SECOND
+                    WHERE leased_by = %s AND item_id IN ({", ".join(["%s"] * len(item_ids))})
+                """, [JOB_LEASE_SECONDS, self.worker_id] + item_ids)
+                conn.commit()
+                cursor.close()
+            except mysql.connector.Error as e:
+                print(f"⚠️  Lease heartbeat failed: {e}")
+                conn = None
+        
+        if conn is not None:
+            conn.close()
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(options: RunOptions):
+    """
+    Non-interactive worker: generate images for jobs from item_image_jobs.
+    Any number of workers on any number of hosts can run at once. Each runs
+    one pipeline, claiming jobs under a lease (highest priority first) as
+    its slots free up, and marks them done as their URLs are committed.
+    The worker exits once no other job is pending or leased (waiting while
+    other workers hold leases, so it can take over if they crash), or when
+    --max-requests or --time-budget is spent, handing its unstarted jobs
+    back.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    
+    print("="*80)
+    print(f"EQUIPMENT IMAGE WORKER {worker_id}")
+    print("="*80)
+    
+    api_key = get_api_key(options.backend)
+    budget = options.budget()
+    heartbeat = LeaseHeartbeat(worker_id)
+    heartbeat.start()
+    
+    def claim(idle: bool) -> Optional[List[Dict]]:
+        while not budget.exhausted:
+            item_ids = claim_jobs(worker_id, max(1, options.workers) * JOB_BATCH_PER_WORKER)
+            if item_ids:
+                heartbeat.hold(item_ids)
+                print(f"\n✓ Claimed {len(item_ids)} jobs")
+                return get_items_by_ids(item_ids)
+            if not idle:
+                return []
+            if count_open_jobs(exclude_worker=worker_id) == 0:
+                print("\n✓ Job queue is empty")
+                return None
+            print(f"All open jobs are leased by other workers; checking again in {JOB_POLL_INTERVAL}s")
+            time.sleep(JOB_POLL_INTERVAL)
+        return None
+    
+    def committed(batch: List[Tuple[int, str]]):
+        item_ids = [item_id for item_id, _ in batch]
+        finish_jobs(worker_id, item_ids, 'done')
+        heartbeat.drop(item_ids)
+    
+    def failed(item_id: int):
+        finish_jobs(worker_id, [item_id], 'failed', error="generation failed")
+        heartbeat.drop([item_id])
+    
+    def uncommitted() -> List[int]:
+        with heartbeat.lock:
+            return sorted(heartbeat.held)
+    
+    done = failed_count = 0
+    try:
+        # Claims are ordered by job priority already, so items=[] skips prioritize_items
+        done, failed_count = run_generation([], api_key, options, on_commit=committed, budget=budget,
+                                            feed=claim, on_error=failed)
+        finish_jobs(worker_id, uncommitted(), 'failed', error="database update failed")
+    except BudgetExhausted as e:
+        # Stopped early: hand back what was not committed without using an attempt
+        finish_jobs(worker_id, uncommitted(), 'pending')
+        done, failed_count = e.success, e.errors
+        print(f"\n⚠️  {e}; unstarted jobs were handed back to the queue")
+    except BaseException:
+        finish_jobs(worker_id, uncommitted(), 'pending')
+        raise
+    finally:
+        heartbeat.stop()
+    
+    print_summary(done + failed_count, done, failed_count)
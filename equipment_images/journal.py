@@ -0,0 +1,120 @@
+"""Per-item progress journal of the current run."""
+
+import os
+import time
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .config import JOURNAL_FILE
+
+
+class ProgressJournal:
+    """
+    Append-only JSONL journal of per-item progress for one run.
+    Each item moves through queued -> requested -> saved -> committed.
+    Every line is flushed and fsynced before the next stage starts, so after
+    a crash the journal shows exactly which items were already paid for
+    (saved) or recorded in the database (committed). A torn last line from
+    a crash mid-write is ignored on load.
+    """
+    
+    def __init__(self, path: Path = JOURNAL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+    
+    def start(self, command: str, items: List[Dict], force: bool = False, resumed: bool = False,
+              hashes: Optional[Dict[int, str]] = None):
+        """Begin (or continue) a run and mark its items queued, with their prompt hashes if given."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Each new run starts a fresh file; a resumed run appends to it
+        if not resumed:
+            previous = self.load()
+            if previous and not previous['done']:
+                print("⚠️  The previous run was interrupted; starting a new run discards its journal "
+                      "(use 'resume' to continue it instead)")
+        
+        self.file = open(self.path, 'a' if resumed else 'w')
+        if not resumed:
+            self._write({'event': 'run', 'command': command, 'force': force, 'started': time.time()})
+        for item in items:
+            entry = {'item_id': item['item_id'], 'state': 'queued'}
+            if hashes and item['item_id'] in hashes:
+                entry['prompt_hash'] = hashes[item['item_id']]
+            self._write(entry, sync=False)
+        self._sync()
+    
+    def record(self, item_id: int, state: str, image_url: Optional[str] = None):
+        """Append an item state change."""
+        entry = {'item_id': item_id, 'state': state}
+        if image_url:
+            entry['image_url'] = image_url
+        self._write(entry)
+    
+    def record_committed(self, batch: List[Tuple[int, str]]):
+        """ImageUrlWriter callback: mark a committed batch."""
+        for item_id, image_url in batch:
+            self._write({'item_id': item_id, 'state': 'committed', 'image_url': image_url}, sync=False)
+        self._sync()
+    
+    def finish(self):
+        """Mark the run complete."""
+        self._write({'event': 'done', 'finished': time.time()})
+        self.file.close()
+        self.file = None
+    
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    def _write(self, entry: Dict, sync: bool = True):
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            if sync:
+                self._sync_locked()
+    
+    def _sync(self):
+        with self.lock:
+            self._sync_locked()
+    
+    def _sync_locked(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def load(self) -> Dict:
+        """
+        Read the journal.
+        Returns {'command', 'force', 'done', 'items': {item_id: {'state', 'image_url',
+        'prompt_hash'}}} for the last run, or {} if there is none.
+        """
+        run: Dict = {}
+        
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    
+                    if entry.get('event') == 'run':
+                        run = {'command': entry['command'], 'force': entry.get('force', False),
+                               'done': False, 'items': {}}
+                    elif entry.get('event') == 'done':
+                        if run:
+                            run['done'] = True
+                    elif run:
+                        state = run['items'].setdefault(entry['item_id'], {})
+                        state['state'] = entry['state']
+                        if entry.get('image_url'):
+                            state['image_url'] = entry['image_url']
+                        if entry.get('prompt_hash'):
+                            state['prompt_hash'] = entry['prompt_hash']
+        except OSError:
+            pass
+        
+        return run
@@ -0,0 +1,180 @@
+"""Per-stage run metrics and cross-thread profiling."""
+
+import time
+import json
+import cProfile
+import pstats
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from .config import METRICS_DIR, METRICS_PREFIX, HISTOGRAM_BUCKETS
+from .files import AtomicFile
+
+# Shared run metrics, created lazily by get_run_metrics()
+_run_metrics = None
+
+
+
+class RunMetrics:
+    """
+    Thread-safe per-stage timings and counters for one run.
+    Stages: prompt, cache, rate_wait, http (time to response headers),
+    download (waiting on the body), decode, write, backoff, db_update and
+    item (end to end). Exported as a JSON summary with percentiles and as a
+    Prometheus textfile with cumulative histograms.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.timings: Dict[str, List[float]] = {}
+        self.counters: Dict[str, float] = {}
+    
+    def observe(self, stage: str, seconds: float):
+        """Record one duration for a stage."""
+        with self.lock:
+            self.timings.setdefault(stage, []).append(seconds)
+    
+    def count(self, name: str, value: float = 1):
+        """Add to a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    @contextmanager
+    def time(self, stage: str):
+        """Time the enclosed block as one observation of stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def summary(self) -> Dict:
+        """Build the machine-readable run summary."""
+        with self.lock:
+            elapsed = time.time() - self.started
+            items = self.counters.get('items_succeeded', 0) + self.counters.get('items_failed', 0)
+            stages = {}
+            
+            for stage, samples in sorted(self.timings.items()):
+                ordered = sorted(samples)
+                stages[stage] = {
+                    'count': len(ordered),
+                    'total': round(sum(ordered), 6),
+                    'mean': round(sum(ordered) / len(ordered), 6),
+                    'p50': round(ordered[int(0.50 * (len(ordered) - 1))], 6),
+                    'p95': round(ordered[int(0.95 * (len(ordered) - 1))], 6),
+                    'p99': round(ordered[int(0.99 * (len(ordered) - 1))], 6),
+                    'max': round(ordered[-1], 6)
+                }
+            
+            return {
+                'started': self.started,
+                'elapsed_seconds': round(elapsed, 3),
+                'items_per_minute': round(items / elapsed * 60, 3) if elapsed > 0 else 0,
+                'counters': dict(sorted(self.counters.items())),
+                'stages': stages
+            }
+    
+    def prometheus(self) -> str:
+        """Render the run as Prometheus textfile-collector metrics."""
+        summary = self.summary()
+        lines = [
+            f"# HELP {METRICS_PREFIX}_stage_seconds Time spent per pipeline stage.",
+            f"# TYPE {METRICS_PREFIX}_stage_seconds histogram"
+        ]
+        
+        with self.lock:
+            timings = {stage: list(samples) for stage, samples in self.timings.items()}
+        
+        for stage, samples in sorted(timings.items()):
+            for bound in HISTOGRAM_BUCKETS:
+                in_bucket = sum(1 for v in samples if v <= bound)
+                lines.append(f'{METRICS_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {in_bucket}')
+            lines.append(f'{METRICS_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {len(samples)}')
+            lines.append(f'{METRICS_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {sum(samples)}')
+            lines.append(f'{METRICS_PREFIX}_stage_seconds_count{{stage="{stage}"}} {len(samples)}')
+        
+        for name, value in summary['counters'].items():
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name}_total counter")
+            lines.append(f"{METRICS_PREFIX}_{name}_total {value}")
+        
+        lines += [
+            f"# TYPE {METRICS_PREFIX}_items_per_minute gauge",
+            f"{METRICS_PREFIX}_items_per_minute {summary['items_per_minute']}",
+            f"# TYPE {METRICS_PREFIX}_run_duration_seconds gauge",
+            f"{METRICS_PREFIX}_run_duration_seconds {summary['elapsed_seconds']}",
+            f"# TYPE {METRICS_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{METRICS_PREFIX}_last_run_timestamp_seconds {time.time()}"
+        ]
+        return "\n".join(lines) + "\n"
+    
+    def export(self, directory: Optional[Path] = None):
+        """Write last_run.json and the .prom textfile, and print the stage table."""
+        directory = directory or METRICS_DIR
+        summary = self.summary()
+        
+        with AtomicFile(directory / "last_run.json") as f:
+            f.write(json.dumps(summary, indent=2).encode('utf-8'))
+        with AtomicFile(directory / f"{METRICS_PREFIX}.prom") as f:
+            f.write(self.prometheus().encode('utf-8'))
+        
+        print("\nStage timings (seconds):")
+        print(f"  {'stage':<12}{'count':>8}{'total':>12}{'p50':>10}{'p95':>10}{'max':>10}")
+        for stage, t in summary['stages'].items():
+            print(f"  {stage:<12}{t['count']:>8}{t['total']:>12.3f}{t['p50']:>10.3f}{t['p95']:>10.3f}{t['max']:>10.3f}")
+        print(f"  Items per minute: {summary['items_per_minute']:.1f}")
+        print(f"✓ Metrics written to {directory}")
+
+
+def get_run_metrics() -> RunMetrics:
+    """Return the run's shared metrics collector."""
+    global _run_metrics
+    
+    if _run_metrics is None:
+        _run_metrics = RunMetrics()
+    return _run_metrics
+
+
+class Profiler:
+    """
+    cProfile across all threads of a run (--profile).
+    cProfile only sees the thread it runs in, so each worker thread wraps
+    its work in run_profiled() and write() merges the results.
+    """
+    
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self.lock = threading.Lock()
+    
+    def run(self, func: Callable, *args, **kwargs):
+        """Call func under its own profiler."""
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        return profile.runcall(func, *args, **kwargs)
+    
+    def write(self, directory: Path = METRICS_DIR):
+        """Merge all thread profiles, save profile.pstats and print the top entries."""
+        if not self.profiles:
+            return
+        
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        
+        directory.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(str(directory / "profile.pstats"))
+        
+        print("\nProfile (top 25 by cumulative time):")
+        stats.sort_stats('cumulative').print_stats(25)
+        print(f"✓ Profile written to {directory / 'profile.pstats'}")
+
+
+def run_profiled(profiler: Optional[Profiler], func: Callable, *args, **kwargs):
+    """Call func, under profiler when profiling is on."""
+    if profiler is None:
+        return func(*args, **kwargs)
+    return profiler.run(func, *args, **kwargs)
@@ -0,0 +1,250 @@
+"""Lossless recompression of saved images."""
+
+import os
+import json
+import io
+import hashlib
+import math
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Optional, Tuple
+
+from .config import OPTIMIZE_MANIFEST, OPTIMIZE_COLORS, OPTIMIZE_MIN_PSNR, JPEGTRAN, EXIF_ORIENTATION
+from .util import require_pillow
+from .files import AtomicFile, url_to_path, hash_file, scan_equipment_images
+from .metrics import get_run_metrics
+
+# Optimize manifest, read lazily by is_optimized_copy()
+_optimize_manifest = None
+
+
+
+def image_psnr(original, candidate) -> float:
+    """Peak signal-to-noise ratio in dB between two images of the same size."""
+    from PIL import ImageChops, ImageStat
+    
+    diff = ImageChops.difference(original, candidate.convert(original.mode))
+    rms = ImageStat.Stat(diff).rms
+    mse = sum(v * v for v in rms) / len(rms)
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def strip_jpeg_metadata(data: bytes, keep_exif: bool = False) -> bytes:
+    """
+    Drop comment and APPn metadata segments from a JPEG without re-encoding.
+    JFIF (APP0), ICC profiles (APP2) and Adobe colour info (APP14) are kept
+    since they affect how the image is displayed, and so is EXIF with keep_exif.
+    """
+    if data[:2] != b'\xff\xd8':
+        return data
+    
+    kept = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:  # start of scan: the rest is image data
+            break
+        
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        metadata = marker == 0xFE or (0xE1 <= marker <= 0xEF and marker not in (0xE2, 0xEE))
+        if not metadata or (marker == 0xE1 and keep_exif):
+            kept.append(data[pos:end])
+        pos = end
+    
+    kept.append(data[pos:])
+    return b''.join(kept)
+
+
+def optimize_png_data(image, quantize: bool = False) -> bytes:
+    """Re-encode a PNG at maximum compression, optionally as a palette image."""
+    from PIL import Image
+    
+    image.info = {}
+    if image.mode == 'RGBA' and image.getchannel('A').getextrema() == (255, 255):
+        image = image.convert('RGB')
+    
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True)
+    best = buffer.getvalue()
+    
+    if quantize and image.mode in ('RGB', 'RGBA'):
+        method = Image.Quantize.FASTOCTREE if image.mode == 'RGBA' else Image.Quantize.MEDIANCUT
+        palette = image.quantize(colors=OPTIMIZE_COLORS, method=method, dither=Image.Dither.NONE)
+        
+        if image_psnr(image, palette) >= OPTIMIZE_MIN_PSNR:
+            buffer = io.BytesIO()
+            palette.save(buffer, 'PNG', optimize=True)
+            if buffer.tell() < len(best):
+                best = buffer.getvalue()
+    return best
+
+
+def optimize_jpeg_data(data: bytes, keep_exif: bool = False) -> bytes:
+    """
+    Strip a JPEG's metadata and, with jpegtran installed, rebuild its Huffman
+    tables as a progressive scan. Both steps leave the pixels bit-identical.
+    """
+    data = strip_jpeg_metadata(data, keep_exif)
+    
+    if JPEGTRAN:
+        result = subprocess.run([JPEGTRAN, '-copy', 'all', '-optimize', '-progressive'],
+                                input=data, capture_output=True)
+        if result.returncode == 0 and result.stdout[:2] == b'\xff\xd8':
+            data = result.stdout
+    return data
+
+
+def load_optimize_manifest() -> Dict[str, Dict[str, str]]:
+    """Read the optimize manifest: image URL -> {'hash': optimized file, 'source': original file}."""
+    try:
+        with open(OPTIMIZE_MANIFEST, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Older manifests stored only the optimized hash
+    return {url: entry if isinstance(entry, dict) else {'hash': entry} for url, entry in manifest.items()}
+
+
+def is_optimized_copy(original: Path, image_url: str) -> bool:
+    """True if the image at image_url is the optimized version of original."""
+    global _optimize_manifest
+    
+    if _optimize_manifest is None:
+        _optimize_manifest = load_optimize_manifest()
+    
+    entry = _optimize_manifest.get(image_url)
+    if not entry or 'source' not in entry:
+        return False
+    try:
+        return hash_file(url_to_path(image_url)) == entry['hash'] and hash_file(original) == entry['source']
+    except OSError:
+        return False
+
+
+def optimize_image(image_url: str, known: Optional[Dict[str, str]],
+                   quantize: bool = False) -> Tuple[Dict[str, str], Optional[Tuple[int, int]]]:
+    """
+    Recompress one saved image in place, losslessly unless quantize is set.
+    Runs in a worker process. The API returns JPEG data for most models even
+    though files are named .png, so each file is handled by its real format:
+    JPEGs lose their metadata (and are re-encoded by jpegtran when present),
+    PNGs are re-encoded at maximum compression without metadata or a fully
+    opaque alpha channel. With quantize, PNGs may also become palette images
+    within OPTIMIZE_MIN_PSNR. The file is only replaced when the result is
+    smaller. Returns the manifest entry (hashes of the optimized file and of
+    the original) and (bytes before, bytes after), with the sizes None if the
+    file is unchanged since it was last optimized.
+    """
+    from PIL import Image
+    
+    path = url_to_path(image_url)
+    data = path.read_bytes()
+    source_hash = hashlib.sha256(data).hexdigest()
+    if known and source_hash == known['hash']:
+        return known, None
+    
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format == 'JPEG':
+            best = optimize_jpeg_data(data, keep_exif=image.getexif().get(EXIF_ORIENTATION, 1) != 1)
+        elif image.format == 'PNG':
+            image.load()
+            best = optimize_png_data(image, quantize)
+        else:
+            best = data
+    
+    if len(best) >= len(data):
+        return {'hash': source_hash, 'source': source_hash}, (len(data), len(data))
+    
+    with AtomicFile(path) as f:
+        f.write(best)
+    return {'hash': hashlib.sha256(best).hexdigest(), 'source': source_hash}, (len(data), len(best))
+
+
+class ImageOptimizer:
+    """
+    Process-pool stage that shrinks saved images.
+    Images are recompressed on all CPU cores; files whose hash matches the
+    manifest were already optimized and are skipped. Bytes saved are
+    reported per category.
+    """
+    
+    def __init__(self, quantize: bool = False, max_workers: Optional[int] = None):
+        require_pillow("for image optimization")
+        if not JPEGTRAN:
+            print("⚠️  jpegtran not found; JPEG images will only have their metadata stripped")
+        
+        self.quantize = quantize
+        self.executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self.manifest = load_optimize_manifest()
+        self.updates: Dict[str, Dict[str, str]] = {}  # entries changed by this run
+        self.futures = {}
+        self.categories: Dict[str, Dict[str, int]] = {}
+        self.failed = 0
+    
+    def _save_manifest(self):
+        # Merge into the current file so entries saved by another process meanwhile are kept
+        manifest = load_optimize_manifest()
+        manifest.update(self.updates)
+        with AtomicFile(OPTIMIZE_MANIFEST) as f:
+            f.write(json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+        
+        global _optimize_manifest
+        _optimize_manifest = None
+    
+    def submit(self, image_url: str):
+        """Queue an image for recompression."""
+        future = self.executor.submit(optimize_image, image_url, self.manifest.get(image_url), self.quantize)
+        self.futures[future] = image_url
+    
+    def finish(self):
+        """Wait for all images and report the bytes saved."""
+        for future in as_completed(self.futures):
+            image_url = self.futures[future]
+            
+            try:
+                entry, sizes = future.result()
+            except Exception as e:
+                print(f"✗ Optimization failed for {image_url}: {e}")
+                self.failed += 1
+                continue
+            
+            self.manifest[image_url] = self.updates[image_url] = entry
+            stats = self.categories.setdefault(Path(image_url).parent.name,
+                                               {'files': 0, 'skipped': 0, 'before': 0, 'after': 0})
+            if sizes is None:
+                stats['skipped'] += 1
+            else:
+                stats['files'] += 1
+                stats['before'] += sizes[0]
+                stats['after'] += sizes[1]
+        
+        self.executor.shutdown()
+        self.futures = {}
+        self._save_manifest()
+        
+        saved = sum(stats['before'] - stats['after'] for stats in self.categories.values())
+        get_run_metrics().count('bytes_saved_optimizing', saved)
+        
+        print(f"\n{'category':<14}{'optimized':>10}{'skipped':>9}{'before':>12}{'after':>12}{'saved':>16}")
+        for category, stats in sorted(self.categories.items()):
+            saved_bytes = stats['before'] - stats['after']
+            percent = saved_bytes / stats['before'] * 100 if stats['before'] else 0
+            print(f"{category:<14}{stats['files']:>10}{stats['skipped']:>9}{stats['before'] / 1024**2:>10.1f}MB"
+                  f"{stats['after'] / 1024**2:>10.1f}MB{saved_bytes / 1024:>10.1f}KB {percent:>3.0f}%")
+        print(f"✓ Saved {saved / 1024**2:.2f} MB, failed: {self.failed}")
+
+
+def optimize_images(quantize: bool = False):
+    """Recompress every image in the equipment image tree."""
+    print("="*80)
+    print("OPTIMIZE EQUIPMENT IMAGES")
+    print("="*80)
+    
+    urls = sorted(url for url, (item_id, _) in scan_equipment_images().items() if item_id is not None)
+    print(f"\n✓ Found {len(urls)} images\n")
+    
+    optimizer = ImageOptimizer(quantize)
+    for url in urls:
+        optimizer.submit(url)
+    optimizer.finish()
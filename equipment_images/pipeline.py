@@ -0,0 +1,462 @@
+"""The generation pipeline every command runs through."""
+
+import copy
+import requests
+import mysql.connector
+from pathlib import Path
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import (DEFAULT_BACKEND, DEFAULT_WORKERS, QUEUE_PER_WORKER, MAX_RETRIES, CATEGORY_WEIGHTS,
+                     METRICS_DIR)
+from .files import atomic_copy, files_identical
+from .metrics import get_run_metrics, Profiler, run_profiled
+from .db import get_db_connection, ImageUrlWriter
+from .api import get_http_session, BudgetExhausted, RunBudget, RetryableError, initial_rate, AdaptiveThrottle
+from .cache import get_generation_cache
+from .sources import ASSET_SOURCES, record_source, interleave_sources
+from .backends import get_image_backend
+from .variants import VariantRenderer
+from .optimize import is_optimized_copy, ImageOptimizer
+from .derive import is_derivable, MagicalVariantDeriver, get_base_image_urls
+from .qa import generate_candidates
+from .journal import ProgressJournal
+
+
+class RunOptions:
+    """
+    The settings of one run, as given on the command line.
+    Commands pass them down to run_generation and its stages, so a run's
+    settings never live in module globals.
+    """
+    
+    def __init__(self, workers: int = DEFAULT_WORKERS, rate: Optional[float] = None, force: bool = False,
+                 variants: bool = False, optimize: bool = False, quantize: bool = False,
+                 max_requests: Optional[int] = None, time_budget: Optional[float] = None,
+                 derive: bool = True, backend: str = DEFAULT_BACKEND, candidates: int = 1,
+                 assume_yes: bool = False, metrics_dir: Path = METRICS_DIR,
+                 profiler: Optional[Profiler] = None):
+        self.workers = workers
+        self.rate = rate
+        self.force = force
+        self.variants = variants
+        self.optimize = optimize
+        self.quantize = quantize
+        self.max_requests = max_requests
+        self.time_budget = time_budget
+        self.derive = derive
+        self.backend = backend
+        self.candidates = candidates
+        self.assume_yes = assume_yes
+        self.metrics_dir = metrics_dir
+        self.profiler = profiler
+    
+    def budget(self) -> RunBudget:
+        """Start a budget with this run's request and time limits."""
+        return RunBudget(self.max_requests, self.time_budget)
+    
+    def replace(self, **changes) -> 'RunOptions':
+        """Return a copy with some settings changed."""
+        options = copy.copy(self)
+        for name, value in changes.items():
+            setattr(options, name, value)
+        return options
+
+
+
+def generate_image(item: Dict, api_key: str, force: bool = False,
+                   limiter: Optional['AdaptiveThrottle'] = None,
+                   budget: Optional[RunBudget] = None, backend: str = DEFAULT_BACKEND,
+                   candidates: int = 1) -> Optional[str]:
+    """
+    Generate image using the named backend (Together AI by default).
+    The item may be a record of any asset source; its source supplies the
+    prompt, request size and file path.
+    If an identical request was made before, the cached image is reused
+    without an API call unless force is set. Cache hits do not consume a
+    token from the limiter or the budget. With candidates > 1 one request
+    asks for that many images and the best scoring is kept, the runners-up
+    going to the cache under the same key. Transient failures are retried
+    with backoff. Local backends render directly, without the cache.
+    Returns the image path if successful, None otherwise; raises
+    BudgetExhausted if the request could not be sent within budget.
+    """
+    source = record_source(item)
+    item_id = item[source.key]
+    item_type = item.get('item_type') or source.name
+    item_name = item['name']
+    
+    metrics = get_run_metrics()
+    
+    # Generate prompt
+    with metrics.time('prompt'):
+        payload = source.payload(item)
+    prompt = payload['prompt']
+    filepath, relative_path = source.image_path(item)
+    
+    backend = get_image_backend(backend)
+    if not backend.remote:
+        try:
+            backend.generate(payload, item, api_key, [filepath])
+        except Exception as e:
+            print(f"✗ {backend.name} backend failed for {item_name} (ID: {item_id}): {e}")
+            return None
+        print(f"✓ {backend.name.title()} image: {item_name} (ID: {item_id})")
+        return relative_path
+    
+    cache = get_generation_cache()
+    cache_key = cache.key(payload)
+    
+    if not force:
+        with metrics.time('cache'):
+            cached_path = cache.get(cache_key)
+            if cached_path:
+                # An optimized copy of the cached image is what optimize left there
+                if files_identical(cached_path, filepath) or is_optimized_copy(cached_path, relative_path):
+                    print(f"✓ Unchanged, skipping API call: {item_name} (ID: {item_id})")
+                else:
+                    atomic_copy(cached_path, filepath)
+                    print(f"✓ Reused cached image for: {item_name} (ID: {item_id})")
+        if cached_path:
+            metrics.count('cache_hits')
+            return relative_path
+    
+    # Single print call so banners from concurrent workers do not interleave
+    print(f"\n{'='*80}\n"
+          f"Generating image for: {item_name} (ID: {item_id})\n"
+          f"Type: {item_type}\n"
+          f"Prompt: {prompt}\n"
+          f"{'='*80}")
+    
+    try:
+        if candidates > 1:
+            scores = generate_candidates(backend, payload, item, api_key, filepath, cache_key, candidates,
+                                         limiter, budget)
+            print(f"✓ Best of {len(scores)} candidates (scores: {', '.join(f'{score:.2f}' for score in scores)})")
+        else:
+            backend.generate(payload, item, api_key, [filepath], limiter, budget)
+            cache.put(cache_key, filepath, prompt)
+        
+        print(f"✓ Image saved: {filepath}")
+        print(f"✓ URL: {relative_path}")
+        
+        return relative_path
+    
+    except BudgetExhausted:
+        raise
+    except RetryableError as e:
+        print(f"✗ API request failed after {MAX_RETRIES} retries: {e}")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"✗ API request failed: {e}")
+        return None
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return None
+
+
+
+def get_item_demand() -> Dict[int, int]:
+    """Number of characters carrying each item, from character_inventory."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("SELECT item_id, COUNT(*) FROM character_inventory GROUP BY item_id")
+        return {item_id: holders for item_id, holders in cursor.fetchall()}
+    except mysql.connector.Error as e:
+        print(f"⚠️  Could not read item demand, using category weights only: {e}")
+        return {}
+    finally:
+        cursor.close()
+
+
+def item_priority(item: Dict, demand: Dict[int, int]) -> float:
+    """Scheduling priority of an item; higher is generated first."""
+    return (demand.get(item['item_id'], 0) + 1) * CATEGORY_WEIGHTS.get(item['item_type'], 1.0)
+
+
+def prioritize_items(items: List[Dict]) -> List[Dict]:
+    """
+    Order items so the most visible assets are generated first: by the
+    number of characters carrying the item (plus one, so unowned items
+    still rank by category) times CATEGORY_WEIGHTS, then by item_id.
+    """
+    if len(items) < 2:
+        return list(items)
+    
+    demand = get_item_demand()
+    ordered = sorted(items, key=lambda item: (-item_priority(item, demand), item['item_id']))
+    
+    top = ", ".join(f"{item['name']} ({demand.get(item['item_id'], 0)})" for item in ordered[:3])
+    print(f"✓ Queue ordered by demand and category; first: {top}")
+    return ordered
+
+
+def run_generation(items: List[Dict], api_key: str, options: Optional[RunOptions] = None,
+                   journal: Optional[ProgressJournal] = None,
+                   on_commit: Optional[Callable[[List[Tuple[int, str]]], None]] = None,
+                   budget: Optional[RunBudget] = None,
+                   feed: Optional[Callable[[bool], Optional[List[Dict]]]] = None,
+                   on_error: Optional[Callable[[int], None]] = None) -> Tuple[int, int]:
+    """
+    Generate images for items (records of any ASSET_SOURCES source) using a
+    pool of worker threads paced by an AdaptiveThrottle, committing image
+    URLs in batches as results complete. Magical variants are derived from
+    their base item's image instead of requested, unless options.derive is
+    off. The budget defaults to one from options. With feed, more records
+    are pulled as slots free up (feed(idle) returns None when there is no
+    more work); on_error is called with each failed equipment item_id.
+    Raises BudgetExhausted once the budget is spent, leaving the journal open
+    for resume. Returns (success_count, error_count).
+    """
+    options = options or RunOptions()
+    workers = options.workers
+    limiter = AdaptiveThrottle(initial_rate(options.rate), workers)
+    budget = budget or options.budget()
+    if get_image_backend(options.backend).remote:
+        get_http_session(workers)
+    
+    metrics = get_run_metrics()
+    
+    base_urls: Dict[int, str] = {}
+    waiting: Dict[int, List[Dict]] = {}  # base item_id -> variants derived once it is generated
+    derivations: List[Tuple[Dict, str]] = []  # (variant, base image_url) ready to derive
+    planned = 0
+    
+    def plan(records: List[Dict], prioritize: bool) -> List[Dict]:
+        """Set aside a batch's derivable variants and return the rest in request order."""
+        nonlocal planned
+        queues: Dict[str, List[Dict]] = {}
+        for record in records:
+            queues.setdefault(record_source(record).name, []).append(record)
+        batch = queues.get('items', [])
+        if prioritize and batch:
+            batch = prioritize_items(batch)
+        
+        in_batch = {item['item_id']: item for item in batch}
+        derivable = [item for item in batch if options.derive and is_derivable(item)]
+        if derivable:
+            base_urls.update(get_base_image_urls(item['base_item_id'] for item in derivable))
+        
+        derived_ids = set()
+        for item in derivable:
+            base = in_batch.get(item['base_item_id'])
+            if base and not is_derivable(base):
+                waiting.setdefault(base['item_id'], []).append(item)
+            elif not base and item['base_item_id'] in base_urls:
+                derivations.append((item, base_urls[item['base_item_id']]))
+            else:
+                continue  # no base image to derive from: request it
+            derived_ids.add(item['item_id'])
+        
+        if batch:
+            queues['items'] = [item for item in batch if item['item_id'] not in derived_ids]
+        planned_items = interleave_sources(queues.values())
+        planned += len(planned_items)
+        return planned_items
+    
+    def work(item: Dict) -> Optional[str]:
+        if journal:
+            journal.record(item['item_id'], 'requested')
+        with metrics.time('item'):
+            image_url = run_profiled(options.profiler, generate_image, item, api_key, force=options.force,
+                                     limiter=limiter, budget=budget, backend=options.backend,
+                                     candidates=options.candidates)
+        if journal and image_url:
+            journal.record(item['item_id'], 'saved', image_url)
+        return image_url
+    
+    futures = {}
+    
+    def queued() -> Iterable[Optional[Dict]]:
+        # None marks the end of a fed batch, letting the pipeline drain before asking again
+        yield from plan(items, prioritize=True)
+        while feed:
+            records = feed(not futures)
+            if records is None:
+                return
+            yield from plan(records, prioritize=False)
+            yield None
+    
+    error_count = 0
+    deferred = 0
+    completed = 0
+    derived = 0
+    renderer = VariantRenderer() if options.variants and not options.optimize else None
+    optimizer = ImageOptimizer(options.quantize) if options.optimize else None
+    deriver = None
+    saved = []
+    
+    def committed(batch: List[Tuple[int, str]]):
+        if journal:
+            journal.record_committed(batch)
+        if on_commit:
+            on_commit(batch)
+    
+    def failed(item_id: int):
+        nonlocal error_count
+        error_count += 1
+        if on_error:
+            on_error(item_id)
+    
+    def derive(item: Dict, base_image_url: str):
+        nonlocal deriver
+        if deriver is None:
+            deriver = MagicalVariantDeriver()
+        deriver.submit(item, base_image_url)
+    
+    with ExitStack() as stack:
+        writers: Dict[str, ImageUrlWriter] = {}
+        
+        def writer(name: str) -> ImageUrlWriter:
+            if name not in writers:
+                writers[name] = stack.enter_context(ImageUrlWriter(
+                    column=ASSET_SOURCES[name].url_column, table=ASSET_SOURCES[name].table,
+                    key=ASSET_SOURCES[name].key, on_commit=committed if name == 'items' else None))
+            return writers[name]
+        
+        def stored(item: Dict, image_url: str):
+            writer('items').add(item['item_id'], image_url)
+            saved.append((item['item_id'], image_url))
+            if renderer:
+                renderer.submit(item['item_id'], image_url)
+        
+        def finished(future):
+            nonlocal deferred, completed, error_count
+            item = futures.pop(future)
+            source = record_source(item)
+            record_id = item[source.key]
+            
+            try:
+                image_url = future.result()
+            except BudgetExhausted:
+                deferred += 1
+                if source.name == 'items':
+                    deferred += len(waiting.pop(record_id, []))
+                return
+            except Exception as e:
+                print(f"✗ Worker error: {e}")
+                image_url = None
+            
+            completed += 1
+            print(f"\n[{completed}/{planned}] Completed: {item['name']}")
+            
+            if image_url:
+                if optimizer:
+                    optimizer.submit(image_url)
+                if source.name == 'items':
+                    stored(item, image_url)
+                else:
+                    writer(source.name).add(record_id, image_url)
+            elif source.name == 'items':
+                failed(record_id)
+            else:
+                error_count += 1
+            
+            if source.name == 'items':
+                for variant in waiting.pop(record_id, []):
+                    if image_url:
+                        derive(variant, image_url)
+                    elif record_id in base_urls:
+                        derive(variant, base_urls[record_id])  # base failed; keep its previous image
+                    else:
+                        print(f"✗ No base image to derive {variant['name']} from")
+                        failed(variant['item_id'])
+        
+        def collect(wait: bool = False):
+            nonlocal derived
+            for item, image_url in deriver.completed(wait) if deriver else ():
+                if not image_url:
+                    failed(item['item_id'])
+                    continue
+                derived += 1
+                print(f"✓ Derived: {item['name']}")
+                if journal:
+                    journal.record(item['item_id'], 'saved', image_url)
+                if optimizer:
+                    optimizer.submit(image_url)
+                stored(item, image_url)
+        
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=max(1, workers)))
+        window = max(1, workers) * QUEUE_PER_WORKER
+        queue = iter(queued())
+        exhausted = False
+        
+        try:
+            while True:
+                # Keep every worker busy without materialising the whole queue as futures
+                while not exhausted and len(futures) < window:
+                    item = next(queue, StopIteration)
+                    if item is StopIteration:
+                        exhausted = True
+                    elif item is None:
+                        break
+                    else:
+                        futures[executor.submit(work, item)] = item
+                
+                for item, base_image_url in derivations:
+                    derive(item, base_image_url)
+                derivations.clear()
+                
+                if exhausted and not futures:
+                    break
+                if futures:
+                    # Wake up in time to commit a partial batch that has waited too long
+                    due = [url_writer.seconds_until_stale() for url_writer in writers.values()]
+                    timeout = min((seconds for seconds in due if seconds is not None), default=None)
+                    done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(future)
+                for url_writer in writers.values():
+                    url_writer.flush_if_stale()
+                collect()
+        except KeyboardInterrupt:
+            # Drop queued items instead of letting the pool work through them.
+            # Requests in flight still finish and are journaled as saved.
+            print("\n✗ Interrupted, waiting for in-flight requests...")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        
+        if deriver:
+            collect(wait=True)
+            deriver.shutdown()
+            metrics.count('items_derived', derived)
+            print(f"\n✓ Derived {derived} magical variants locally (no API requests)")
+    
+    limiter.save()
+    
+    if optimizer:
+        optimizer.finish()
+        if options.variants:
+            renderer = VariantRenderer()
+            for item_id, image_url in saved:
+                renderer.submit(item_id, image_url)
+    if renderer:
+        renderer.finish()
+    
+    success_count = sum(writer.written for writer in writers.values())
+    error_count += sum(writer.failed for writer in writers.values())
+    
+    metrics.count('items_succeeded', success_count)
+    metrics.count('items_failed', error_count)
+    metrics.count('throttled_responses', limiter.throttled)
+    metrics.count('items_deferred', deferred)
+    metrics.export(options.metrics_dir)
+    
+    if deferred:
+        raise BudgetExhausted(f"Run budget exhausted after {budget.requests} API requests",
+                              success_count, error_count, deferred)
+    return success_count, error_count
+
+
+def print_summary(total_items: int, success_count: int, error_count: int):
+    """Print the end-of-run summary."""
+    print("\n" + "="*80)
+    print("SUMMARY")
+    print("="*80)
+    print(f"Total items: {total_items}")
+    print(f"Success: {success_count}")
+    print(f"Errors: {error_count}")
+    print("="*80)
@@ -0,0 +1,356 @@
+"""Prompt rules and the prompt builders for every asset source."""
+
+import time
+import hashlib
+import re
+import string
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db import get_all_items
+
+# Negative prompt to avoid unwanted elements
+NEGATIVE_PROMPT = "blurry, low quality, distorted, watermark, text, people, hands, background clutter, shadows, multiple items, cluttered"
+
+# Prompt building blocks
+PROMPT_BASE = "Photorealistic medieval"
+PROMPT_QUALITY = "isolated on clean white background, professional product photography, studio lighting, highly detailed, museum quality, 8K resolution, sharp focus, no blur, no distortion, no watermark"
+
+# Prompt rules, compiled once by PromptCompiler.
+# A rule matches when its item_type matches, any of its keywords appears in the
+# lowercased item name (or it has no keywords), and any weapon_type/armor_type
+# given equals the item's. The highest priority match wins, then table order.
+# Templates may use {base}, {quality}, {name} and {description}.
+WEAPON_PHOTO = ", professional weapon photography"
+ARMOR_DISPLAY = ", displayed on mannequin or stand, professional museum display"
+GEAR_PHOTO = ", clean background, professional photography"
+
+PROMPT_RULES: List[Dict] = [
+    # Weapons
+    {'item_type': 'weapon', 'keywords': ('sword',),
+     'template': "{base} {name}, {quality}, gleaming steel blade with leather-wrapped grip and ornate crossguard" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('axe',),
+     'template': "{base} {name}, {quality}, sharp steel axe head with wooden handle" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('crossbow',),
+     'template': "{base} {name}, {quality}, mechanical crossbow with wooden stock and steel mechanism" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('bow',),
+     'template': "{base} {name}, {quality}, curved wooden bow with string" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('dagger',),
+     'template': "{base} {name}, {quality}, small sharp blade with wrapped grip" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('mace',),
+     'template': "{base} {name}, {quality}, heavy metal mace head with wooden handle" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('hammer',),
+     'template': "{base} {name}, {quality}, war hammer with steel head and wooden handle" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('spear',),
+     'template': "{base} {name}, {quality}, long wooden shaft with sharp metal spearhead" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('staff',),
+     'template': "{base} {name}, {quality}, simple wooden quarterstaff" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('pole',),
+     'template': "{base} {name}, {quality}, long polearm with metal blade on wooden shaft" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('javelin',),
+     'template': "{base} {name}, {quality}, throwing spear with metal tip" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('sling',),
+     'template': "{base} leather sling, {quality}, simple leather strap for throwing stones" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('blowgun',),
+     'template': "{base} {name}, {quality}, hollow wooden tube for shooting darts" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('club', 'blackjack'),
+     'template': "{base} {name}, {quality}, weighted club for striking" + WEAPON_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('holy water',), 'priority': 1,
+     'template': "{base} holy water vial, {quality}, blessed water in ornate glass vial" + GEAR_PHOTO},
+    {'item_type': 'weapon', 'keywords': ('oil',),
+     'template': "{base} oil flask, {quality}, glass flask containing lamp oil or burning oil" + GEAR_PHOTO},
+    {'item_type': 'weapon',
+     'template': "{base} {name} weapon, {quality}, professional weapon photography, {description}"},
+    
+    # Armor
+    {'item_type': 'armor', 'keywords': ('leather',),
+     'template': "{base} leather armor, {quality}, hardened leather cuirass with straps and buckles" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'keywords': ('chain',),
+     'template': "{base} chain mail armor, {quality}, interlocking metal rings forming protective coat" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'keywords': ('plate',),
+     'template': "{base} plate armor, {quality}, polished steel plate armor pieces" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'keywords': ('scale',),
+     'template': "{base} scale mail armor, {quality}, overlapping metal scales on leather backing" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'keywords': ('banded',),
+     'template': "{base} banded mail armor, {quality}, metal bands on leather backing" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'keywords': ('suit',),
+     'template': "{base} full plate armor suit, {quality}, complete medieval knight armor" + ARMOR_DISPLAY},
+    # Names without a material keyword (e.g. magical armor) fall back to armor_type
+    {'item_type': 'armor', 'armor_type': 'leather',
+     'template': "{base} leather armor, {quality}, hardened leather cuirass with straps and buckles" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'armor_type': 'chain',
+     'template': "{base} chain mail armor, {quality}, interlocking metal rings forming protective coat" + ARMOR_DISPLAY},
+    {'item_type': 'armor', 'armor_type': 'plate',
+     'template': "{base} plate armor, {quality}, polished steel plate armor pieces" + ARMOR_DISPLAY},
+    {'item_type': 'armor',
+     'template': "{base} {name}, {quality}, protective armor piece" + ARMOR_DISPLAY},
+    
+    # Shields
+    {'item_type': 'shield',
+     'template': "{base} {name}, {quality}, wooden shield with metal boss and leather straps, displayed on stand, professional museum display"},
+    
+    # Gear
+    {'item_type': 'gear', 'keywords': ('rope',),
+     'template': "{base} coiled hemp rope, {quality}, thick twisted rope coil" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('torch',),
+     'template': "{base} wooden torch with flames, {quality}, wooden handle with burning oil-soaked cloth, warm firelight" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('backpack',),
+     'template': "{base} leather backpack, {quality}, brown leather adventuring pack with straps and buckles" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('bedroll',),
+     'template': "{base} bedroll, {quality}, rolled sleeping blanket tied with leather straps" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('tinderbox', 'flint'),
+     'template': "{base} tinderbox with flint and steel, {quality}, small wooden box with flint stone and steel striker and dry tinder" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('waterskin', 'wineskin'),
+     'template': "{base} leather waterskin, {quality}, leather water container with cork stopper" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('rations',),
+     'template': "{base} travel rations, {quality}, dried food provisions in cloth wrapping" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('lantern',),
+     'template': "{base} {name}, {quality}, metal lantern with glass panes and oil reservoir" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('pouch',),
+     'template': "{base} leather pouch, {quality}, small leather belt pouch with drawstring" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('sack',),
+     'template': "{base} {name}, {quality}, large cloth or burlap sack" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('flask', 'vial'),
+     'template': "{base} glass {name}, {quality}, small glass container with cork stopper" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('holy water',), 'priority': 1,
+     'template': "{base} holy water vial, {quality}, blessed water in ornate glass vial" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('holy',),
+     'template': "{base} holy symbol, {quality}, ornate religious symbol on chain" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('mirror',),
+     'template': "{base} hand mirror, {quality}, polished metal mirror in decorative frame" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('crowbar',),
+     'template': "{base} iron crowbar, {quality}, heavy iron prying tool" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('spike',),
+     'template': "{base} iron spikes, {quality}, metal pitons for climbing" + GEAR_PHOTO},
+    {'item_type': 'gear', 'keywords': ('grappling',),
+     'template': "{base} grappling hook, {quality}, metal hook with rope attached" + GEAR_PHOTO},
+    {'item_type': 'gear',
+     'template': "{base} {name}, {quality}, adventuring gear equipment" + GEAR_PHOTO},
+    
+    # Consumables
+    {'item_type': 'consumable', 'keywords': ('holy water',), 'priority': 1,
+     'template': "{base} holy water vial, {quality}, blessed water in ornate glass vial" + GEAR_PHOTO},
+    {'item_type': 'consumable', 'keywords': ('oil',),
+     'template': "{base} oil flask, {quality}, glass flask containing lamp oil or burning oil" + GEAR_PHOTO},
+    {'item_type': 'consumable', 'keywords': ('potion',),
+     'template': "{base} {name}, {quality}, glass vial with magical liquid" + GEAR_PHOTO},
+    {'item_type': 'consumable',
+     'template': "{base} {name}, {quality}, clean background, professional photography, {description}"},
+    
+    # Default fallback for any other item type
+    {'template': "{base} {name}, {quality}, medieval equipment item, clean background, professional photography, {description}"},
+]
+
+# Prompts for the other asset sources
+MONSTER_PROMPT = ("Photorealistic medieval fantasy creature, {name}, {monster_type}, {description}, "
+                  "in its natural {terrain} habitat, full body, dramatic lighting, highly detailed, sharp focus")
+MONSTER_NEGATIVE_PROMPT = "blurry, low quality, distorted, watermark, text, multiple creatures, cropped"
+TERRAIN_PROMPT = ("Top-down view of {name} terrain for a fantasy hex map tile, seamless natural texture, "
+                  "painterly style, soft even lighting, no borders, no text")
+TERRAIN_NEGATIVE_PROMPT = "blurry, low quality, watermark, text, people, buildings, borders, perspective view"
+PORTRAIT_NEGATIVE_PROMPT = "blurry, low quality, distorted, watermark, text, multiple people, deformed hands"
+# Must match buildPortraitPrompt() in api/character/generate-portrait.php
+PORTRAIT_CLASS_DESCRIPTIONS = {
+    'fighter': 'warrior in armor',
+    'magic_user': 'wizard with robes and mystical aura',
+    'cleric': 'holy priest with religious symbols',
+    'thief': 'rogue with leather armor and daggers',
+    'dwarf': 'stout dwarven warrior with beard',
+    'elf': 'elegant elven adventurer with pointed ears',
+    'halfling': 'small halfling with cheerful expression',
+    'druid': 'nature priest with wooden staff and natural clothing',
+    'mystic': 'martial artist monk in simple robes'
+}
+
+
+
+class PromptCompiler:
+    """
+    Compiles PROMPT_RULES into one keyword regex per item type.
+    A prompt is built in a single scan of the lowercased name: every keyword
+    found selects its rules, field rules (weapon_type/armor_type) are checked
+    directly, and the highest priority rule wins, ties going to the earlier
+    rule in the table. At any position the longest keyword matches first, so
+    'crossbow' is never read as 'bow' and 'holy water' never as 'holy'.
+    """
+    
+    def __init__(self, rules: List[Dict]):
+        keyword_rules: Dict[Optional[str], Dict[str, List[Tuple]]] = {}
+        unconditional: Dict[Optional[str], List[Tuple]] = {}
+        
+        for index, rule in enumerate(rules):
+            fields = tuple((field, rule[field]) for field in ('weapon_type', 'armor_type') if field in rule)
+            compiled = ((-rule.get('priority', 0), index), self._compile_template(rule['template']), fields)
+            
+            item_type = rule.get('item_type')
+            if rule.get('keywords'):
+                for keyword in rule['keywords']:
+                    keyword_rules.setdefault(item_type, {}).setdefault(keyword, []).append(compiled)
+            else:
+                unconditional.setdefault(item_type, []).append(compiled)
+        
+        # item_type -> (keyword regex, {keyword: rules by rank}, unconditional rules by rank)
+        self.types: Dict[Optional[str], Tuple] = {}
+        for item_type in set(keyword_rules) | set(unconditional):
+            by_keyword = {k: sorted(v) for k, v in keyword_rules.get(item_type, {}).items()}
+            keywords = sorted(by_keyword, key=len, reverse=True)
+            pattern = re.compile('|'.join(re.escape(k) for k in keywords)) if keywords else None
+            self.types[item_type] = (pattern, by_keyword, sorted(unconditional.get(item_type, [])))
+    
+    @staticmethod
+    def _compile_template(template: str):
+        """
+        Turn a template into a function of (name, description).
+        Base and quality are filled in once, and the template is pre-split
+        into (literal, field) pairs, so building a prompt is one join instead
+        of a format() parse of the whole template per item.
+        """
+        template = template.replace('{base}', PROMPT_BASE).replace('{quality}', PROMPT_QUALITY)
+        pairs = [(literal, field) for literal, field, _, _ in string.Formatter().parse(template)]
+        unknown = {field for _, field in pairs if field not in (None, 'name', 'description')}
+        if unknown:
+            raise ValueError(f"Unknown prompt template fields: {', '.join(sorted(unknown))}")
+        
+        def build(name: str, description: str) -> str:
+            values = {None: '', 'name': name, 'description': description}
+            return ''.join([literal + values[field] for literal, field in pairs])
+        return build
+    
+    def _match(self, item_type: Optional[str], name: str, item: Dict) -> Optional[Tuple]:
+        compiled = self.types.get(item_type)
+        if compiled is None:
+            return None
+        
+        pattern, by_keyword, unconditional = compiled
+        best = None
+        
+        if pattern is not None:
+            for keyword in pattern.findall(name):
+                for rule in by_keyword[keyword]:
+                    if best is not None and rule[0] >= best[0]:
+                        break
+                    if not rule[2] or all(item.get(f) == v for f, v in rule[2]):
+                        best = rule
+                        break
+        
+        for rule in unconditional:
+            if best is not None and rule[0] >= best[0]:
+                break
+            if not rule[2] or all(item.get(f) == v for f, v in rule[2]):
+                best = rule
+                break
+        
+        return best
+    
+    def compile(self, item: Dict) -> str:
+        """Build the prompt for one item."""
+        name = item['name']
+        lowered = name.lower()
+        
+        # Rules without an item_type apply when nothing type-specific matched
+        rule = self._match(item['item_type'], lowered, item) or self._match(None, lowered, item)
+        
+        return rule[1](name, item.get('description') or '')
+
+
+_prompt_compiler = PromptCompiler(PROMPT_RULES)
+
+
+def generate_prompt(item: Dict) -> str:
+    """
+    Generate detailed prompt for equipment image.
+    This is where we have full control over image generation: edit
+    PROMPT_RULES to change what each kind of item looks like.
+    """
+    return _prompt_compiler.compile(item)
+
+
+def compile_prompts(items: Iterable[Dict]) -> List[str]:
+    """Generate prompts for many items at once (previews, diffs, bulk runs)."""
+    compile_item = _prompt_compiler.compile
+    return [compile_item(item) for item in items]
+
+
+def preview_prompts():
+    """Print item_id and prompt for the whole catalog, one per line (diffable)."""
+    items = get_all_items()
+    for item, prompt in zip(items, compile_prompts(items)):
+        print(f"{item['item_id']}\t{prompt}")
+
+
+def synthetic_catalog(count: int, seed: int = 0) -> List[Dict]:
+    """Build a reproducible catalog of fake items exercising every prompt rule."""
+    rng = random.Random(seed)
+    keywords = sorted({k for rule in PROMPT_RULES for k in rule.get('keywords', ())}) + ['trinket', 'relic']
+    item_types = ['weapon', 'armor', 'shield', 'gear', 'consumable', 'treasure']
+    adjectives = ['Rusty', 'Elven', 'Dwarven', 'Fine', 'Heavy', 'Light', 'Ornate', 'Cursed']
+    
+    return [
+        {
+            'item_id': i,
+            'name': f"{rng.choice(adjectives)} {rng.choice(keywords).title()} +{rng.randint(0, 5)}",
+            'description': "Synthetic benchmark item",
+            'item_type': rng.choice(item_types),
+            'weapon_type': rng.choice(['melee', 'ranged', 'thrown']),
+            'armor_type': rng.choice(['leather', 'chain', 'plate', 'shield'])
+        }
+        for i in range(count)
+    ]
+
+
+def benchmark_prompts(count: int = 100000):
+    """Measure compile_prompts() throughput over a synthetic catalog."""
+    items = synthetic_catalog(count)
+    
+    start = time.perf_counter()
+    prompts = compile_prompts(items)
+    elapsed = time.perf_counter() - start
+    
+    print(f"✓ Compiled {len(prompts)} prompts in {elapsed:.3f}s "
+          f"({len(prompts) / elapsed:,.0f} prompts/second)")
+
+
+
+def first_sentence(text: Optional[str]) -> str:
+    """First sentence of a description, to keep long text out of prompts."""
+    return re.split(r'(?<=[.!?])\s', (text or '').strip(), maxsplit=1)[0].rstrip('.')
+
+
+def monster_prompt(monster: Dict) -> str:
+    """Build the prompt for a monster image."""
+    return MONSTER_PROMPT.format(name=monster['name'], monster_type=monster.get('monster_type') or 'monster',
+                                 description=first_sentence(monster.get('description')),
+                                 terrain=(monster.get('terrain') or 'wilderness').lower())
+
+
+def portrait_prompt(character: Dict) -> str:
+    """Port of buildPortraitPrompt() in api/character/generate-portrait.php."""
+    parts = ["Fotorealistic Medieval Low-fantasy realistic gritty character portrait"]
+    if character.get('gender'):
+        parts.append(character['gender'])
+    if character.get('class') in PORTRAIT_CLASS_DESCRIPTIONS:
+        parts.append(PORTRAIT_CLASS_DESCRIPTIONS[character['class']])
+    if character.get('hair_color'):
+        parts.append(f"with {character['hair_color'].lower()} hair")
+    if character.get('eye_color'):
+        parts.append(f"{character['eye_color'].lower()} eyes")
+    if character.get('age'):
+        if int(character['age']) < 20:
+            parts.append("youthful appearance")
+        elif int(character['age']) > 50:
+            parts.append("mature and weathered")
+    parts += ["fotorealistic style", "detailed face", "dramatic lighting", "dungeons and dragons character"]
+    if character.get('backstory'):
+        parts.append(f"backstory {character['backstory']}".lower())
+    return ", ".join(parts)
+
+
+def terrain_prompt(terrain: Dict) -> str:
+    """Build the prompt for a terrain icon."""
+    return TERRAIN_PROMPT.format(name=terrain['name'])
+
+
+
+def prompt_hash(item: Dict) -> str:
+    """Fingerprint of everything about an item that shapes its image."""
+    return hashlib.sha256(generate_prompt(item).encode('utf-8')).hexdigest()
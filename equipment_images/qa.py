@@ -0,0 +1,267 @@
+"""Batched image quality checks, used by the qa command and to rank candidates."""
+
+import os
+import time
+import json
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .config import (QA_SIZE, QA_BORDER, QA_WHITE_LEVEL, QA_MAX_WHITE, QA_MIN_STD, QA_CLUTTER_Z,
+                     QA_DUPLICATE_DISTANCE, QA_REPORT, CANDIDATE_SIZE, CANDIDATE_WEIGHTS)
+from .util import confirm, require_pillow
+from .files import AtomicFile, atomic_copy, url_to_path
+from .metrics import get_run_metrics
+from .db import get_all_items, ImageUrlWriter
+from .prompts import generate_prompt
+from .api import RunBudget, AdaptiveThrottle
+from .cache import GenerationCache, get_generation_cache
+from .sources import build_payload
+from .backends import ImageBackend
+from .derive import is_derivable
+
+
+def load_qa_image(path: Path, size: int = QA_SIZE):
+    """Decode an image straight to a size x size RGB array."""
+    import numpy as np
+    from PIL import Image
+    
+    with Image.open(path) as image:
+        # JPEGs are decoded at reduced scale by the DCT itself
+        image.draft('RGB', (size * 2, size * 2))
+        return np.asarray(image.convert('RGB').resize((size, size), Image.BILINEAR))
+
+
+def perceptual_hashes(grey):
+    """
+    63-bit DCT perceptual hashes for a batch of square grey images.
+    Each image is pooled to 32x32 and transformed with one batched matrix
+    product; the lowest 8x8 frequencies (minus DC) are compared to their median.
+    """
+    import numpy as np
+    
+    count, size = grey.shape[0], grey.shape[1]
+    pooled = grey.reshape(count, 32, size // 32, 32, size // 32).mean(axis=(2, 4))
+    
+    n = np.arange(32)
+    dct = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / 64)
+    low = np.einsum('kn,inm,lm->ikl', dct, pooled, dct)[:, :8, :8].reshape(count, 64)[:, 1:]
+    return low > np.median(low, axis=1, keepdims=True)
+
+
+def image_quality_metrics(batch) -> Dict:
+    """
+    Score a batch of images (N x QA_SIZE x QA_SIZE x 3, uint8) in one pass.
+    Returns arrays of per-image background whiteness, white fraction, grey
+    level spread and border detail (edge energy in the background ring),
+    plus the perceptual hash bits.
+    """
+    import numpy as np
+    
+    pixels = batch.astype(np.float32) / 255
+    grey = pixels.mean(axis=3)
+    white = pixels.min(axis=3) > QA_WHITE_LEVEL
+    
+    border = np.zeros((QA_SIZE, QA_SIZE), dtype=bool)
+    border[:QA_BORDER] = border[-QA_BORDER:] = True
+    border[:, :QA_BORDER] = border[:, -QA_BORDER:] = True
+    
+    edges = np.abs(np.diff(grey, axis=2))[:, :-1, :] + np.abs(np.diff(grey, axis=1))[:, :, :-1]
+    
+    return {
+        'background_whiteness': white[:, border].mean(axis=1),
+        'white_fraction': white.reshape(len(batch), -1).mean(axis=1),
+        'std': grey.reshape(len(batch), -1).std(axis=1),
+        'border_detail': edges[:, border[:-1, :-1]].mean(axis=1),
+        'hashes': perceptual_hashes(grey)
+    }
+
+
+def score_candidates(paths: List[Path]) -> List[float]:
+    """
+    Score candidate images for one prompt in a single batch, higher is better.
+    Candidates are decoded at CANDIDATE_SIZE and block-averaged to QA_SIZE for
+    the QA metrics. Each criterion is in [0, 1] and weighted by
+    CANDIDATE_WEIGHTS: background (white border ring), centred (subject
+    centroid near the middle) and sharpness (Laplacian variance relative to
+    the sharpest candidate). Blank frames and unreadable files score -inf.
+    """
+    import numpy as np
+    
+    images, readable = [], []
+    for path in paths:
+        try:
+            images.append(load_qa_image(path, CANDIDATE_SIZE))
+            readable.append(True)
+        except (OSError, ValueError):
+            images.append(np.zeros((CANDIDATE_SIZE, CANDIDATE_SIZE, 3), dtype=np.uint8))
+            readable.append(False)
+    batch = np.stack(images)
+    
+    block = CANDIDATE_SIZE // QA_SIZE
+    small = batch.reshape(len(paths), QA_SIZE, block, QA_SIZE, block, 3).mean(axis=(2, 4)).astype(np.uint8)
+    metrics = image_quality_metrics(small)
+    
+    # Subject = non-white pixels; its centroid's distance from the centre, in half-widths
+    subject = small.min(axis=3) / 255 <= QA_WHITE_LEVEL
+    area = subject.sum(axis=(1, 2))
+    ys, xs = np.mgrid[0:QA_SIZE, 0:QA_SIZE]
+    centre = (QA_SIZE - 1) / 2
+    cy = (subject * ys).sum(axis=(1, 2)) / np.maximum(area, 1) - centre
+    cx = (subject * xs).sum(axis=(1, 2)) / np.maximum(area, 1) - centre
+    centred = np.clip(1 - np.hypot(cy, cx) / (QA_SIZE / 2), 0, 1) * (area > 0)
+    
+    grey = batch.astype(np.float32).mean(axis=3)
+    laplacian = (4 * grey[:, 1:-1, 1:-1] - grey[:, :-2, 1:-1] - grey[:, 2:, 1:-1]
+                 - grey[:, 1:-1, :-2] - grey[:, 1:-1, 2:])
+    sharpness = laplacian.reshape(len(paths), -1).var(axis=1)
+    sharpness = sharpness / max(sharpness.max(), 1e-9)
+    
+    weights = CANDIDATE_WEIGHTS
+    scores = (weights['background'] * metrics['background_whiteness']
+              + weights['centred'] * centred
+              + weights['sharpness'] * sharpness)
+    blank = (metrics['std'] < QA_MIN_STD) | (metrics['white_fraction'] > QA_MAX_WHITE)
+    scores[blank | ~np.array(readable)] = -np.inf
+    return scores.tolist()
+
+
+def generate_candidates(backend: 'ImageBackend', payload: Dict, record: Dict, api_key: str,
+                        filepath: Path, cache_key: str, count: int,
+                        limiter: Optional['AdaptiveThrottle'] = None,
+                        budget: Optional[RunBudget] = None) -> List[float]:
+    """
+    Request count images for payload in one call, write the best to
+    filepath and cache it under cache_key with the runners-up. Returns the
+    candidates' scores, best first.
+    """
+    cache = get_generation_cache()
+    with tempfile.TemporaryDirectory(dir=cache.cache_dir, prefix='candidates-') as tmp:
+        paths = [Path(tmp) / f"{i}.png" for i in range(count)]
+        backend.generate(dict(payload, n=count), record, api_key, paths, limiter, budget)
+        paths = [path for path in paths if path.is_file() and path.stat().st_size]
+        if not paths:
+            raise ValueError("No images in response")
+        
+        with get_run_metrics().time('score'):
+            scores = score_candidates(paths)
+        ranked = sorted(zip(scores, paths), key=lambda sp: sp[0], reverse=True)
+        atomic_copy(ranked[0][1], filepath)
+        cache.put(cache_key, filepath, payload['prompt'], alternates=[path for _, path in ranked[1:]])
+        return [score for score, _ in ranked]
+
+
+def qa_images(dry_run: bool = False, assume_yes: bool = False):
+    """
+    Find failed generations across all equipment images and requeue them.
+    All images are loaded downscaled into one NumPy batch and checked
+    together for unreadable files, blank or near-white frames, cluttered
+    backgrounds (border detail far above the rest of the set) and
+    near-duplicates of another item's image (perceptual hash distance; a
+    base item and its magical variants may match). Offenders have their
+    image_url cleared and their cache entry dropped (or replaced by its best
+    runner-up candidate), so the next generate run makes fresh images for
+    exactly those items; a flagged derived variant takes its base item with it.
+    """
+    print("="*80)
+    print("EQUIPMENT IMAGE QA")
+    print("="*80)
+    
+    require_pillow("for image QA", numpy=True)
+    import numpy as np
+    
+    start = time.perf_counter()
+    items = [item for item in get_all_items()
+             if item.get('image_url') and url_to_path(item['image_url']).is_file()]
+    
+    if not items:
+        print("No images to check.")
+        return
+    
+    def load(item: Dict):
+        # Truncated or undecodable files are failed generations too
+        try:
+            return load_qa_image(url_to_path(item['image_url']))
+        except (OSError, ValueError):
+            return None
+    
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        images = list(executor.map(load, items))
+    loaded = time.perf_counter()
+    
+    readable = np.array([image is not None for image in images])
+    reasons: Dict[int, List[str]] = {i: ['unreadable'] for i in np.flatnonzero(~readable)}
+    blank_image = np.zeros((QA_SIZE, QA_SIZE, 3), dtype=np.uint8)
+    metrics = image_quality_metrics(np.stack([blank_image if image is None else image for image in images]))
+    
+    blank = (metrics['white_fraction'] >= QA_MAX_WHITE) | (metrics['std'] < QA_MIN_STD)
+    for i in np.flatnonzero(blank & readable):
+        reasons.setdefault(i, []).append('blank')
+    
+    detail = metrics['border_detail']
+    median = np.median(detail[readable]) if readable.any() else 0.0
+    spread = np.median(np.abs(detail[readable] - median)) if readable.any() else 0.0
+    for i in np.flatnonzero(((detail - median) / (spread or 1e-9) >= QA_CLUTTER_Z) & readable):
+        reasons.setdefault(i, []).append('cluttered')
+    
+    # Pairwise Hamming distances of all hashes as two matrix products
+    bits = metrics['hashes'].astype(np.float32)
+    distances = bits @ (1 - bits).T + (1 - bits) @ bits.T
+    keys = [GenerationCache.key(build_payload(generate_prompt(item))) for item in items]
+    families = [item.get('base_item_id') or item['item_id'] for item in items]
+    close = (distances <= QA_DUPLICATE_DISTANCE) & readable[:, None] & readable[None, :]
+    for i, j in zip(*np.nonzero(np.triu(close, k=1))):
+        # Items sharing a prompt or a file, and magical variants of one base item, are meant to look the same
+        if (keys[i] != keys[j] and items[i]['image_url'] != items[j]['image_url']
+                and families[i] != families[j]):
+            reasons.setdefault(j, []).append(f"duplicate of {items[i]['item_id']}")
+    
+    elapsed = time.perf_counter() - start
+    print(f"✓ Checked {len(items)} images in {elapsed:.2f}s (loading {loaded - start:.2f}s)")
+    
+    report = []
+    for i, why in sorted(reasons.items()):
+        item = items[i]
+        entry = {
+            'item_id': item['item_id'],
+            'name': item['name'],
+            'image_url': item['image_url'],
+            'reasons': why
+        }
+        if readable[i]:
+            entry.update({
+                'background_whiteness': round(float(metrics['background_whiteness'][i]), 3),
+                'white_fraction': round(float(metrics['white_fraction'][i]), 3),
+                'std': round(float(metrics['std'][i]), 4),
+                'border_detail': round(float(detail[i]), 4)
+            })
+        report.append(entry)
+        print(f"  ✗ {item['name']} (ID: {item['item_id']}): {', '.join(why)}")
+    
+    with AtomicFile(QA_REPORT) as f:
+        f.write(json.dumps({'checked': len(items), 'flagged': report}, indent=2).encode('utf-8'))
+    print(f"\n✓ {len(report)} of {len(items)} images flagged, report written to {QA_REPORT}")
+    
+    if not report or dry_run:
+        return
+    
+    # A derived variant is re-derived from the same base image, so its base has to be regenerated
+    index = {item['item_id']: i for i, item in enumerate(items)}
+    requeue = set(reasons)
+    for i in reasons:
+        base = index.get(items[i].get('base_item_id'))
+        if is_derivable(items[i]) and base is not None and base not in requeue:
+            requeue.add(base)
+            print(f"  ↻ {items[base]['name']} (ID: {items[base]['item_id']}): base of {items[i]['name']}")
+    
+    if not confirm(f"\nRequeue {len(requeue)} items for regeneration? (y/n): ", assume_yes):
+        print("Cancelled.")
+        return
+    
+    cache = get_generation_cache()
+    with ImageUrlWriter(batch_size=len(requeue), flush_interval=float('inf')) as writer:
+        for i in sorted(requeue):
+            cache.discard(keys[i])
+            writer.add(items[i]['item_id'], None)
+    print("Run generate to create new images for them.")
@@ -0,0 +1,105 @@
+"""The reconcile command: image_url values checked against the files on disk."""
+
+import os
+import time
+from typing import Dict, List, Optional
+
+from .files import legacy_image_filenames, get_image_path, url_to_path, scan_equipment_images
+from .db import get_db_connection, ImageUrlWriter
+from .variants import get_variant_urls
+
+
+def reconcile_images(dry_run: bool = False):
+    """
+    Bring items.image_url in line with the files on disk, without any API calls.
+    One directory scan and one query are compared with set operations:
+    broken or wrong-item URLs are re-pointed to the item's own image (the
+    canonical file if present, else the newest), images nobody links to are
+    linked, and URLs with no image left are cleared so generate picks them
+    up again. Images still named by an older generator's filename rule are
+    renamed (with their size variants) to the canonical name, so the next
+    generate overwrites them instead of leaving them behind. All fixes are
+    written in one bulk UPDATE. Files that no item points to are reported
+    as orphans but never deleted.
+    """
+    print("="*80)
+    print("RECONCILE EQUIPMENT IMAGES")
+    print("="*80)
+    
+    start = time.perf_counter()
+    on_disk = scan_equipment_images()
+    
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT item_id, name, item_type, image_url FROM items ORDER BY item_id")
+    items = cursor.fetchall()
+    cursor.close()
+    
+    # Newest first, so candidates[0] is the most recent image of an item
+    files_by_item: Dict[int, List[str]] = {}
+    for url, (item_id, _) in sorted(on_disk.items(), key=lambda entry: -entry[1][1]):
+        if item_id is not None:
+            files_by_item.setdefault(item_id, []).append(url)
+    
+    # URLs are stored both with and without the leading slash
+    item_ids = {item['item_id'] for item in items}
+    current = {item['item_id']: '/' + item['image_url'].lstrip('/')
+               for item in items if item['image_url']}
+    managed = {item_id for item_id, url in current.items() if url.startswith('/images/equipment/')}
+    valid = {item_id for item_id in managed
+             if current[item_id] in on_disk and on_disk[current[item_id]][0] in (item_id, None)}
+    
+    broken = managed - valid
+    unlinked = (item_ids - set(current)) & set(files_by_item)
+    
+    to_fix = broken | unlinked
+    fixes: Dict[int, Optional[str]] = {}
+    renames: Dict[int, str] = {}  # item_id -> current URL of a file to move to the canonical name
+    for item in items:
+        canonical = get_image_path(item)[1]
+        if item['item_id'] in to_fix:
+            candidates = files_by_item.get(item['item_id'], [])
+            fixes[item['item_id']] = canonical if canonical in candidates else next(iter(candidates), None)
+        elif (item['item_id'] in valid and canonical not in on_disk
+              and current[item['item_id']].rsplit('/', 1)[1] in legacy_image_filenames(item)):
+            renames[item['item_id']] = current[item['item_id']]
+            fixes[item['item_id']] = canonical
+    
+    cleared = {item_id for item_id, url in fixes.items() if url is None}
+    linked = {url for item_id, url in current.items() if item_id not in fixes} | set(fixes.values())
+    orphaned = {url for url, (item_id, _) in on_disk.items() if item_id is not None} - linked
+    unknown = {url for url in orphaned if on_disk[url][0] not in item_ids}
+    elapsed = time.perf_counter() - start
+    
+    print(f"✓ {len(on_disk)} files, {len(items)} items compared in {elapsed * 1000:.1f} ms")
+    print(f"  OK:         {len(valid) - len(renames)}")
+    print(f"  Re-pointed: {len(broken - cleared)} (URL pointed at a missing or another item's file)")
+    print(f"  Linked:     {len(unlinked)} (image on disk but no URL)")
+    print(f"  Renamed:    {len(renames)} (old filename scheme; moved to the canonical name)")
+    print(f"  Missing:    {len(cleared)} (URL cleared; run generate to create)")
+    print(f"  Orphaned:   {len(orphaned)} files not referenced by any item "
+          f"({len(unknown)} for items that no longer exist)")
+    for url in sorted(orphaned)[:10]:
+        print(f"    {url}")
+    if len(orphaned) > 10:
+        print(f"    ... and {len(orphaned) - 10} more")
+    
+    if not fixes:
+        print("\nNothing to fix.")
+        return
+    if dry_run:
+        print(f"\nDry run: {len(fixes)} items would be updated.")
+        return
+    
+    # Files first: if the update fails, the next reconcile re-points the URLs to the renamed files
+    for item_id, url in renames.items():
+        old_variants, new_variants = get_variant_urls(url), get_variant_urls(fixes[item_id])
+        os.replace(url_to_path(url), url_to_path(fixes[item_id]))
+        for size, formats in old_variants.items():
+            for fmt, variant_url in formats.items():
+                if url_to_path(variant_url).exists():
+                    os.replace(url_to_path(variant_url), url_to_path(new_variants[size][fmt]))
+    
+    with ImageUrlWriter(batch_size=len(fixes), flush_interval=float('inf')) as writer:
+        for item_id, url in sorted(fixes.items()):
+            writer.add(item_id, url)
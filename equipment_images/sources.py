@@ -0,0 +1,145 @@
+"""Asset sources: the kinds of image the engine generates."""
+
+import itertools
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import (MONSTER_IMAGE_DIR, PORTRAIT_DIR, PORTRAIT_SIZE, TERRAIN_ICON_DIR, TERRAIN_TYPES, MODEL,
+                     DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_STEPS)
+from .files import sanitize_filename, get_image_path
+from .db import get_items_without_images, get_all_items, fetch_table
+from .prompts import (NEGATIVE_PROMPT, MONSTER_NEGATIVE_PROMPT, TERRAIN_NEGATIVE_PROMPT,
+                      PORTRAIT_NEGATIVE_PROMPT, generate_prompt, monster_prompt, portrait_prompt,
+                      terrain_prompt)
+
+
+def build_payload(prompt: str, width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT,
+                  negative_prompt: str = NEGATIVE_PROMPT) -> Dict:
+    """Build the API request payload for a prompt."""
+    return {
+        "model": MODEL,
+        "prompt": prompt,
+        "width": width,
+        "height": height,
+        "steps": DEFAULT_STEPS,
+        "n": 1,
+        "response_format": "b64_json",
+        "negative_prompt": negative_prompt
+    }
+
+
+class AssetSource:
+    """
+    One kind of image the engine generates.
+    A source fetches its records (missing images only, or all), builds each
+    record's prompt and (file path, URL), and names the table and column its
+    URLs are stored in (no table for file-only sources). Fetched records are
+    tagged with 'source', so one run can mix records of several sources.
+    """
+    
+    def __init__(self, name: str, key: str, fetch: Callable[[bool], List[Dict]],
+                 prompt: Callable[[Dict], str], image_path: Callable[[Dict], Tuple[Path, str]],
+                 table: Optional[str] = None, url_column: str = 'image_url',
+                 width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT,
+                 negative_prompt: str = NEGATIVE_PROMPT):
+        self.name = name
+        self.key = key
+        self._fetch = fetch
+        self.prompt = prompt
+        self.image_path = image_path
+        self.table = table
+        self.url_column = url_column
+        self.width = width
+        self.height = height
+        self.negative_prompt = negative_prompt
+    
+    def fetch(self, missing_only: bool = True) -> List[Dict]:
+        """Fetch this source's records, tagged with the source name."""
+        records = self._fetch(missing_only)
+        for record in records:
+            record['source'] = self.name
+        return records
+    
+    def payload(self, record: Dict) -> Dict:
+        """Build the API request payload for a record."""
+        return build_payload(self.prompt(record), self.width, self.height, self.negative_prompt)
+
+
+def fetch_items(missing_only: bool) -> List[Dict]:
+    """Items without images, or all items."""
+    return get_items_without_images() if missing_only else get_all_items()
+
+
+
+def fetch_monsters(missing_only: bool) -> List[Dict]:
+    """Monsters without images (migration 034), or all monsters."""
+    return fetch_table(f"""
+        SELECT monster_id, name, description, monster_type, terrain, image_url
+        FROM monsters
+        {"WHERE image_url IS NULL OR image_url = ''" if missing_only else ""}
+        ORDER BY monster_id
+    """)
+
+
+def fetch_portraits(missing_only: bool) -> List[Dict]:
+    """Active characters without a portrait, or all active characters."""
+    return fetch_table(f"""
+        SELECT character_id, character_name AS name, class, gender, age,
+               hair_color, eye_color, background AS backstory, portrait_url
+        FROM characters
+        WHERE is_active = 1
+        {"AND (portrait_url IS NULL OR portrait_url = '')" if missing_only else ""}
+        ORDER BY character_id
+    """)
+
+
+def fetch_terrain(missing_only: bool) -> List[Dict]:
+    """Hex map terrain types whose icon file is missing, or all of them."""
+    records = [{'terrain': terrain, 'name': terrain.replace('-', ' ')} for terrain in TERRAIN_TYPES]
+    if missing_only:
+        records = [record for record in records if not terrain_image_path(record)[0].exists()]
+    return records
+
+
+
+def monster_image_path(monster: Dict) -> Tuple[Path, str]:
+    """Return (file path, relative URL) for a monster's image."""
+    filename = f"monster_{monster['monster_id']}_{sanitize_filename(monster['name'])}.png"
+    return MONSTER_IMAGE_DIR / filename, f"/images/monsters/{filename}"
+
+
+def portrait_image_path(character: Dict) -> Tuple[Path, str]:
+    """
+    Return (file path, relative URL) for a character portrait. Portrait URLs
+    have no leading slash, as PortraitManager stores and deletes them.
+    """
+    filename = f"portrait_{character['character_id']}_{sanitize_filename(character['name'])}.png"
+    return PORTRAIT_DIR / filename, f"images/portraits/{filename}"
+
+
+def terrain_image_path(terrain: Dict) -> Tuple[Path, str]:
+    """Return (file path, relative URL) for a terrain icon, the name hex-map-editor.js loads."""
+    filename = f"{terrain['terrain']}.png"
+    return TERRAIN_ICON_DIR / filename, f"/images/terrain-icons/{filename}"
+
+
+ASSET_SOURCES: Dict[str, AssetSource] = {
+    'items': AssetSource('items', 'item_id', fetch_items, generate_prompt, get_image_path, table='items'),
+    'monsters': AssetSource('monsters', 'monster_id', fetch_monsters, monster_prompt, monster_image_path,
+                            table='monsters', negative_prompt=MONSTER_NEGATIVE_PROMPT),
+    'portraits': AssetSource('portraits', 'character_id', fetch_portraits, portrait_prompt, portrait_image_path,
+                             table='characters', url_column='portrait_url', width=PORTRAIT_SIZE,
+                             height=PORTRAIT_SIZE, negative_prompt=PORTRAIT_NEGATIVE_PROMPT),
+    'terrain': AssetSource('terrain', 'terrain', fetch_terrain, terrain_prompt, terrain_image_path,
+                           negative_prompt=TERRAIN_NEGATIVE_PROMPT),
+}
+
+
+def record_source(record: Dict) -> AssetSource:
+    """The source a record came from; untagged records are items."""
+    return ASSET_SOURCES[record.get('source', 'items')]
+
+
+def interleave_sources(queues: Iterable[List[Dict]]) -> List[Dict]:
+    """Merge per-source queues round-robin, keeping each queue's own order."""
+    return [record for batch in itertools.zip_longest(*queues) for record in batch if record is not None]
@@ -0,0 +1,163 @@
+"""Incremental sync driven by an updated_at watermark."""
+
+import time
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import SYNC_STATE_FILE, SYNC_PAGE_SIZE, SYNC_OVERLAP
+from .files import AtomicFile
+from .db import get_db_connection, get_items_by_ids
+from .prompts import prompt_hash
+from .backends import get_api_key
+from .journal import ProgressJournal
+from .pipeline import RunOptions, run_generation, print_summary
+
+
+def iter_changed_items(since: Optional[str] = None, page_size: int = SYNC_PAGE_SIZE) -> Iterable[Dict]:
+    """
+    Yield items updated at or after since (all items if None), oldest first.
+    Rows are read by keyset pagination on (updated_at, item_id), each page
+    streamed from an unbuffered cursor, so memory stays flat and no page
+    re-scans the rows before it.
+    """
+    conn = get_db_connection()
+    last = None
+    
+    while True:
+        conditions, params = [], []
+        if since:
+            conditions.append("updated_at >= %s")
+            params.append(since)
+        if last:
+            conditions.append("(updated_at > %s OR (updated_at = %s AND item_id > %s))")
+            params += [last[0], last[0], last[1]]
+        
+        query = f"""
+            SELECT item_id, name, description, item_type, item_category, 
+                   weapon_type, armor_type, size_category, base_item_id,
+                   is_magical, magical_bonus, magical_properties, image_url, updated_at
+            FROM items 
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY updated_at, item_id
+            LIMIT %s
+        """
+        
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params + [page_size])
+        rows = 0
+        for item in cursor:
+            rows += 1
+            last = (item['updated_at'], item['item_id'])
+            yield item
+        cursor.close()
+        
+        if rows < page_size:
+            return
+
+
+def load_sync_state() -> Dict:
+    """Load the watermark, prompt hashes and retry list of previous syncs."""
+    try:
+        with open(SYNC_STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'watermark': None, 'prompts': {}, 'pending': []}
+
+
+def save_sync_state(state: Dict):
+    """Write the sync state atomically."""
+    state['updated'] = time.time()
+    with AtomicFile(SYNC_STATE_FILE) as f:
+        f.write(json.dumps(state).encode('utf-8'))
+
+
+def record_sync_prompts(hashes: Dict[int, str]):
+    """Record the prompts committed items were generated from and drop them from the retry list."""
+    state = load_sync_state()
+    state['prompts'].update((str(item_id), value) for item_id, value in hashes.items())
+    state['pending'] = [item_id for item_id in state['pending'] if item_id not in hashes]
+    save_sync_state(state)
+
+
+
+def sync_items(options: RunOptions):
+    """
+    Incremental sync: (re)generate images only for items that need one.
+    Reads rows changed since the stored updated_at watermark (minus
+    SYNC_OVERLAP, so rows committed late in the same second are not missed)
+    and compares each item's prompt with the one its image was made from.
+    Items without an image, or whose prompt changed, are generated; edits
+    to fields that do not reach the prompt are only recorded. The first
+    sync reads every row and records the prompts of existing images as the
+    baseline. Failed items are retried on the next sync. Meant for an
+    unattended nightly job, so it never asks for confirmation.
+    """
+    print("="*80)
+    print("INCREMENTAL EQUIPMENT IMAGE SYNC")
+    print("="*80)
+    
+    state = load_sync_state()
+    since = None
+    if state['watermark']:
+        since = (datetime.fromisoformat(state['watermark'])
+                 - timedelta(seconds=SYNC_OVERLAP)).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"Changes since: {since}")
+    else:
+        print("No watermark yet: reading the whole catalog once to record a baseline")
+    
+    prompts = state['prompts']
+    queue: Dict[int, Dict] = {}
+    hashes: Dict[int, str] = {}
+    scanned = baseline = 0
+    watermark = state['watermark']
+    
+    for item in iter_changed_items(since):
+        scanned += 1
+        watermark = str(item['updated_at'])
+        current = prompt_hash(item)
+        stored = prompts.get(str(item['item_id']))
+        
+        if not item['image_url'] or (stored is not None and stored != current):
+            queue[item['item_id']] = item
+            hashes[item['item_id']] = current
+        elif stored is None:
+            prompts[str(item['item_id'])] = current
+            baseline += 1
+    
+    # Items that failed last time, even if they have not changed since
+    for item in get_items_by_ids([i for i in state['pending'] if i not in queue]):
+        queue[item['item_id']] = item
+        hashes[item['item_id']] = prompt_hash(item)
+    
+    print(f"✓ {scanned} changed rows read, {baseline} baseline prompts recorded, "
+          f"{len(queue)} images to generate")
+    
+    committed = set()
+    
+    def record(batch: List[Tuple[int, str]]):
+        for item_id, _ in batch:
+            prompts[str(item_id)] = hashes[item_id]
+            committed.add(item_id)
+    
+    success_count = error_count = 0
+    journal = ProgressJournal()
+    try:
+        if queue:
+            items = list(queue.values())
+            journal.start('sync', items, force=options.force, hashes=hashes)
+            success_count, error_count = run_generation(items, get_api_key(options.backend), options,
+                                                        journal=journal, on_commit=record)
+            journal.finish()
+    finally:
+        journal.close()
+        
+        # Saved even when the run stops early: whatever was not committed is retried next time
+        save_sync_state({
+            'watermark': watermark,
+            'prompts': prompts,
+            'pending': sorted(set(queue) - committed)
+        })
+    
+    print_summary(len(queue), success_count, error_count)
+    print(f"✓ Watermark: {watermark}")
@@ -0,0 +1,25 @@
+"""Small helpers shared by the commands."""
+
+import sys
+import importlib.util
+
+
+def confirm(question: str, assume_yes: bool = False, answer: str = 'y') -> bool:
+    """Ask a yes/no question, or assume yes (--yes)."""
+    if assume_yes:
+        print(f"{question}{answer} (--yes)")
+        return True
+    return input(question).lower() == answer
+
+
+
+def require_pillow(purpose: str, numpy: bool = False, alternative: str = ''):
+    """
+    Exit with an install hint unless Pillow (and, with numpy, NumPy) is
+    installed. purpose completes "... is required", e.g. "for image variants".
+    """
+    modules = ('numpy', 'PIL') if numpy else ('PIL',)
+    if not all(importlib.util.find_spec(module) for module in modules):
+        packages = ("NumPy and Pillow are", "numpy Pillow") if numpy else ("Pillow is", "Pillow")
+        print(f"✗ {packages[0]} required {purpose} (pip install {packages[1]}{alternative})")
+        sys.exit(1)
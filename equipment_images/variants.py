@@ -0,0 +1,143 @@
+"""Responsive size and format variants of equipment images."""
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Optional, Tuple
+
+from .config import VARIANT_SIZES, VARIANT_FORMATS, VARIANT_MANIFEST
+from .util import require_pillow
+from .files import AtomicFile, url_to_path, hash_file
+from .db import get_all_items, ImageUrlWriter
+
+
+def get_variant_urls(image_url: str) -> Dict[str, Dict[str, str]]:
+    """Return {size: {format: url}} for an image's responsive variants."""
+    directory, filename = image_url.rsplit('/', 1)
+    stem = filename.rsplit('.', 1)[0]
+    
+    return {
+        str(size): {fmt: f"{directory}/{size}/{stem}.{fmt}" for fmt in VARIANT_FORMATS}
+        for size in VARIANT_SIZES
+    }
+
+
+def render_variants(image_url: str, known_hash: Optional[str]) -> Tuple[str, Optional[Dict]]:
+    """
+    Render the fixed-size variants of one image.
+    Runs in a worker process. Returns (source hash, variant URLs), with
+    variant URLs None if the source is unchanged and every variant exists.
+    """
+    from PIL import Image
+    
+    source = url_to_path(image_url)
+    source_hash = hash_file(source)
+    variant_urls = get_variant_urls(image_url)
+    
+    if source_hash == known_hash and all(
+            url_to_path(url).exists() for formats in variant_urls.values() for url in formats.values()):
+        return source_hash, None
+    
+    with Image.open(source) as image:
+        image.load()
+        
+        for size, formats in variant_urls.items():
+            variant = image.copy()
+            variant.thumbnail((int(size), int(size)), Image.LANCZOS)
+            
+            for fmt, url in formats.items():
+                with AtomicFile(url_to_path(url)) as f:
+                    if fmt == 'webp':
+                        variant.save(f, 'WEBP', quality=85, method=6)
+                    else:
+                        variant.save(f, 'PNG', optimize=True)
+    
+    return source_hash, variant_urls
+
+
+class VariantRenderer:
+    """
+    Process-pool stage that renders responsive variants.
+    Images are resized on all CPU cores; sources whose hash matches the
+    variant manifest are skipped. Variant URLs are written to the
+    image_variants column in batches.
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        require_pillow("for image variants")
+        
+        self.executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self.manifest = self._load_manifest()
+        self.updates: Dict[str, str] = {}  # entries changed by this run
+        self.futures = {}
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+    
+    @staticmethod
+    def _load_manifest() -> Dict[str, str]:
+        try:
+            with open(VARIANT_MANIFEST, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_manifest(self):
+        # Merge into the current file so entries saved by another process meanwhile are kept
+        manifest = self._load_manifest()
+        manifest.update(self.updates)
+        with AtomicFile(VARIANT_MANIFEST) as f:
+            f.write(json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    
+    def submit(self, item_id: int, image_url: str):
+        """Queue an image for variant rendering."""
+        future = self.executor.submit(render_variants, image_url, self.manifest.get(image_url))
+        self.futures[future] = (item_id, image_url)
+    
+    def finish(self):
+        """Wait for all renders and record their variant URLs."""
+        with ImageUrlWriter(column='image_variants') as writer:
+            for future in as_completed(self.futures):
+                item_id, image_url = self.futures[future]
+                
+                try:
+                    source_hash, variant_urls = future.result()
+                except Exception as e:
+                    print(f"✗ Variant rendering failed for {image_url}: {e}")
+                    self.failed += 1
+                    continue
+                
+                self.manifest[image_url] = self.updates[image_url] = source_hash
+                
+                # Unchanged variants are still recorded: a new image_url write clears the column
+                if variant_urls is None:
+                    writer.add(item_id, json.dumps(get_variant_urls(image_url)))
+                    self.skipped += 1
+                else:
+                    writer.add(item_id, json.dumps(variant_urls))
+                    self.rendered += 1
+        
+        self.executor.shutdown()
+        self.futures = {}
+        self._save_manifest()
+        
+        print(f"✓ Variants rendered: {self.rendered}, unchanged: {self.skipped}, failed: {self.failed}")
+
+
+def generate_variants():
+    """Render responsive variants for every item that already has an image."""
+    print("="*80)
+    print("GENERATE IMAGE VARIANTS")
+    print("="*80)
+    
+    items = [item for item in get_all_items() if item.get('image_url')]
+    print(f"\n✓ Found {len(items)} items with images\n")
+    
+    renderer = VariantRenderer()
+    for item in items:
+        if url_to_path(item['image_url']).exists():
+            renderer.submit(item['item_id'], item['image_url'])
+        else:
+            print(f"✗ Missing file for {item['name']}: {item['image_url']}")
+    
+    renderer.finish()
@@ -4,535 +4,201 @@ BECMI VTT Equipment Image Generator
 Generates photorealistic medieval images for all equipment items using Together AI API.
 """
 
-import os
 import sys
-import time
-import json
-import base64
-import requests
-import mysql.connector
+import argparse
 from pathlib import Path
-from typing import Dict, List, Optional
-
-# Configuration
-WORKSPACE_ROOT = Path(__file__).parent
-IMAGE_BASE_DIR = WORKSPACE_ROOT / "public" / "images" / "equipment"
-CONFIG_FILE = WORKSPACE_ROOT / "config" / "together-ai.php"
-
-# Database configuration - Load from environment variables
-import os
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', ''),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': os.getenv('DB_NAME', 'becmi_vtt')
-}
-
-# Validate required credentials
-if not DB_CONFIG['user'] or not DB_CONFIG['password']:
-    raise ValueError("DB_USER and DB_PASSWORD environment variables must be set")
-
-# Together AI API
-TOGETHER_API_URL = "https://api.together.xyz/v1/images/generations"
-MODEL = "black-forest-labs/FLUX.1-schnell-Free"
-DEFAULT_WIDTH = 1024
-DEFAULT_HEIGHT = 1024  # Square format better for items
-DEFAULT_STEPS = 8  # Increased for better quality
-RATE_LIMIT_DELAY = 3  # seconds between requests
-
-# Negative prompt to avoid unwanted elements
-NEGATIVE_PROMPT = "blurry, low quality, distorted, watermark, text, people, hands, background clutter, shadows, multiple items, cluttered"
-
-
-def get_api_key() -> str:
-    """Read Together AI API key from config file."""
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            content = f.read()
-            # Extract API key from PHP file
-            for line in content.split('\n'):
-                if 'together_AI_api_key' in line and '=' in line:
-                    key = line.split('=')[1].strip().strip('";\'')
-                    return key
-    except Exception as e:
-        print(f"Error reading API key: {e}")
-        sys.exit(1)
-    
-    print("API key not found in config file")
-    sys.exit(1)
-
-
-def get_db_connection():
-    """Create database connection."""
+from typing import List
+
+from equipment_images.config import (DEFAULT_BACKEND, DEFAULT_RATE, DEFAULT_WORKERS, METRICS_DIR,
+                                     OPTIMIZE_COLORS, OPTIMIZE_MIN_PSNR, MAX_CANDIDATES)
+from equipment_images.util import require_pillow
+from equipment_images.metrics import Profiler, run_profiled
+from equipment_images.db import close_db_connection
+from equipment_images.prompts import preview_prompts, benchmark_prompts
+from equipment_images.api import BudgetExhausted
+from equipment_images.cache import close_generation_cache
+from equipment_images.backends import IMAGE_BACKENDS
+from equipment_images.variants import generate_variants
+from equipment_images.optimize import optimize_images
+from equipment_images.atlas import build_atlases
+from equipment_images.reconcile import reconcile_images
+from equipment_images.qa import qa_images
+from equipment_images.pipeline import RunOptions
+from equipment_images.commands import (derive_magical_variants, main, regenerate_all, generate_assets,
+                                       resume_run, test_single_item)
+from equipment_images.sync import sync_items
+from equipment_images.jobs import enqueue_jobs, run_worker
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration in seconds, or with an s/m/h suffix."""
+    units = {'s': 1, 'm': 60, 'h': 3600}
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as e:
-        print(f"Database connection error: {e}")
-        sys.exit(1)
-
-
-def get_items_without_images() -> List[Dict]:
-    """Fetch all items without images from database."""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    query = """
-        SELECT item_id, name, description, item_type, item_category, 
-               weapon_type, armor_type, size_category
-        FROM items 
-        WHERE image_url IS NULL OR image_url = ''
-        ORDER BY item_id
-    """
-    
-    cursor.execute(query)
-    items = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    
-    return items
-
-
-def get_all_items() -> List[Dict]:
-    """Fetch ALL items from database (for regeneration)."""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    query = """
-        SELECT item_id, name, description, item_type, item_category, 
-               weapon_type, armor_type, size_category, image_url
-        FROM items 
-        ORDER BY item_id
-    """
-    
-    cursor.execute(query)
-    items = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    
-    return items
-
-
-def generate_prompt(item: Dict) -> str:
-    """
-    Generate detailed prompt for equipment image.
-    This is where we have full control over image generation.
-    """
-    item_type = item['item_type']
-    item_name = item['name']
-    description = item.get('description', '')
-    
-    # Base prompt elements
-    base = "Photorealistic medieval"
-    quality = "isolated on clean white background, professional product photography, studio lighting, highly detailed, museum quality, 8K resolution, sharp focus, no blur, no distortion, no watermark"
-    
-    # Type-specific prompts
-    if item_type == 'weapon':
-        weapon_type = item.get('weapon_type', '')
-        
-        # Specific weapon prompts
-        if 'sword' in item_name.lower():
-            return f"{base} {item_name}, {quality}, gleaming steel blade with leather-wrapped grip and ornate crossguard, professional weapon photography"
-        elif 'axe' in item_name.lower():
-            return f"{base} {item_name}, {quality}, sharp steel axe head with wooden handle, professional weapon photography"
-        elif 'bow' in item_name.lower():
-            return f"{base} {item_name}, {quality}, curved wooden bow with string, professional weapon photography"
-        elif 'crossbow' in item_name.lower():
-            return f"{base} {item_name}, {quality}, mechanical crossbow with wooden stock and steel mechanism, professional weapon photography"
-        elif 'dagger' in item_name.lower():
-            return f"{base} {item_name}, {quality}, small sharp blade with wrapped grip, professional weapon photography"
-        elif 'mace' in item_name.lower():
-            return f"{base} {item_name}, {quality}, heavy metal mace head with wooden handle, professional weapon photography"
-        elif 'hammer' in item_name.lower():
-            return f"{base} {item_name}, {quality}, war hammer with steel head and wooden handle, professional weapon photography"
-        elif 'spear' in item_name.lower():
-            return f"{base} {item_name}, {quality}, long wooden shaft with sharp metal spearhead, professional weapon photography"
-        elif 'staff' in item_name.lower():
-            return f"{base} {item_name}, {quality}, simple wooden quarterstaff, professional weapon photography"
-        elif 'pole' in item_name.lower():
-            return f"{base} {item_name}, {quality}, long polearm with metal blade on wooden shaft, professional weapon photography"
-        elif 'javelin' in item_name.lower():
-            return f"{base} {item_name}, {quality}, throwing spear with metal tip, professional weapon photography"
-        elif 'sling' in item_name.lower():
-            return f"{base} leather sling, {quality}, simple leather strap for throwing stones, professional weapon photography"
-        elif 'blowgun' in item_name.lower():
-            return f"{base} {item_name}, {quality}, hollow wooden tube for shooting darts, professional weapon photography"
-        elif 'club' in item_name.lower() or 'blackjack' in item_name.lower():
-            return f"{base} {item_name}, {quality}, weighted club for striking, professional weapon photography"
-        else:
-            return f"{base} {item_name} weapon, {quality}, professional weapon photography, {description}"
-    
-    elif item_type == 'armor':
-        armor_type = item.get('armor_type', '')
-        
-        if 'leather' in item_name.lower():
-            return f"{base} leather armor, {quality}, hardened leather cuirass with straps and buckles, displayed on mannequin or stand, professional museum display"
-        elif 'chain' in item_name.lower():
-            return f"{base} chain mail armor, {quality}, interlocking metal rings forming protective coat, displayed on mannequin or stand, professional museum display"
-        elif 'plate' in item_name.lower():
-            return f"{base} plate armor, {quality}, polished steel plate armor pieces, displayed on mannequin or stand, professional museum display"
-        elif 'scale' in item_name.lower():
-            return f"{base} scale mail armor, {quality}, overlapping metal scales on leather backing, displayed on mannequin or stand, professional museum display"
-        elif 'banded' in item_name.lower():
-            return f"{base} banded mail armor, {quality}, metal bands on leather backing, displayed on mannequin or stand, professional museum display"
-        elif 'suit' in item_name.lower():
-            return f"{base} full plate armor suit, {quality}, complete medieval knight armor, displayed on mannequin or stand, professional museum display"
-        else:
-            return f"{base} {item_name}, {quality}, protective armor piece, displayed on mannequin or stand, professional museum display"
-    
-    elif item_type == 'shield':
-        return f"{base} {item_name}, {quality}, wooden shield with metal boss and leather straps, displayed on stand, professional museum display"
-    
-    elif item_type == 'gear':
-        # Specific gear prompts
-        if 'rope' in item_name.lower():
-            return f"{base} coiled hemp rope, {quality}, thick twisted rope coil, clean background, professional photography"
-        elif 'torch' in item_name.lower():
-            return f"{base} wooden torch with flames, {quality}, wooden handle with burning oil-soaked cloth, warm firelight, clean background, professional photography"
-        elif 'backpack' in item_name.lower():
-            return f"{base} leather backpack, {quality}, brown leather adventuring pack with straps and buckles, clean background, professional photography"
-        elif 'bedroll' in item_name.lower():
-            return f"{base} bedroll, {quality}, rolled sleeping blanket tied with leather straps, clean background, professional photography"
-        elif 'tinderbox' in item_name.lower() or 'flint' in item_name.lower():
-            return f"{base} tinderbox with flint and steel, {quality}, small wooden box with flint stone and steel striker and dry tinder, clean background, professional photography"
-        elif 'waterskin' in item_name.lower() or 'wineskin' in item_name.lower():
-            return f"{base} leather waterskin, {quality}, leather water container with cork stopper, clean background, professional photography"
-        elif 'rations' in item_name.lower():
-            return f"{base} travel rations, {quality}, dried food provisions in cloth wrapping, clean background, professional photography"
-        elif 'lantern' in item_name.lower():
-            return f"{base} {item_name}, {quality}, metal lantern with glass panes and oil reservoir, clean background, professional photography"
-        elif 'pouch' in item_name.lower():
-            return f"{base} leather pouch, {quality}, small leather belt pouch with drawstring, clean background, professional photography"
-        elif 'sack' in item_name.lower():
-            return f"{base} {item_name}, {quality}, large cloth or burlap sack, clean background, professional photography"
-        elif 'flask' in item_name.lower() or 'vial' in item_name.lower():
-            return f"{base} glass {item_name}, {quality}, small glass container with cork stopper, clean background, professional photography"
-        elif 'holy' in item_name.lower():
-            return f"{base} holy symbol, {quality}, ornate religious symbol on chain, clean background, professional photography"
-        elif 'mirror' in item_name.lower():
-            return f"{base} hand mirror, {quality}, polished metal mirror in decorative frame, clean background, professional photography"
-        elif 'crowbar' in item_name.lower():
-            return f"{base} iron crowbar, {quality}, heavy iron prying tool, clean background, professional photography"
-        elif 'spike' in item_name.lower():
-            return f"{base} iron spikes, {quality}, metal pitons for climbing, clean background, professional photography"
-        elif 'grappling' in item_name.lower():
-            return f"{base} grappling hook, {quality}, metal hook with rope attached, clean background, professional photography"
-        else:
-            return f"{base} {item_name}, {quality}, adventuring gear equipment, clean background, professional photography"
-    
-    elif item_type == 'consumable':
-        if 'oil' in item_name.lower():
-            return f"{base} oil flask, {quality}, glass flask containing lamp oil or burning oil, clean background, professional photography"
-        elif 'potion' in item_name.lower():
-            return f"{base} {item_name}, {quality}, glass vial with magical liquid, clean background, professional photography"
-        elif 'holy water' in item_name.lower():
-            return f"{base} holy water vial, {quality}, blessed water in ornate glass vial, clean background, professional photography"
-        else:
-            return f"{base} {item_name}, {quality}, clean background, professional photography, {description}"
-    
-    # Default fallback
-    return f"{base} {item_name}, {quality}, medieval equipment item, clean background, professional photography, {description}"
-
-
-def get_image_subdirectory(item_type: str) -> str:
-    """Get subdirectory for item type."""
-    subdirs = {
-        'weapon': 'weapons',
-        'armor': 'armor',
-        'shield': 'shields',
-        'gear': 'gear',
-        'consumable': 'consumables'
-    }
-    return subdirs.get(item_type, 'gear')
-
-
-def generate_image(item: Dict, api_key: str) -> Optional[str]:
-    """
-    Generate image using Together AI API.
-    Returns the image path if successful, None otherwise.
-    """
-    item_id = item['item_id']
-    item_type = item['item_type']
-    item_name = item['name']
-    
-    # Generate prompt
-    prompt = generate_prompt(item)
-    
-    print(f"\n{'='*80}")
-    print(f"Generating image for: {item_name} (ID: {item_id})")
-    print(f"Type: {item_type}")
-    print(f"Prompt: {prompt}")
-    print(f"{'='*80}")
-    
-    # Prepare API request
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": MODEL,
-        "prompt": prompt,
-        "width": DEFAULT_WIDTH,
-        "height": DEFAULT_HEIGHT,
-        "steps": DEFAULT_STEPS,
-        "n": 1,
-        "response_format": "b64_json",
-        "negative_prompt": NEGATIVE_PROMPT
-    }
-    
-    try:
-        # Make API request
-        response = requests.post(TOGETHER_API_URL, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        # Extract base64 image
-        if 'data' in data and len(data['data']) > 0:
-            b64_image = data['data'][0]['b64_json']
-            
-            # Decode and save image
-            image_data = base64.b64decode(b64_image)
-            
-            # Determine save path
-            subdir = get_image_subdirectory(item_type)
-            image_dir = IMAGE_BASE_DIR / subdir
-            image_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Sanitize filename
-            safe_name = item_name.lower().replace(' ', '_').replace('(', '').replace(')', '').replace("'", '')
-            filename = f"equipment_{item_id}_{safe_name}.png"
-            filepath = image_dir / filename
-            
-            # Save image
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
-            
-            # Return relative URL path
-            relative_path = f"/images/equipment/{subdir}/{filename}"
-            
-            print(f"✓ Image saved: {filepath}")
-            print(f"✓ URL: {relative_path}")
-            
-            return relative_path
-        else:
-            print(f"✗ No image data in response")
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"✗ API request failed: {e}")
-        if hasattr(e.response, 'text'):
-            print(f"Response: {e.response.text}")
-        return None
-    except Exception as e:
-        print(f"✗ Error: {e}")
-        return None
-
-
-def update_item_image_url(item_id: int, image_url: str) -> bool:
-    """Update item's image_url in database."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = "UPDATE items SET image_url = %s WHERE item_id = %s"
-        cursor.execute(query, (image_url, item_id))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
-        print(f"✓ Database updated for item {item_id}")
-        return True
-        
-    except mysql.connector.Error as e:
-        print(f"✗ Database error: {e}")
-        return False
-
-
-def main():
-    """Main execution function."""
-    print("="*80)
-    print("BECMI VTT Equipment Image Generator")
-    print("="*80)
-    
-    # Get API key
-    api_key = get_api_key()
-    print(f"✓ API key loaded")
-    
-    # Get items without images
-    items = get_items_without_images()
-    total_items = len(items)
-    
-    print(f"\n✓ Found {total_items} items without images\n")
-    
-    if total_items == 0:
-        print("No items need images. All done!")
-        return
-    
-    # Ask for confirmation
-    print("Items to generate:")
-    for i, item in enumerate(items[:10], 1):
-        print(f"  {i}. {item['name']} (ID: {item['item_id']}, Type: {item['item_type']})")
-    
-    if total_items > 10:
-        print(f"  ... and {total_items - 10} more")
-    
-    print(f"\nThis will generate {total_items} images.")
-    print(f"Estimated time: {total_items * RATE_LIMIT_DELAY / 60:.1f} minutes")
-    
-    response = input("\nProceed? (y/n): ")
-    if response.lower() != 'y':
-        print("Cancelled.")
-        return
-    
-    # Process each item
-    success_count = 0
-    error_count = 0
-    
-    for i, item in enumerate(items, 1):
-        print(f"\n[{i}/{total_items}] Processing: {item['name']}...")
-        
-        # Generate image
-        image_url = generate_image(item, api_key)
-        
-        if image_url:
-            # Update database
-            if update_item_image_url(item['item_id'], image_url):
-                success_count += 1
-            else:
-                error_count += 1
-        else:
-            error_count += 1
-        
-        # Rate limiting - wait between requests
-        if i < total_items:
-            print(f"Waiting {RATE_LIMIT_DELAY} seconds before next request...")
-            time.sleep(RATE_LIMIT_DELAY)
-    
-    # Summary
-    print("\n" + "="*80)
-    print("SUMMARY")
-    print("="*80)
-    print(f"Total items: {total_items}")
-    print(f"Success: {success_count}")
-    print(f"Errors: {error_count}")
-    print("="*80)
-
-
-def regenerate_all():
-    """Regenerate images for ALL items (even those with existing images)."""
-    print("="*80)
-    print("REGENERATE ALL EQUIPMENT IMAGES")
-    print("="*80)
-    print("\n⚠️  WARNING: This will regenerate ALL equipment images!")
-    print("This will overwrite existing images.\n")
-    
-    response = input("Are you sure? (yes/no): ")
-    if response.lower() != 'yes':
-        print("Cancelled.")
-        return
-    
-    # Get API key
-    api_key = get_api_key()
-    print(f"✓ API key loaded")
-    
-    # Get ALL items
-    items = get_all_items()
-    total_items = len(items)
-    
-    print(f"\n✓ Found {total_items} total items\n")
-    
-    # Process each item
-    success_count = 0
-    error_count = 0
-    
-    for i, item in enumerate(items, 1):
-        print(f"\n[{i}/{total_items}] Processing: {item['name']}...")
-        
-        # Generate image
-        image_url = generate_image(item, api_key)
-        
-        if image_url:
-            # Update database
-            if update_item_image_url(item['item_id'], image_url):
-                success_count += 1
-            else:
-                error_count += 1
-        else:
-            error_count += 1
-        
-        # Rate limiting
-        if i < total_items:
-            print(f"Waiting {RATE_LIMIT_DELAY} seconds...")
-            time.sleep(RATE_LIMIT_DELAY)
-    
-    # Summary
-    print("\n" + "="*80)
-    print("SUMMARY")
-    print("="*80)
-    print(f"Total items: {total_items}")
-    print(f"Success: {success_count}")
-    print(f"Errors: {error_count}")
-    print("="*80)
-
-
-def test_single_item(item_id: int):
-    """Test image generation for a single item."""
-    print(f"Testing image generation for item ID: {item_id}")
-    
-    # Get API key
-    api_key = get_api_key()
-    
-    # Get item from database
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    query = """
-        SELECT item_id, name, description, item_type, item_category, 
-               weapon_type, armor_type, size_category
-        FROM items 
-        WHERE item_id = %s
-    """
-    
-    cursor.execute(query, (item_id,))
-    item = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
-    
-    if not item:
-        print(f"Item {item_id} not found")
-        return
-    
-    # Generate image
-    image_url = generate_image(item, api_key)
-    
-    if image_url:
-        # Update database
-        update_item_image_url(item['item_id'], image_url)
-        print(f"\n✓ Success! Image URL: {image_url}")
+        if value and value[-1].lower() in units:
+            return float(value[:-1]) * units[value[-1].lower()]
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}")
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="BECMI VTT Equipment Image Generator",
+        epilog="""Commands:
+  (none)      Generate missing images
+  regenerate  Regenerate ALL images
+  test <id>   Test single item
+  variants    Render thumbnails/WebP for existing images
+  atlas       Build per-category sprite atlases
+  optimize    Losslessly recompress every equipment image
+  derive      Derive magical variant images from their base item's image (no API calls)
+  assets [sources...]  Generate missing images for items, monsters, portraits and terrain together
+  prompts     Print every item's prompt (for previews and diffs)
+  prompt-bench [count]  Benchmark prompt compilation
+  resume      Resume an interrupted generate/regenerate/sync run
+  reconcile   Fix image_url values against the files on disk and rename old-scheme files (no API calls)
+  qa          Flag blank, cluttered and duplicate images and requeue them
+  sync        Generate images only for items added or changed since the last sync
+  enqueue [all|ids...]  Queue missing (or all, or the given) items for workers
+  worker      Work through the job queue; run on any number of hosts at once""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('command', nargs='?', default='generate',
+                        choices=['generate', 'regenerate', 'test', 'variants', 'atlas', 'optimize', 'derive', 'assets',
+                                 'prompts', 'prompt-bench', 'resume', 'reconcile', 'qa', 'sync',
+                                 'enqueue', 'worker'])
+    parser.add_argument('args', nargs='*', help="Command arguments (e.g. item ID for test)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Concurrent API requests (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Starting requests per second (default: learned from previous runs, "
+                             f"else {DEFAULT_RATE:.2f}); adapted to throttling during the run")
+    parser.add_argument('--force', action='store_true',
+                        help="Ignore the generation cache and always call the API")
+    parser.add_argument('--variants', action='store_true',
+                        help="Render thumbnails/WebP for each generated image")
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help="Stop sending API requests after this many (retries included); "
+                             "the rest of the queue is left for resume")
+    parser.add_argument('--time-budget', type=parse_duration, default=None,
+                        help="Stop sending API requests after this long, e.g. 900, 45m or 2h")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Losslessly recompress each generated image (strip metadata, maximum compression)")
+    parser.add_argument('--quantize', action='store_true',
+                        help=f"When optimizing, use a {OPTIMIZE_COLORS}-colour palette if it stays above "
+                             f"{OPTIMIZE_MIN_PSNR:.0f} dB PSNR")
+    parser.add_argument('--backend', choices=sorted(IMAGE_BACKENDS), default=DEFAULT_BACKEND,
+                        help="Image backend: the Together AI API, or local placeholder art for "
+                             f"dev/staging (default: {DEFAULT_BACKEND})")
+    parser.add_argument('--candidates', type=int, choices=range(1, MAX_CANDIDATES + 1), default=1,
+                        metavar='N',
+                        help=f"Request N images per item in one call (up to {MAX_CANDIDATES}), keep the best "
+                             "scoring and cache the rest for QA requeues (default: 1)")
+    parser.add_argument('--no-derive', action='store_true',
+                        help="Request magical variants from the API instead of deriving them from their base item")
+    parser.add_argument('--metrics-dir',
+                        help=f"Directory for the JSON summary and Prometheus textfile (default: {METRICS_DIR})")
+    parser.add_argument('--profile', action='store_true',
+                        help="Run under cProfile (all threads) and save profile.pstats to the metrics directory")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="reconcile/qa: report what would change without updating the database")
+    parser.add_argument('--yes', '-y', action='store_true',
+                        help="Answer yes to every confirmation prompt (for unattended runs)")
+    return parser.parse_args(argv)
+
+
+def run_options(args: argparse.Namespace) -> RunOptions:
+    """Collect the run settings from a parsed command line."""
+    return RunOptions(
+        workers=args.workers,
+        rate=args.rate,
+        force=args.force,
+        variants=args.variants,
+        optimize=args.optimize,
+        quantize=args.quantize,
+        max_requests=args.max_requests,
+        time_budget=args.time_budget,
+        derive=not args.no_derive,
+        backend=args.backend,
+        candidates=args.candidates,
+        assume_yes=args.yes,
+        metrics_dir=Path(args.metrics_dir) if args.metrics_dir else METRICS_DIR,
+        profiler=Profiler() if args.profile else None
+    )
+
+
+def run_command(args: argparse.Namespace, options: RunOptions):
+    """Dispatch a parsed command line to its command function."""
+    if args.command == "regenerate":
+        regenerate_all(options)
+    elif args.command == "test" and args.args:
+        test_single_item(int(args.args[0]), force=options.force, backend=options.backend,
+                         candidates=options.candidates)
+    elif args.command == "variants":
+        generate_variants()
+    elif args.command == "atlas":
+        build_atlases()
+    elif args.command == "optimize":
+        optimize_images(quantize=options.quantize)
+    elif args.command == "assets":
+        generate_assets(args.args, options)
+    elif args.command == "derive":
+        derive_magical_variants(options)
+    elif args.command == "resume":
+        resume_run(options)
+    elif args.command == "reconcile":
+        reconcile_images(dry_run=args.dry_run)
+    elif args.command == "qa":
+        qa_images(dry_run=args.dry_run, assume_yes=options.assume_yes)
+    elif args.command == "sync":
+        sync_items(options)
+    elif args.command == "enqueue":
+        enqueue_jobs(args.args)
+    elif args.command == "worker":
+        run_worker(options)
+    elif args.command == "prompts":
+        preview_prompts()
+    elif args.command == "prompt-bench":
+        benchmark_prompts(int(args.args[0]) if args.args else 100000)
+    elif args.command == "generate":
+        main(options)
     else:
-        print(f"\n✗ Failed to generate image")
+        print("Usage:")
+        print("  python generate_equipment_images.py           - Generate missing images")
+        print("  python generate_equipment_images.py regenerate - Regenerate ALL images")
+        print("  python generate_equipment_images.py test <id>  - Test single item")
+        print("  python generate_equipment_images.py variants   - Render thumbnails for existing images")
+        print("  python generate_equipment_images.py atlas      - Build sprite atlases")
+        print("  python generate_equipment_images.py optimize   - Recompress all equipment images")
+        print("  python generate_equipment_images.py derive     - Derive magical variants from base images")
+        print("  python generate_equipment_images.py assets [sources...] - Generate all asset types in one run")
+        print("  python generate_equipment_images.py prompts    - Print every item's prompt")
+        print("  python generate_equipment_images.py prompt-bench [count] - Benchmark prompt compilation")
+        print("  python generate_equipment_images.py resume     - Resume an interrupted run")
+        print("  python generate_equipment_images.py reconcile  - Fix image URLs against files on disk")
+        print("  python generate_equipment_images.py qa         - Flag and requeue failed generations")
+        print("  python generate_equipment_images.py sync       - Generate only for new or changed items")
+        print("  python generate_equipment_images.py enqueue [all|ids...] - Queue items for workers")
+        print("  python generate_equipment_images.py worker     - Process queued jobs (multi-host)")
+        print("Options: --workers N, --rate REQUESTS_PER_SECOND, --force, --variants, "
+              "--max-requests N, --time-budget DURATION, --optimize, --quantize, --no-derive, --backend NAME, "
+              "--candidates N, --metrics-dir DIR, --profile, --dry-run, --yes")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
-        
-        if command == "regenerate":
-            regenerate_all()
-        elif command == "test" and len(sys.argv) > 2:
-            item_id = int(sys.argv[2])
-            test_single_item(item_id)
-        else:
-            print("Usage:")
-            print("  python generate_equipment_images.py           - Generate missing images")
-            print("  python generate_equipment_images.py regenerate - Regenerate ALL images")
-            print("  python generate_equipment_images.py test <id>  - Test single item")
-    else:
-        main()
-
+    args = parse_args(sys.argv[1:])
+    options = run_options(args)
+    if options.candidates > 1:
+        require_pillow("to score candidates", numpy=True)
+    
+    try:
+        run_profiled(options.profiler, run_command, args, options)
+    except BudgetExhausted as e:
+        print(f"\n⚠️  {e}: {e.success} succeeded, {e.errors} failed, {e.deferred} deferred")
+        print("Run 'python generate_equipment_images.py resume' to continue with the deferred items.")
+    finally:
+        close_db_connection()
+        close_generation_cache()
+        if options.profiler:
+            options.profiler.write(options.metrics_dir)
@@ -3,6 +3,7 @@
 // Test script to generate images for 5 equipment items
 
 require_once __DIR__ . '/app/core/database.php';
+require_once __DIR__ . '/app/core/equipment-images.php';
 
 // Initialize database connection
 $database = Database::getInstance();
@@ -113,7 +114,7 @@ function generateEquipmentImage($item, $apiKey, $apiUrl, $model) {
 // Process each item
 $successCount = 0;
 $failCount = 0;
-$updateQuery = "UPDATE items SET image_url = :image_url WHERE item_id = :item_id";
+$updateQuery = "UPDATE items SET image_url = :image_url, image_variants = NULL WHERE item_id = :item_id";
 $updateStmt = $db->prepare($updateQuery);
 
 foreach ($items as $index => $item) {
@@ -130,8 +131,7 @@ foreach ($items as $index => $item) {
     };
     
     // Create safe filename
-    $safeFilename = preg_replace('/[^a-zA-Z0-9_-]/', '_', strtolower($item['name']));
-    $filename = "equipment_{$item['item_id']}_{$safeFilename}.png";
+    $filename = equipmentImageFilename($item['item_id'], $item['name']);
     $fullPath = __DIR__ . "/public/images/equipment/{$subdir}/{$filename}";
     $dbPath = "images/equipment/{$subdir}/{$filename}";
     
@@ -5,15 +5,11 @@
  */
 
 require_once __DIR__ . '/app/core/database.php';
+require_once __DIR__ . '/app/core/equipment-images.php';
 
 $database = Database::getInstance();
 $db = $database->getConnection();
 
-// Function to sanitize filename
-function sanitizeFilename($name) {
-    return strtolower(preg_replace('/[^a-z0-9_]/', '_', $name));
-}
-
 // Function to get subdirectory
 function getSubdirectory($itemType) {
     $subdirs = [
@@ -36,9 +32,8 @@ foreach ($items as $item) {
     $itemName = $item['name'];
     $itemType = $item['item_type'];
     
-    $safeName = sanitizeFilename($itemName);
     $subdir = getSubdirectory($itemType);
-    $filename = "equipment_{$itemId}_{$safeName}.png";
+    $filename = equipmentImageFilename($itemId, $itemName);
     $imageUrl = "/images/equipment/{$subdir}/{$filename}";
     
     // Check if file exists
@@ -53,7 +48,7 @@ foreach ($items as $item) {
 }
 
 // Update database
-$updateStmt = $db->prepare("UPDATE items SET image_url = ? WHERE item_id = ?");
+$updateStmt = $db->prepare("UPDATE items SET image_url = ?, image_variants = NULL WHERE item_id = ?");
 $successCount = 0;
 $errorCount = 0;
 
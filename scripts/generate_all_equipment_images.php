@@ -9,6 +9,7 @@
 chdir(__DIR__ . '/../');
 
 require_once 'app/core/database.php';
+require_once 'app/core/equipment-images.php';
 require_once 'config/together-ai.php';
 
 // Output status
@@ -58,8 +59,7 @@ foreach ($items as $index => $item) {
     }
     
     // Create filename
-    $safeName = preg_replace('/[^a-z0-9]+/i', '_', strtolower($item['name']));
-    $filename = "equipment_{$item['item_id']}_{$safeName}.png";
+    $filename = equipmentImageFilename($item['item_id'], $item['name']);
     $relativePath = "images/equipment/{$subfolder}/{$filename}";
     $absolutePath = __DIR__ . "/../public/{$relativePath}";
     
@@ -96,7 +96,7 @@ foreach ($items as $index => $item) {
             chmod($absolutePath, 0644);
             
             // Update database
-            $updateQuery = "UPDATE items SET image_url = ? WHERE item_id = ?";
+            $updateQuery = "UPDATE items SET image_url = ?, image_variants = NULL WHERE item_id = ?";
             $updateStmt = $conn->prepare($updateQuery);
             $updateStmt->execute([$relativePath, $item['item_id']]);
             
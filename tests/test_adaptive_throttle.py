@@ -0,0 +1,134 @@
+"""Tests for the AIMD rate/concurrency controller and how retries feed it."""
+import json
+
+import pytest
+
+from equipment_images import api
+from equipment_images.api import AdaptiveThrottle, RetryableError
+from equipment_images.config import LATENCY_TARGET, MAX_RATE, MIN_RATE, RATE_DECREASE, RATE_INCREASE
+
+
+@pytest.fixture(autouse=True)
+def state_file(tmp_path, monkeypatch):
+    """Keep learned state out of the real cache directory."""
+    path = tmp_path / 'throttle.json'
+    monkeypatch.setattr(api, 'THROTTLE_STATE_FILE', path)
+    return path
+
+
+def take(throttle: AdaptiveThrottle, count: int = 1):
+    """Occupy slots as acquire() would, without waiting for rate tokens."""
+    with throttle.condition:
+        throttle.in_flight += count
+        throttle.requests += count
+
+
+def test_fast_successes_raise_rate_and_concurrency():
+    throttle = AdaptiveThrottle(1.0, max_concurrency=8)
+    throttle.concurrency = 2
+    for _ in range(2):
+        take(throttle)
+        throttle.record_success(0.1)
+
+    assert throttle.rate == pytest.approx(1.0 + 2 * RATE_INCREASE)
+    assert throttle.concurrency == 3  # one more slot after a round of `concurrency` successes
+    assert throttle.in_flight == 0
+
+
+def test_increase_is_bounded():
+    throttle = AdaptiveThrottle(MAX_RATE, max_concurrency=3)
+    for _ in range(50):
+        take(throttle)
+        throttle.record_success(0.1)
+
+    assert throttle.rate == MAX_RATE
+    assert throttle.concurrency == 3
+
+
+def test_slow_responses_hold_the_rate():
+    throttle = AdaptiveThrottle(1.0, max_concurrency=4)
+    throttle.concurrency = 1
+    take(throttle)
+    throttle.record_success(LATENCY_TARGET + 1)
+
+    assert throttle.rate == 1.0
+    assert throttle.concurrency == 1
+
+
+def test_throttle_response_halves_rate_and_concurrency():
+    throttle = AdaptiveThrottle(2.0, max_concurrency=8)
+    take(throttle)
+    throttle.record_throttled()
+
+    assert throttle.rate == pytest.approx(2.0 * RATE_DECREASE)
+    assert throttle.concurrency == int(8 * RATE_DECREASE)
+    assert throttle.throttled == 1
+    assert throttle.in_flight == 0
+
+
+def test_decrease_is_bounded():
+    throttle = AdaptiveThrottle(MIN_RATE * 1.5, max_concurrency=4)
+    for _ in range(10):
+        take(throttle)
+        throttle.record_throttled()
+
+    assert throttle.rate == MIN_RATE
+    assert throttle.concurrency == 1
+
+
+def test_retry_after_pauses_every_worker():
+    throttle = AdaptiveThrottle(1.0, max_concurrency=2)
+    take(throttle)
+    throttle.record_throttled(retry_after=30)
+    assert throttle.paused_until - api.time.monotonic() == pytest.approx(30, abs=1)
+
+
+def test_initial_rate_is_clamped():
+    assert AdaptiveThrottle(MAX_RATE * 10, 1).rate == MAX_RATE
+    assert AdaptiveThrottle(0, 1).rate == MIN_RATE
+
+
+def test_learned_values_are_saved_and_reused(state_file):
+    throttle = AdaptiveThrottle(1.0, max_concurrency=8)
+    take(throttle)
+    throttle.record_throttled()
+    throttle.save()
+
+    saved = json.loads(state_file.read_text())
+    assert saved['rate'] == pytest.approx(RATE_DECREASE)
+    assert saved['concurrency'] == 4
+    assert api.initial_rate(None) == pytest.approx(RATE_DECREASE)
+    assert AdaptiveThrottle(1.0, max_concurrency=8).concurrency == 4
+
+
+def test_run_without_requests_keeps_the_learned_state(state_file):
+    state_file.write_text(json.dumps({'rate': 0.7, 'concurrency': 3}))
+    AdaptiveThrottle(1.0, max_concurrency=8).save()
+    assert json.loads(state_file.read_text()) == {'rate': 0.7, 'concurrency': 3}
+
+
+@pytest.mark.parametrize('error, throttled', [
+    (RetryableError("HTTP 429", status=429), True),
+    (RetryableError("HTTP 503", status=503), True),
+    (RetryableError("HTTP 500", retry_after=0, status=500), True),
+    (RetryableError("HTTP 502", status=502), False),
+    (RetryableError("Connection reset by peer"), False),
+])
+def test_only_throttle_signals_back_off(monkeypatch, error, throttled):
+    attempts = []
+
+    def post(payload, api_key, filepaths):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise error
+
+    monkeypatch.setattr(api, 'post_image_request', post)
+    monkeypatch.setattr(api, 'BACKOFF_BASE', 0)
+    throttle = AdaptiveThrottle(MAX_RATE, max_concurrency=4)
+
+    api.request_with_retry({}, 'key', [], limiter=throttle)
+
+    assert len(attempts) == 2
+    assert throttle.throttled == (1 if throttled else 0)
+    assert throttle.concurrency == (2 if throttled else 4)
+    assert throttle.in_flight == 0
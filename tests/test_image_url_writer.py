@@ -0,0 +1,102 @@
+"""Tests for the batched image_url writer, against the benchmark's SQLite shim."""
+import sqlite3
+import time
+
+import pytest
+
+from equipment_images import db
+from benchmark_equipment_images import ITEMS_SCHEMA, SQLiteConnection
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """Ten items with stale image_variants, installed as the run's connection."""
+    path = tmp_path / 'catalog.db'
+    conn = sqlite3.connect(str(path))
+    conn.execute(ITEMS_SCHEMA)
+    conn.executemany("INSERT INTO items (item_id, name, image_variants) VALUES (?, ?, '{}')",
+                     [(item_id, f"Item {item_id}") for item_id in range(1, 11)])
+    conn.commit()
+    conn.close()
+
+    shim = SQLiteConnection(path, db.mysql.connector.Error)
+    monkeypatch.setattr(db, '_db_connection', shim)
+    yield path
+    shim.close()
+
+
+def committed(path):
+    """Rows as another connection sees them: only what was committed."""
+    conn = sqlite3.connect(str(path))
+    rows = conn.execute("SELECT item_id, image_url, image_variants FROM items "
+                        "WHERE image_url IS NOT NULL ORDER BY item_id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_updates_are_committed_a_full_batch_at_a_time(catalog):
+    batches = []
+    writer = db.ImageUrlWriter(batch_size=3, flush_interval=float('inf'), on_commit=batches.append)
+
+    writer.add(1, '/images/a.png')
+    writer.add(2, '/images/b.png')
+    assert committed(catalog) == []
+
+    writer.add(3, '/images/c.png')
+    assert [row[:2] for row in committed(catalog)] == [(1, '/images/a.png'), (2, '/images/b.png'),
+                                                       (3, '/images/c.png')]
+    assert batches == [[(1, '/images/a.png'), (2, '/images/b.png'), (3, '/images/c.png')]]
+    assert writer.written == 3 and writer.pending == []
+
+
+def test_partial_batch_is_committed_on_exit(catalog):
+    with db.ImageUrlWriter(batch_size=10, flush_interval=float('inf')) as writer:
+        writer.add(4, '/images/d.png')
+    assert [row[:2] for row in committed(catalog)] == [(4, '/images/d.png')]
+
+
+def test_stale_partial_batch_is_committed_without_another_add(catalog):
+    writer = db.ImageUrlWriter(batch_size=10, flush_interval=0.05)
+    writer.last_flush = time.monotonic()
+    writer.add(5, '/images/e.png')
+    assert 0 < writer.seconds_until_stale() <= 0.05
+
+    writer.flush_if_stale()
+    assert committed(catalog) == []
+
+    time.sleep(0.06)
+    assert writer.seconds_until_stale() == 0
+    writer.flush_if_stale()
+    assert [row[:2] for row in committed(catalog)] == [(5, '/images/e.png')]
+    assert writer.seconds_until_stale() is None
+
+
+def test_writing_image_url_clears_image_variants(catalog):
+    with db.ImageUrlWriter() as writer:
+        writer.add(6, '/images/f.png')
+    assert committed(catalog) == [(6, '/images/f.png', None)]
+
+    with db.ImageUrlWriter(column='image_variants') as writer:
+        writer.add(6, '{"64": {}}')
+    assert committed(catalog) == [(6, '/images/f.png', '{"64": {}}')]
+
+
+def test_failed_batch_is_counted_and_not_reported_committed(catalog):
+    batches = []
+    writer = db.ImageUrlWriter(batch_size=10, on_commit=batches.append, column='no_such_column')
+
+    writer.add(7, '/images/g.png')
+    writer.add(8, '/images/h.png')
+    assert writer.flush() is False
+
+    assert writer.failed == 2 and writer.written == 0
+    assert writer.pending == []  # dropped, not retried with the next batch
+    assert batches == []
+
+
+
+def test_file_only_sources_are_counted_without_a_query(catalog):
+    with db.ImageUrlWriter(table=None) as writer:
+        writer.add(9, '/images/terrain/hills.png')
+    assert writer.written == 1
+    assert committed(catalog) == []
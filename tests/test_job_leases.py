@@ -0,0 +1,134 @@
+"""Tests for worker-mode job claims, lease expiry and completion."""
+import re
+import sqlite3
+
+import pytest
+
+from equipment_images import db
+from equipment_images import jobs as job_queue
+from benchmark_equipment_images import SQLiteConnection, SQLiteCursor
+
+JOBS_SCHEMA = """
+    CREATE TABLE item_image_jobs (
+        item_id INTEGER PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pending',
+        priority REAL NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        leased_by TEXT,
+        lease_expires_at TEXT,
+        last_error TEXT
+    )
+"""
+
+
+def sqlite_dialect(query: str) -> str:
+    """Rewrite the MySQL-only parts of the job queries for SQLite."""
+    query = re.sub(r"NOW\(\) \+ INTERVAL %s SECOND", "datetime('now', '+' || %s || ' seconds')", query)
+    query = query.replace("NOW()", "datetime('now')")
+    # SQLite serialises writers, so there is nothing to skip
+    query = query.replace("FOR UPDATE SKIP LOCKED", "")
+    return query.replace("IF(", "IIF(").replace("GREATEST(", "MAX(")
+
+
+class JobCursor(SQLiteCursor):
+    def execute(self, query: str, params=()):
+        super().execute(sqlite_dialect(query), params)
+
+
+class JobConnection(SQLiteConnection):
+    def cursor(self, dictionary: bool = False):
+        return JobCursor(self, dictionary)
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    """A job table installed as the run's connection; returns a direct connection to it."""
+    path = tmp_path / 'jobs.db'
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    conn.execute(JOBS_SCHEMA)
+
+    shim = JobConnection(path, db.mysql.connector.Error)
+    monkeypatch.setattr(db, '_db_connection', shim)
+    yield conn
+    shim.close()
+    conn.close()
+
+
+def add_jobs(conn, *rows):
+    """rows: (item_id, priority[, status, leased_by, lease expiry in seconds from now, attempts])."""
+    defaults = (None, 0.0, 'pending', None, None, 0)
+    for row in rows:
+        item_id, priority, status, leased_by, lease_seconds, attempts = tuple(row) + defaults[len(row):]
+        conn.execute("INSERT INTO item_image_jobs (item_id, priority, status, leased_by, lease_expires_at, attempts) "
+                     "VALUES (?, ?, ?, ?, CASE WHEN ? IS NULL THEN NULL "
+                     "ELSE datetime('now', ? || ' seconds') END, ?)",
+                     (item_id, priority, status, leased_by, lease_seconds, lease_seconds, attempts))
+
+
+def job(conn, item_id):
+    return conn.execute("SELECT status, leased_by, attempts, lease_expires_at > datetime('now') "
+                        "FROM item_image_jobs WHERE item_id = ?", (item_id,)).fetchone()
+
+
+def test_claims_highest_priority_first_up_to_the_limit(jobs):
+    add_jobs(jobs, (1, 1.0), (2, 5.0), (3, 3.0), (4, 5.0))
+
+    assert job_queue.claim_jobs('host:1', 3) == [2, 4, 3]
+    assert job(jobs, 2) == ('leased', 'host:1', 1, 1)
+    assert job(jobs, 1) == ('pending', None, 0, None)
+    assert job_queue.claim_jobs('host:2', 3) == [1]
+    assert job_queue.claim_jobs('host:2', 3) == []
+
+
+def test_live_leases_are_skipped_and_expired_ones_taken_over(jobs):
+    add_jobs(jobs,
+             (1, 9.0, 'leased', 'live:1', 300, 1),
+             (2, 8.0, 'leased', 'crashed:1', -10, 1),
+             (3, 7.0, 'done'),
+             (4, 6.0, 'failed', None, None, 3),
+             (5, 1.0))
+
+    assert job_queue.claim_jobs('host:1', 10) == [2, 5]
+    assert job(jobs, 1) == ('leased', 'live:1', 1, 1)
+    assert job(jobs, 2) == ('leased', 'host:1', 2, 1)  # the crashed worker's attempt still counts
+
+
+def test_failed_jobs_are_retried_until_max_attempts(jobs, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_MAX_ATTEMPTS', 2)
+    add_jobs(jobs, (1, 1.0))
+
+    assert job_queue.claim_jobs('host:1', 1) == [1]
+    job_queue.finish_jobs('host:1', [1], 'failed', "HTTP 500")
+    assert job(jobs, 1) == ('pending', None, 1, None)
+
+    assert job_queue.claim_jobs('host:1', 1) == [1]
+    job_queue.finish_jobs('host:1', [1], 'failed', "HTTP 500")
+    assert job(jobs, 1) == ('failed', None, 2, None)
+    assert job_queue.claim_jobs('host:1', 1) == []
+
+
+def test_handed_back_jobs_do_not_count_an_attempt(jobs):
+    add_jobs(jobs, (1, 1.0), (2, 1.0))
+    job_queue.claim_jobs('host:1', 2)
+
+    job_queue.finish_jobs('host:1', [1], 'pending')
+    job_queue.finish_jobs('host:1', [2], 'done')
+
+    assert job(jobs, 1) == ('pending', None, 0, None)
+    assert job(jobs, 2) == ('done', None, 1, None)
+
+
+def test_jobs_taken_over_by_another_worker_are_left_alone(jobs):
+    add_jobs(jobs, (1, 1.0, 'leased', 'slow:1', -10, 1))
+    assert job_queue.claim_jobs('host:1', 1) == [1]
+
+    job_queue.finish_jobs('slow:1', [1], 'done')  # the stalled worker finishes late
+    assert job(jobs, 1) == ('leased', 'host:1', 2, 1)
+
+
+def test_open_jobs_exclude_the_workers_own_leases(jobs):
+    add_jobs(jobs, (1, 1.0), (2, 1.0), (3, 1.0, 'leased', 'other:1', 300, 1), (4, 1.0, 'done'))
+    job_queue.claim_jobs('host:1', 1)
+
+    assert job_queue.count_open_jobs() == 3
+    assert job_queue.count_open_jobs('host:1') == 2
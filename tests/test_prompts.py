@@ -0,0 +1,66 @@
+"""Regression tests for PromptCompiler against the old generate_prompt() cascade."""
+import json
+from pathlib import Path
+
+import pytest
+
+from equipment_images.prompts import PromptCompiler, PROMPT_RULES, compile_prompts, generate_prompt
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Prompts the elif cascade produced for items_api.json, keyed by item_id
+BASELINE = json.loads((ROOT / 'tests' / 'fixtures' / 'equipment_prompts.json').read_text(encoding='utf-8'))
+
+# Items the rule table deliberately fixed, with a phrase their prompt must now contain
+CHANGED = {
+    8: 'mechanical crossbow',   # Crossbow, was the bow prompt
+    28: 'mechanical crossbow',  # Heavy Crossbow
+    29: 'mechanical crossbow',  # Light Crossbow
+    53: 'holy water vial',      # Holy Water (weapon), was the generic weapon prompt
+    55: 'oil flask',            # Oil, Burning (weapon)
+    79: 'holy water vial',      # Holy Water (gear), was the holy symbol prompt
+}
+
+
+def load_items():
+    return json.loads((ROOT / 'items_api.json').read_text(encoding='utf-8'))['data']['items']
+
+
+ITEMS = load_items()
+
+
+def test_baseline_covers_catalog():
+    assert set(BASELINE) == {str(item['item_id']) for item in ITEMS}
+
+
+@pytest.mark.parametrize('item', ITEMS, ids=lambda item: f"{item['item_id']}-{item['name']}")
+def test_prompt_matches_baseline(item):
+    prompt = generate_prompt(item)
+    baseline = BASELINE[str(item['item_id'])]
+    if item['item_id'] in CHANGED:
+        assert prompt != baseline
+        assert CHANGED[item['item_id']] in prompt
+    else:
+        assert prompt == baseline
+
+
+def test_compile_prompts_matches_generate_prompt():
+    assert compile_prompts(ITEMS) == [generate_prompt(item) for item in ITEMS]
+
+
+def test_missing_description():
+    item = dict(ITEMS[0], description=None)
+    assert 'None' not in generate_prompt(item)
+
+
+def test_unknown_template_field():
+    with pytest.raises(ValueError, match='material'):
+        PromptCompiler([{'item_type': 'weapon', 'template': '{base} {material}'}])
+
+
+def test_longest_keyword_wins():
+    compiler = PromptCompiler(PROMPT_RULES)
+    crossbow = {'name': 'Crossbow', 'item_type': 'weapon', 'description': ''}
+    bow = {'name': 'Short Bow', 'item_type': 'weapon', 'description': ''}
+    assert 'crossbow' in compiler.compile(crossbow)
+    assert 'crossbow' not in compiler.compile(bow)
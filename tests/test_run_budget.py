@@ -0,0 +1,72 @@
+"""Tests for per-run request and time budgets."""
+import time
+
+import pytest
+
+from equipment_images import api
+from equipment_images.api import BudgetExhausted, RunBudget
+
+
+def test_request_budget_allows_exactly_max_requests():
+    budget = RunBudget(max_requests=3)
+    assert [budget.take() for _ in range(5)] == [True, True, True, False, False]
+    assert budget.requests == 3
+    assert budget.exhausted
+
+
+def test_unlimited_budget_is_never_exhausted():
+    budget = RunBudget()
+    assert all(budget.take() for _ in range(1000))
+    assert not budget.exhausted
+
+
+def test_time_budget_runs_out():
+    budget = RunBudget(time_budget=0.05)
+    assert budget.take()
+    time.sleep(0.06)
+    assert budget.exhausted
+    assert not budget.take()
+
+
+class CountingLimiter:
+    """Records whether a request waited for a rate token."""
+
+    def __init__(self):
+        self.acquired = 0
+        self.released = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+    def release(self):
+        self.released += 1
+
+    def record_success(self, latency: float):
+        self.released += 1
+
+
+def test_retries_are_charged_to_the_budget(monkeypatch):
+    calls = []
+
+    def post(payload, api_key, filepaths):
+        calls.append(payload)
+        raise api.RetryableError("Connection reset by peer")
+
+    monkeypatch.setattr(api, 'post_image_request', post)
+    monkeypatch.setattr(api, 'BACKOFF_BASE', 0)
+    limiter = CountingLimiter()
+
+    with pytest.raises(BudgetExhausted):
+        api.request_with_retry({}, 'key', [], limiter=limiter, budget=RunBudget(max_requests=2))
+    assert len(calls) == 2
+    assert limiter.acquired == limiter.released == 2
+
+
+def test_spent_budget_fails_fast_without_waiting_for_a_token(monkeypatch):
+    monkeypatch.setattr(api, 'post_image_request', pytest.fail)
+    budget = RunBudget(max_requests=0)
+    limiter = CountingLimiter()
+
+    with pytest.raises(BudgetExhausted):
+        api.request_with_retry({}, 'key', [], limiter=limiter, budget=budget)
+    assert limiter.acquired == 0
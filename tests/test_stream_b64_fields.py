@@ -0,0 +1,151 @@
+"""Tests for the streamed b64_json decoder used on API responses."""
+import base64
+import io
+import os
+import random
+
+import pytest
+
+from equipment_images.api import stream_b64_fields
+
+
+def b64_field(data: bytes, escape_slashes: bool = False) -> bytes:
+    """JSON-encode data as base64, optionally escaping '/' as PHP does."""
+    value = base64.b64encode(data)
+    if escape_slashes:
+        value = value.replace(b'/', b'\\/')
+    return b'"' + value + b'"'
+
+
+def response_body(images, escape_slashes: bool = False) -> bytes:
+    """Build a Together-style response by hand, so escapes stay as written."""
+    entries = b','.join(b'{"index":%d,"b64_json":%s}' % (index, b64_field(data, escape_slashes))
+                        for index, data in enumerate(images))
+    return (b'{"id":"abc","model":"flux","object":"list","response_format":"b64_json",'
+            b'"data":[' + entries + b']}')
+
+
+def random_chunks(body: bytes, seed: int):
+    """Split body at random points, including 1-byte and empty chunks."""
+    rng = random.Random(seed)
+    position = 0
+    while position < len(body):
+        size = rng.choice([0, 1, 2, 3, rng.randint(1, 64), rng.randint(1, 4096)])
+        yield body[position:position + size]
+        position += size
+
+
+def decode(chunks, count: int = 1):
+    outs = [io.BytesIO() for _ in range(count)]
+    written = stream_b64_fields(chunks, outs)
+    return [out.getvalue() for out in outs], written
+
+
+@pytest.fixture
+def images():
+    rng = random.Random(0)
+    # Sizes not divisible by 3 leave base64 padding at the end of the field
+    return [bytes(rng.getrandbits(8) for _ in range(size)) for size in (5000, 1, 2, 20001)]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_chunk_splits(images, seed):
+    body = response_body(images[:1])
+    decoded, written = decode(random_chunks(body, seed))
+    assert decoded == images[:1]
+    assert written == [len(images[0])]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_escaped_slashes(images, seed):
+    body = response_body(images[:1], escape_slashes=True)
+    assert b'\\/' in body
+    decoded, _ = decode(random_chunks(body, seed))
+    assert decoded == images[:1]
+
+
+def test_escape_split_across_chunks():
+    data = b'\xff' * 30  # encodes to '/' characters only
+    body = response_body([data], escape_slashes=True)
+    cut = body.index(b'\\/') + 1
+    decoded, _ = decode([body[:cut], body[cut:]])
+    assert decoded == [data]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_multiple_images(images, seed):
+    body = response_body(images, escape_slashes=seed % 2 == 1)
+    decoded, written = decode(random_chunks(body, seed), count=len(images))
+    assert decoded == images
+    assert written == [len(image) for image in images]
+
+
+def test_fewer_images_than_outputs(images):
+    decoded, written = decode([response_body(images[:2])], count=3)
+    assert decoded == images[:2] + [b'']
+    assert written == [len(images[0]), len(images[1]), 0]
+
+
+def test_extra_images_are_ignored(images):
+    decoded, _ = decode([response_body(images)], count=1)
+    assert decoded == images[:1]
+
+
+def test_whitespace_around_colon():
+    data = os.urandom(100)
+    body = b'{"data": [{"b64_json" :\n  ' + b64_field(data) + b'}]}'
+    decoded, _ = decode(random_chunks(body, 1))
+    assert decoded == [data]
+
+
+def test_field_name_as_value_is_not_a_key():
+    data = os.urandom(100)
+    body = b'{"response_format":"b64_json","data":[{"b64_json":' + b64_field(data) + b'}]}'
+    decoded, _ = decode([body])
+    assert decoded == [data]
+
+
+def test_chunks_are_consumed_after_last_field(images):
+    body = response_body(images[:1]) + b' ' * 1000
+    chunks = iter(random_chunks(body, 3))
+    decode(chunks)
+    assert next(chunks, None) is None
+
+
+@pytest.mark.parametrize('cut', ['before_value', 'inside_value', 'after_key'])
+def test_truncated_body(images, cut):
+    body = response_body(images[:1])
+    value_start = body.index(b'"b64_json":') + len(b'"b64_json":')
+    end = {
+        'after_key': value_start - 1,
+        'before_value': value_start,
+        'inside_value': value_start + 1 + 400,  # whole base64 groups, no closing quote
+    }[cut]
+    with pytest.raises(ValueError, match='ended inside'):
+        decode(random_chunks(body[:end], 7))
+
+
+def test_truncated_second_image(images):
+    body = response_body([images[0], images[3]])
+    with pytest.raises(ValueError, match='ended inside'):
+        decode(random_chunks(body[:body.rindex(b'"b64_json":') + 400], 5), count=2)
+
+
+def test_truncated_base64_group():
+    with pytest.raises(ValueError, match='truncated base64'):
+        decode([b'{"data":[{"b64_json":"QUJDRA"}]}'])
+
+
+def test_no_field():
+    with pytest.raises(ValueError, match='No "b64_json" data'):
+        decode([b'{"error":{"message":"rate limited"}}'])
+
+
+def test_empty_body():
+    with pytest.raises(ValueError, match='No "b64_json" data'):
+        decode([])
+
+
+def test_value_not_a_string():
+    with pytest.raises(ValueError, match='not a string'):
+        decode([b'{"data":[{"b64_json":null}]}'])
@@ -0,0 +1,93 @@
+"""Tests for the token bucket that paces API requests across workers."""
+import threading
+
+import pytest
+
+from equipment_images.api import TokenBucket
+
+
+class FakeClock:
+    """A monotonic clock that only moves when the bucket sleeps (or a test advances it)."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_first_request_is_not_delayed(clock):
+    bucket = TokenBucket(0.5, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_requests_are_paced_at_the_rate(clock):
+    bucket = TokenBucket(0.5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.acquire()
+    # One token up front, then one every 1 / rate seconds
+    assert sum(clock.sleeps) == pytest.approx(8.0)
+    assert all(seconds == pytest.approx(2.0) for seconds in clock.sleeps)
+
+
+def test_idle_time_counts_towards_the_interval(clock):
+    bucket = TokenBucket(0.5, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    clock.now += 1.5  # e.g. waiting on the previous response
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_burst_is_capped_at_capacity(clock):
+    bucket = TokenBucket(1.0, capacity=3, clock=clock, sleep=clock.sleep)
+    clock.now += 60  # a long idle period must not bank 60 tokens
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_rate_change_applies_to_the_next_wait(clock):
+    bucket = TokenBucket(1.0, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.rate = 4.0
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.25)]
+
+
+def test_concurrent_workers_share_the_rate():
+    # Real clock: 40 requests at 200/s from 8 threads take at least 39 intervals
+    bucket = TokenBucket(200.0)
+    started = threading.Event()
+    times = []
+    lock = threading.Lock()
+
+    def worker():
+        started.wait()
+        for _ in range(5):
+            bucket.acquire()
+            with lock:
+                times.append(bucket.clock())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    begin = bucket.clock()
+    started.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(times) == 40
+    assert max(times) - begin >= 39 / 200 * 0.9
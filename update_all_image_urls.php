@@ -21,7 +21,7 @@ $updates = [
     ['item_id' => 44, 'image_url' => '/images/equipment/weapons/equipment_44_poleaxe.png'],
 ];
 
-$stmt = $db->prepare("UPDATE items SET image_url = ? WHERE item_id = ?");
+$stmt = $db->prepare("UPDATE items SET image_url = ?, image_variants = NULL WHERE item_id = ?");
 
 $successCount = 0;
 $errorCount = 0;
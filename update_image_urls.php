@@ -20,7 +20,7 @@ $updates = [
     ['item_id' => 44, 'image_url' => '/images/equipment/weapons/equipment_44_poleaxe.png'],
 ];
 
-$stmt = $db->prepare("UPDATE items SET image_url = ? WHERE item_id = ?");
+$stmt = $db->prepare("UPDATE items SET image_url = ?, image_variants = NULL WHERE item_id = ?");
 
 foreach ($updates as $update) {
     $stmt->execute([$update['image_url'], $update['item_id']]);